@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from typing import Optional, Tuple
+from processor.preprocessing import haversine_distance
+from storage.rollups import animal_ids
+
+METERS_PER_DEGREE = 111_195.0
+# Neighbour cells still to visit from a cell; (0, 0) is handled separately, the rest are the other half of the 3x3 block
+_HALF_NEIGHBOURS = [(1, -1), (1, 0), (1, 1), (0, 1)]
+
+
+def _expand(starts: np.ndarray, ends: np.ndarray):
+    """All (i, j) with starts[i] <= j < ends[i], without a Python loop."""
+    counts = np.maximum(ends - starts, 0)
+    i = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.cumsum(counts) - counts
+    j = np.arange(counts.sum()) - np.repeat(offsets, counts) + np.repeat(starts, counts)
+    return i, j
+
+
+def align_fixes(df: pd.DataFrame, window: float) -> pd.DataFrame:
+    """Last fix of every animal in each `window`-second bucket."""
+    aligned = pd.DataFrame({
+        'animal_id': animal_ids(df).to_numpy(),
+        'species': df['species'].astype(str).to_numpy() if 'species' in df else 'unknown',
+        'timestamp': df['timestamp'].to_numpy(dtype=np.float64),
+        'latitude': df['latitude'].to_numpy(dtype=np.float64),
+        'longitude': df['longitude'].to_numpy(dtype=np.float64),
+    }).dropna(subset=['timestamp', 'latitude', 'longitude'])
+    aligned['bucket'] = np.floor(aligned['timestamp'].to_numpy() / window).astype(np.int64)
+    aligned = aligned.sort_values(['bucket', 'animal_id', 'timestamp'], kind='stable')
+    return aligned.drop_duplicates(['bucket', 'animal_id'], keep='last').reset_index(drop=True)
+
+
+def find_encounters(df: pd.DataFrame, distance: float = 50.0, window: float = 60.0,
+                    species: Optional[Tuple[str, str]] = None, start: Optional[float] = None,
+                    end: Optional[float] = None) -> pd.DataFrame:
+    """Pairs of animals within `distance` meters in the same `window`-second bucket.
+
+    Fixes are time-aligned to one per animal and bucket, then hashed into
+    grid cells at least `distance` wide; only fixes in the same or adjacent
+    cells of the same bucket are compared, so the cost grows with the number
+    of close fixes rather than with N^2. `species` restricts the result to
+    one species pair, e.g. ('wolf', 'deer').
+    """
+    if start is not None:
+        df = df[df['timestamp'] >= start]
+    if end is not None:
+        df = df[df['timestamp'] <= end]
+    fixes = align_fixes(df, window)
+    if species is not None:
+        fixes = fixes[fixes['species'].isin(species)].reset_index(drop=True)
+    columns = ['bucket', 'animal_a', 'species_a', 'timestamp_a', 'animal_b', 'species_b', 'timestamp_b', 'distance_m']
+    if len(fixes) < 2:
+        return pd.DataFrame(columns=columns)
+    lat = fixes['latitude'].to_numpy()
+    lon = fixes['longitude'].to_numpy()
+    # Degree cells: longitude cells are sized for the highest latitude present, so they are never too narrow
+    cos_max = max(np.cos(np.deg2rad(min(np.abs(lat).max(), 89.0))), 1e-6)
+    iy = np.floor(lat / (distance / METERS_PER_DEGREE)).astype(np.int64)
+    ix = np.floor(lon / (distance / (METERS_PER_DEGREE * cos_max))).astype(np.int64)
+    iy -= iy.min() - 1
+    ix -= ix.min() - 1
+    ny = int(iy.max()) + 2
+    nx = int(ix.max()) + 2
+    bucket = pd.factorize(fixes['bucket'].to_numpy(), sort=True)[0].astype(np.int64)
+    if (int(bucket.max()) + 1) * nx * ny >= 2 ** 62:
+        raise ValueError("Time range too long for the spatial hash; narrow it or widen `window`")
+    key = (bucket * nx + ix) * ny + iy
+    order = np.argsort(key, kind='stable')
+    skey = key[order]
+    pairs_i, pairs_j = [], []
+    # Same cell: every later fix of the cell
+    cell_end = np.searchsorted(skey, skey, side='right')
+    i, j = _expand(np.arange(len(skey)) + 1, cell_end)
+    pairs_i.append(i)
+    pairs_j.append(j)
+    for dx, dy in _HALF_NEIGHBOURS:
+        target = skey + dx * ny + dy
+        i, j = _expand(np.searchsorted(skey, target, side='left'), np.searchsorted(skey, target, side='right'))
+        pairs_i.append(i)
+        pairs_j.append(j)
+    a = order[np.concatenate(pairs_i)]
+    b = order[np.concatenate(pairs_j)]
+    kinds = fixes['species'].to_numpy()
+    dist = haversine_distance(lat[a], lon[a], lat[b], lon[b])
+    close = dist <= distance
+    if species is not None and species[0] != species[1]:
+        close &= kinds[a] != kinds[b]
+    elif species is not None:
+        close &= kinds[a] == species[0]
+    a, b, dist = a[close], b[close], dist[close]
+    # Report each pair with the animals in a stable order
+    ids = fixes['animal_id'].to_numpy()
+    swap = ids[a] > ids[b]
+    a, b = np.where(swap, b, a), np.where(swap, a, b)
+    result = pd.DataFrame({
+        'bucket': fixes['bucket'].to_numpy()[a],
+        'animal_a': ids[a], 'species_a': kinds[a], 'timestamp_a': fixes['timestamp'].to_numpy()[a],
+        'animal_b': ids[b], 'species_b': kinds[b], 'timestamp_b': fixes['timestamp'].to_numpy()[b],
+        'distance_m': dist,
+    }, columns=columns)
+    return result.sort_values(['bucket', 'animal_a', 'animal_b']).reset_index(drop=True)
+
+
+def encounter_events(pairs: pd.DataFrame, max_skip: int = 1) -> pd.DataFrame:
+    """Merge per-bucket pairs into events; a pair apart for more than `max_skip` buckets starts a new event."""
+    columns = ['animal_a', 'species_a', 'animal_b', 'species_b', 'start', 'end', 'n_buckets', 'min_distance_m']
+    if pairs.empty:
+        return pd.DataFrame(columns=columns)
+    pairs = pairs.sort_values(['animal_a', 'animal_b', 'bucket'], kind='stable')
+    same_pair = (pairs['animal_a'].to_numpy()[1:] == pairs['animal_a'].to_numpy()[:-1]) & \
+                (pairs['animal_b'].to_numpy()[1:] == pairs['animal_b'].to_numpy()[:-1])
+    near = np.diff(pairs['bucket'].to_numpy()) <= max_skip + 1
+    event = np.cumsum(np.append(True, ~(same_pair & near)))
+    grouped = pairs.assign(event=event, time=np.minimum(pairs['timestamp_a'], pairs['timestamp_b'])).groupby('event', sort=False)
+    events = grouped.agg(animal_a=('animal_a', 'first'), species_a=('species_a', 'first'),
+                         animal_b=('animal_b', 'first'), species_b=('species_b', 'first'),
+                         start=('time', 'min'), end=('time', 'max'), n_buckets=('bucket', 'size'),
+                         min_distance_m=('distance_m', 'min'))
+    return events.sort_values('start').reset_index(drop=True)[columns]
@@ -0,0 +1,132 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Sequence
+from storage.rollups import animal_ids
+
+EARTH_RADIUS = 6371000.0  # meters
+# Isopleth levels reported by default: core area and home range
+KDE_LEVELS = (0.5, 0.95)
+GRID_SIZE = 256
+ANALYTICS_WORKERS = int(os.environ.get("WMP_ANALYTICS_WORKERS", os.cpu_count() or 1))
+
+
+def project(lat: np.ndarray, lon: np.ndarray, lat0: Optional[float] = None, lon0: Optional[float] = None):
+    """Equirectangular projection to meters around (lat0, lon0); accurate over home-range scales."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    lat0 = float(np.mean(lat)) if lat0 is None else lat0
+    lon0 = float(np.mean(lon)) if lon0 is None else lon0
+    x = np.deg2rad(lon - lon0) * EARTH_RADIUS * np.cos(np.deg2rad(lat0))
+    y = np.deg2rad(lat - lat0) * EARTH_RADIUS
+    return x, y, lat0, lon0
+
+
+def unproject(x: np.ndarray, y: np.ndarray, lat0: float, lon0: float):
+    lat = lat0 + np.rad2deg(np.asarray(y) / EARTH_RADIUS)
+    lon = lon0 + np.rad2deg(np.asarray(x) / (EARTH_RADIUS * np.cos(np.deg2rad(lat0))))
+    return lat, lon
+
+
+def reference_bandwidth(x: np.ndarray, y: np.ndarray) -> float:
+    """Worton's reference bandwidth h_ref = sigma * n^(-1/6) for a bivariate normal kernel."""
+    sigma = np.sqrt((np.var(x, ddof=1) + np.var(y, ddof=1)) / 2) if len(x) > 1 else 0.0
+    return float(sigma * len(x) ** (-1 / 6)) if sigma > 0 else 1.0
+
+
+def kde_grid(x: np.ndarray, y: np.ndarray, bandwidth: Optional[float] = None, grid_size: int = GRID_SIZE) -> Dict:
+    """Gaussian KDE utilization distribution on a regular grid.
+
+    Fixes are binned once (O(n)) and the histogram is convolved with the
+    kernel by FFT, so cost depends on the grid, not on n^2 point pairs. The
+    grid extends 3 bandwidths past the fixes; `density` sums to 1.
+    """
+    from scipy.signal import fftconvolve
+    h = bandwidth or reference_bandwidth(x, y)
+    xmin, xmax = x.min() - 3 * h, x.max() + 3 * h
+    ymin, ymax = y.min() - 3 * h, y.max() + 3 * h
+    cell = max(xmax - xmin, ymax - ymin) / grid_size
+    nx = int(np.ceil((xmax - xmin) / cell))
+    ny = int(np.ceil((ymax - ymin) / cell))
+    ix = np.minimum(((x - xmin) / cell).astype(np.int64), nx - 1)
+    iy = np.minimum(((y - ymin) / cell).astype(np.int64), ny - 1)
+    hist = np.bincount(ix * ny + iy, minlength=nx * ny).reshape(nx, ny).astype(np.float64)
+    radius = max(1, int(np.ceil(3 * h / cell)))
+    offsets = np.arange(-radius, radius + 1) * cell
+    kernel_1d = np.exp(-0.5 * (offsets / h) ** 2)
+    density = fftconvolve(hist, np.outer(kernel_1d, kernel_1d), mode='same')
+    density = np.clip(density, 0, None)  # FFT round-off can leave tiny negatives
+    density /= density.sum()
+    return {'density': density, 'xmin': xmin, 'ymin': ymin, 'cell': cell, 'bandwidth': h}
+
+
+def isopleth_area(density: np.ndarray, cell: float, level: float) -> float:
+    """Area (m^2) of the smallest set of cells holding `level` of the utilization distribution."""
+    values = np.sort(density.ravel())[::-1]
+    cells = int(np.searchsorted(np.cumsum(values), level)) + 1
+    return min(cells, len(values)) * cell * cell
+
+
+def mcp(x: np.ndarray, y: np.ndarray, percent: float = 100.0):
+    """Minimum convex polygon (shapely) of the `percent` fixes closest to the centroid."""
+    import shapely
+    from scipy.spatial import ConvexHull, QhullError
+    points = np.column_stack([x, y])
+    if percent < 100 and len(points) > 3:
+        keep = max(3, int(np.ceil(len(points) * percent / 100)))
+        dist = np.hypot(x - x.mean(), y - y.mean())
+        points = points[np.argpartition(dist, keep - 1)[:keep]]
+    try:
+        # qhull reduces a million fixes to a few dozen vertices before shapely builds the polygon
+        return shapely.Polygon(points[ConvexHull(points).vertices])
+    except (QhullError, ValueError):
+        return shapely.MultiPoint(points).convex_hull  # fewer than 3 distinct or collinear fixes
+
+
+def home_range(lat: np.ndarray, lon: np.ndarray, levels: Sequence[float] = KDE_LEVELS, mcp_percent: float = 95.0,
+               grid_size: int = GRID_SIZE, bandwidth: Optional[float] = None) -> Dict:
+    """Home-range summary of one animal: MCP and KDE isopleth areas in km^2, MCP outline as WKT (lon lat)."""
+    import shapely
+    x, y, lat0, lon0 = project(lat, lon)
+    polygon = mcp(x, y, mcp_percent)
+    ud = kde_grid(x, y, bandwidth=bandwidth, grid_size=grid_size)
+    coords = np.asarray(polygon.exterior.coords) if polygon.geom_type == 'Polygon' else np.asarray(polygon.coords)
+    hull_lat, hull_lon = unproject(coords[:, 0], coords[:, 1], lat0, lon0)
+    outline = shapely.Polygon(np.column_stack([hull_lon, hull_lat])) if polygon.geom_type == 'Polygon' else None
+    result = {
+        'n_fixes': len(x),
+        f'mcp{mcp_percent:g}_km2': float(polygon.area / 1e6),
+        'bandwidth_m': float(ud['bandwidth']),
+        'cell_m': float(ud['cell']),
+    }
+    for level in levels:
+        result[f'kde{level * 100:g}_km2'] = float(isopleth_area(ud['density'], ud['cell'], level) / 1e6)
+    result['mcp_wkt'] = outline.wkt if outline is not None else None
+    return result
+
+
+def home_ranges(df: pd.DataFrame, levels: Sequence[float] = KDE_LEVELS, mcp_percent: float = 95.0,
+                grid_size: int = GRID_SIZE, workers: Optional[int] = None) -> pd.DataFrame:
+    """Per-animal home-range table from feature output (needs latitude/longitude).
+
+    Animals are independent, so they are computed on a thread pool; the heavy
+    steps (binning, FFT, qhull) run in NumPy/SciPy without the GIL.
+    """
+    df = df.dropna(subset=['latitude', 'longitude'])
+    ids = animal_ids(df)
+    groups = [(animal, idx) for animal, idx in ids.groupby(ids, sort=True).indices.items()]
+    lat = df['latitude'].to_numpy(dtype=np.float64)
+    lon = df['longitude'].to_numpy(dtype=np.float64)
+
+    def run(item):
+        animal, idx = item
+        return {'animal_id': animal, **home_range(lat[idx], lon[idx], levels, mcp_percent, grid_size)}
+
+    workers = min(workers or ANALYTICS_WORKERS, max(len(groups), 1))
+    if workers <= 1:
+        rows = [run(item) for item in groups]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wmp-homerange") as pool:
+            rows = list(pool.map(run, groups))
+    return pd.DataFrame(rows)
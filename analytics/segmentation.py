@@ -0,0 +1,159 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+from storage.rollups import animal_ids
+
+# Same labels as RuleBasedClassifier, ordered from slowest to fastest
+BEHAVIOR_STATES = ['resting', 'walking', 'running']
+# Long tracks are decoded as overlapping windows batched together (see decode)
+DECODE_CHUNK = 8192
+DECODE_OVERLAP = 512
+# Below this many samples a process pool costs more than it saves
+PARALLEL_MIN_ROWS = 200_000
+SEGMENT_WORKERS = int(os.environ.get("WMP_SEGMENT_WORKERS", os.cpu_count() or 1))
+
+
+def speed_log_probs(speed: np.ndarray, thresholds: Sequence[float] = (0.2, 1.0), softness: float = 0.25) -> np.ndarray:
+    """Soft version of the speed rules: (n, 3) log class probabilities for BEHAVIOR_STATES.
+
+    Memberships are logistic in log-speed around the rule thresholds, so a
+    sample near a threshold is ambiguous instead of flipping the label.
+    """
+    z = np.log(np.clip(np.nan_to_num(np.asarray(speed, dtype=np.float64)), 0, None) + 1e-3)
+    slow = 1 / (1 + np.exp((z - np.log(thresholds[0])) / softness))
+    fast = 1 / (1 + np.exp((np.log(thresholds[1]) - z) / softness))
+    proba = np.column_stack([slow, np.clip(1 - slow - fast, 0, None), fast]) + 1e-6
+    return np.log(proba / proba.sum(axis=1, keepdims=True))
+
+
+def transition_log_probs(n_states: int, stay: float = 0.99) -> np.ndarray:
+    """Sticky transition matrix: stay with probability `stay`, switch uniformly otherwise."""
+    trans = np.full((n_states, n_states), (1 - stay) / max(n_states - 1, 1))
+    np.fill_diagonal(trans, stay)
+    return np.log(trans)
+
+
+def viterbi_batch(log_emit: np.ndarray, log_trans: np.ndarray, lengths: Optional[np.ndarray] = None) -> np.ndarray:
+    """Most likely state paths of S sequences at once, in log space.
+
+    log_emit is (S, T, K); sequence s only uses its first lengths[s] steps.
+    Each time step is one vectorized update over all sequences and states,
+    so the Python loop runs T times regardless of S.
+    """
+    S, T, K = log_emit.shape
+    lengths = np.full(S, T) if lengths is None else np.asarray(lengths)
+    back = np.zeros((T, S, K), dtype=np.int8)
+    delta = log_emit[:, 0, :].copy()  # uniform start
+    rows = np.arange(K)
+    for t in range(1, T):
+        scores = delta[:, :, None] + log_trans  # (S, from, to)
+        best = scores.argmax(axis=1)
+        step = np.take_along_axis(scores, best[:, None, :], axis=1)[:, 0, :] + log_emit[:, t, :]
+        # Finished sequences keep their final scores
+        active = (t < lengths)[:, None]
+        delta = np.where(active, step, delta)
+        back[t] = np.where(active, best, rows)
+    paths = np.zeros((S, T), dtype=np.int8)
+    state = delta.argmax(axis=1)
+    seq = np.arange(S)
+    for t in range(T - 1, -1, -1):
+        paths[:, t] = state
+        state = back[t, seq, state]
+    return paths
+
+
+def decode(log_emit: np.ndarray, log_trans: np.ndarray, chunk: int = DECODE_CHUNK, overlap: int = DECODE_OVERLAP) -> np.ndarray:
+    """Viterbi path of one track.
+
+    Tracks longer than `chunk` are cut into windows that overlap by
+    `overlap` samples on each side and decoded as one batch; each window
+    keeps only its centre. Paths of a sticky HMM coalesce within a few
+    dozen samples, so with the default margin this matches a full-length
+    decode while the time loop runs chunk + 2 * overlap steps instead of n.
+    """
+    n = len(log_emit)
+    if n <= chunk + 2 * overlap:
+        return viterbi_batch(log_emit[None], log_trans)[0]
+    starts = np.arange(0, n, chunk)
+    lo = np.maximum(starts - overlap, 0)
+    hi = np.minimum(starts + chunk + overlap, n)
+    width = int((hi - lo).max())
+    windows = np.zeros((len(starts), width, log_emit.shape[1]))
+    for i, (a, b) in enumerate(zip(lo, hi)):
+        windows[i, :b - a] = log_emit[a:b]
+    paths = viterbi_batch(windows, log_trans, hi - lo)
+    out = np.empty(n, dtype=np.int8)
+    for i, (s, a) in enumerate(zip(starts, lo)):
+        end = min(s + chunk, n)
+        out[s:end] = paths[i, s - a:end - a]
+    return out
+
+
+def _decode_many(tracks: List[np.ndarray], log_trans: np.ndarray) -> List[np.ndarray]:
+    return [decode(track, log_trans) for track in tracks]
+
+
+def _runs(states: np.ndarray, breaks: np.ndarray):
+    """Start/end offsets of runs of equal state; `breaks` marks rows that always start a run."""
+    new = np.ones(len(states), dtype=bool)
+    new[1:] = (states[1:] != states[:-1]) | breaks[1:]
+    starts = np.flatnonzero(new)
+    return starts, np.append(starts[1:], len(states))
+
+
+def segment_behaviors(df: pd.DataFrame, log_proba: Optional[np.ndarray] = None, states: Sequence[str] = BEHAVIOR_STATES,
+                      stay: float = 0.99, workers: Optional[int] = None) -> pd.DataFrame:
+    """Smooth per-sample behavior probabilities into a per-animal segment table.
+
+    Uses the soft speed rules unless `log_proba` (n, len(states)) is given,
+    e.g. the log of a classifier's predict_proba. Each animal's track is
+    decoded with a sticky HMM; track gaps (segment_id) always end a segment.
+    Returns one row per segment: animal_id, behavior, moving, start, end,
+    n_samples, duration and mean_speed.
+    """
+    columns = ['animal_id', 'behavior', 'moving', 'start', 'end', 'n_samples', 'duration', 'mean_speed']
+    if len(df) == 0:
+        return pd.DataFrame(columns=columns)
+    if log_proba is None:
+        log_proba = speed_log_probs(df['speed'].to_numpy())
+    log_trans = transition_log_probs(len(states), stay)
+    ids = animal_ids(df)
+    ts = df['timestamp'].to_numpy(dtype=np.float64)
+    order = np.lexsort((ts, pd.factorize(ids)[0]))
+    ids_sorted = ids.to_numpy()[order]
+    bounds = np.flatnonzero(np.append(True, ids_sorted[1:] != ids_sorted[:-1]))
+    bounds = np.append(bounds, len(order))
+    tracks = [log_proba[order[a:b]] for a, b in zip(bounds[:-1], bounds[1:])]
+    workers = min(workers or SEGMENT_WORKERS, len(tracks))
+    if workers > 1 and len(df) >= PARALLEL_MIN_ROWS:
+        # Animals are independent; each worker decodes an interleaved share of them
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            shares = list(pool.map(_decode_many, [tracks[i::workers] for i in range(workers)], [log_trans] * workers))
+        paths = [None] * len(tracks)
+        for i, share in enumerate(shares):
+            paths[i::workers] = share
+    else:
+        paths = _decode_many(tracks, log_trans)
+    state = np.concatenate(paths) if paths else np.empty(0, dtype=np.int8)
+    breaks = np.zeros(len(order), dtype=bool)
+    breaks[bounds[:-1]] = True
+    if 'segment_id' in df:
+        seg = df['segment_id'].to_numpy()[order]
+        breaks[1:] |= seg[1:] != seg[:-1]
+    start, end = _runs(state, breaks)
+    t = ts[order]
+    speed = df['speed'].to_numpy(dtype=np.float64)[order] if 'speed' in df else np.full(len(order), np.nan)
+    counts = end - start
+    labels = np.asarray(states, dtype=object)[state[start]]
+    return pd.DataFrame({
+        'animal_id': ids_sorted[start],
+        'behavior': labels,
+        'moving': labels != states[0],
+        'start': t[start],
+        'end': t[end - 1],
+        'n_samples': counts,
+        'duration': t[end - 1] - t[start],
+        'mean_speed': np.add.reduceat(np.nan_to_num(speed), start) / counts,
+    }, columns=columns)
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, Request
+from typing import Callable, Dict, Optional
+
+
+class BoundedExecutor:
+    """Thread pool for blocking work called from async handlers.
+
+    At most `max_pending` calls may be queued or running; further requests are
+    rejected with 503 instead of piling up. Work that has not started yet is
+    cancelled when the client disconnects.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"wmp-{name}")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _call(self, submitted: float, func: Callable, args, kwargs):
+        started = time.perf_counter()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_seconds += started - submitted
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.run_seconds += time.perf_counter() - started
+
+    async def run(self, func: Callable, *args, request: Optional[Request] = None, **kwargs):
+        with self._lock:
+            if self.queued + self.running >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail=f"{self.name} executor is saturated, retry later")
+            self.queued += 1
+        future = self.pool.submit(self._call, time.perf_counter(), func, args, kwargs)
+        task = asyncio.wrap_future(future)
+        if request is None:
+            return await self._finish(task)
+        watcher = asyncio.ensure_future(self._wait_disconnect(request))
+        try:
+            done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watcher.cancel()
+        if task not in done:
+            # Client went away: drop the job if it is still queued, otherwise let it finish unobserved
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+            with self._lock:
+                self.cancelled += 1
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            raise HTTPException(status_code=499, detail="Client closed request")
+        return await self._finish(task)
+
+    async def _finish(self, task):
+        try:
+            result = await task
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        with self._lock:
+            self.completed += 1
+        return result
+
+    @staticmethod
+    async def _wait_disconnect(request: Request, interval: float = 0.1):
+        while not await request.is_disconnected():
+            await asyncio.sleep(interval)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+                "wait_seconds_total": round(self.wait_seconds, 6),
+                "run_seconds_total": round(self.run_seconds, 6),
+                "avg_run_seconds": round(self.run_seconds / finished, 6) if finished else 0.0,
+            }
+
+
+# Separate lanes so a slow history/plot job never delays live pollers
+live_executor = BoundedExecutor("live", int(os.environ.get("WMP_LIVE_WORKERS", 4)),
+                                int(os.environ.get("WMP_LIVE_PENDING", 64)))
+heavy_executor = BoundedExecutor("heavy", int(os.environ.get("WMP_HEAVY_WORKERS", 2)),
+                                 int(os.environ.get("WMP_HEAVY_PENDING", 8)))
+
+
+def executor_metrics() -> Dict:
+    return {e.name: e.snapshot() for e in (live_executor, heavy_executor)}
@@ -0,0 +1,148 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from fastapi import Depends, HTTPException, Request
+from typing import Callable, Dict, Hashable, Optional, Tuple
+from api.auth import get_current_user
+from api.executor import BoundedExecutor
+
+# Requests per second and burst size per role, in cost units: a cheap poll
+# costs 1, a full scan or classification costs more (see api.routes). The
+# buckets live in each worker process, so a user's total rate across a node
+# is at most the per-role rate times the worker count.
+ROLE_LIMITS = {"Admin": (50.0, 200.0), "Researcher": (20.0, 100.0), "Viewer": (5.0, 30.0)}
+MAX_USERS = 10_000
+
+
+def parse_limits(text: Optional[str]) -> Optional[Dict[str, Tuple[float, float]]]:
+    """'Viewer=5:30,Researcher=20:100' -> {role: (rate, burst)} over the defaults; 'off' disables limiting."""
+    if text is None or not text.strip():
+        return dict(ROLE_LIMITS)
+    if text.strip() == "off":
+        return None
+    limits = dict(ROLE_LIMITS)
+    for item in text.split(','):
+        if item.strip():
+            role, quota = item.split('=')
+            rate, burst = quota.split(':')
+            limits[role.strip()] = (float(rate), float(burst))
+    return limits
+
+
+class RateLimiter:
+    """Token buckets per user; each role sets the refill rate and the burst size."""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.limits = limits
+        self.clock = clock
+        self._buckets: Dict[str, list] = {}  # username -> [tokens, last refill]
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+
+    def acquire(self, username: str, role: str, cost: float = 1.0) -> float:
+        """Take `cost` tokens; returns 0 if allowed, else the seconds until enough tokens accrue."""
+        if self.limits is None or role not in self.limits:
+            return 0.0
+        rate, burst = self.limits[role]
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(username)
+            if bucket is None:
+                if len(self._buckets) >= MAX_USERS:
+                    # Buckets idle long enough to be full again carry no state
+                    self._buckets = {u: b for u, b in self._buckets.items() if b[0] + (now - b[1]) * rate < burst}
+                bucket = self._buckets[username] = [burst, now]
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                self.allowed += 1
+                return 0.0
+            self.throttled += 1
+            return (cost - bucket[0]) / rate if rate > 0 else math.inf
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"enabled": self.limits is not None, "users": len(self._buckets),
+                    "allowed": self.allowed, "throttled": self.throttled}
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one computation on an executor.
+
+    The first caller for a key starts the work; callers arriving while it is
+    in flight wait for the same result. Nothing is cached: once the call
+    finishes, the next request starts a fresh one. A caller that disconnects
+    stops waiting, and work that has not started is dropped once every
+    waiter has gone.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, "_Flight"] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, executor: BoundedExecutor, func: Callable, *args, request: Optional[Request] = None):
+        key = (getattr(func, '__qualname__', repr(func)), args)
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            # The executor sees the flight as its "request": it disconnects when no waiter is left
+            flight.task = asyncio.ensure_future(executor.run(func, *args, request=flight))
+            flight.task.add_done_callback(lambda _, key=key, flight=flight: self._done(key, flight))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        try:
+            if request is None:
+                return await asyncio.shield(flight.task)
+            waiter = asyncio.ensure_future(asyncio.shield(flight.task))
+            watcher = asyncio.ensure_future(BoundedExecutor._wait_disconnect(request))
+            try:
+                done, _ = await asyncio.wait({waiter, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                watcher.cancel()
+            if waiter not in done:
+                waiter.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request")
+            return waiter.result()
+        finally:
+            flight.waiters -= 1
+
+    def _done(self, key, flight: "_Flight"):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Nobody may be left to read the outcome
+        flight.task.cancelled() or flight.task.exception()
+
+    def snapshot(self) -> Dict:
+        return {"in_flight": len(self._flights), "started": self.started, "coalesced": self.coalesced}
+
+
+class _Flight:
+    def __init__(self):
+        self.task: Optional[asyncio.Future] = None
+        self.waiters = 0
+
+    async def is_disconnected(self) -> bool:
+        return self.waiters == 0
+
+
+rate_limiter = RateLimiter(parse_limits(os.environ.get("WMP_RATE_LIMITS")))
+single_flight = SingleFlight()
+
+
+def rate_limited(cost: float = 1.0):
+    """Dependency that authenticates the caller and charges `cost` to their bucket (429 when empty)."""
+    def check(user: Dict = Depends(get_current_user)) -> Dict:
+        wait = rate_limiter.acquire(user["username"], user["role"], cost)
+        if wait:
+            raise HTTPException(status_code=429, detail="Rate limit exceeded, retry later",
+                                headers={"Retry-After": str(max(1, math.ceil(wait)) if math.isfinite(wait) else 60)})
+        return user
+    return check
@@ -0,0 +1,16 @@
+import gc
+import os
+from fastapi import FastAPI
+from api.auth import router as auth_router
+from api.routes import router as api_router, preload
+
+app = FastAPI(title="Wildlife Movement Profiler API")
+app.include_router(auth_router, prefix="/api")
+app.include_router(api_router, prefix="/api")
+
+# With `gunicorn --preload` this module is imported once in the master before
+# workers fork, so warm state set up here is shared copy-on-write. gc.freeze()
+# keeps the collector from touching (and so copying) those pages in workers.
+if os.environ.get("WMP_PRELOAD") == "1":
+    preload()
+    gc.freeze()
@@ -1,84 +1,248 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from typing import Dict
 import pandas as pd
+import json
 import os
+import struct
 from simulator.generator import TelemetrySimulator
-from classifier.behavior_model import classify_behaviors, MLBehaviorClassifier
-from processor.preprocessing import preprocess
+from classifier.behavior_model import classify_behaviors, MLBehaviorClassifier, RuleBasedClassifier
+from classifier.batching import MicroBatcher
+from processor.preprocessing import ingest_data, preprocess, preprocess_by_animal
+from processor.cache import FeatureCache
+from storage.archive import TelemetryArchive, ARCHIVE_PATH
+from storage.rollups import RollupStore, ROLLUP_PATH
+from storage.shared import SharedDataset, SHARED_DATA
+from storage.codec import MEDIA_TYPE as TELEMETRY_CODEC, encode_frame, decode_frame
+from api.auth import require_role
+from api.executor import live_executor, heavy_executor, executor_metrics
+from api.limits import rate_limited, rate_limiter, single_flight
+from analytics.home_range import home_ranges
+from analytics.segmentation import segment_behaviors
+from analytics.encounters import find_encounters, encounter_events
 
-SECRET_KEY = "your-secret-key"
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
 router = APIRouter()
 
-# Dummy user for demo
-demo_user = {"username": "admin", "password": "password"}
-
-def create_access_token(data: dict, expires_delta: timedelta = None):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+# Rate-limit cost per request (api.limits): polls of recent rows and micro-batched
+# uploads are cheap, scans and model work are not
+LIGHT = 1.0
+HEAVY = 5.0
 
-def verify_token(token: str = Depends(oauth2_scheme)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username != demo_user["username"]:
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-        return username
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-@router.post("/token")
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    if form_data.username == demo_user["username"] and form_data.password == demo_user["password"]:
-        access_token = create_access_token(data={"sub": demo_user["username"]}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-        return {"access_token": access_token, "token_type": "bearer"}
-    raise HTTPException(status_code=400, detail="Incorrect username or password")
+def _telemetry_frame() -> pd.DataFrame:
+    # Shared read-only view: the first worker to see a new file version publishes it, the rest map it
+    if not SHARED_DATA:
+        return ingest_data("simulated_telemetry.csv")
+    return _shared_data.load("simulated_telemetry.csv", ingest_data)
 
-@router.get("/telemetry/live")
-async def get_live_telemetry(token: str = Depends(verify_token)):
+def _live_rows():
     if os.path.exists("simulated_telemetry.csv"):
-        df = pd.read_csv("simulated_telemetry.csv")
+        df = _telemetry_frame()
         return df.tail(10).to_dict(orient="records")
     return []
 
-@router.get("/telemetry/history")
-async def get_historical_telemetry(start: float = None, end: float = None, token: str = Depends(verify_token)):
+def _history_rows(start: float = None, end: float = None, encoded: bool = False):
+    # `encoded` returns the compact codec blob (storage.codec) instead of JSON rows
+    if TelemetryArchive.exists(ARCHIVE_PATH):
+        archive = TelemetryArchive(ARCHIVE_PATH)
+        if encoded:
+            return archive.export(start or None, end or None)
+        df = archive.query(start or None, end or None)
+        return df.to_dict(orient="records")
     if os.path.exists("simulated_telemetry.csv"):
-        df = pd.read_csv("simulated_telemetry.csv")
+        df = _telemetry_frame()
         if start:
             df = df[df["timestamp"] >= start]
         if end:
             df = df[df["timestamp"] <= end]
-        return df.to_dict(orient="records")
-    return []
+        return encode_frame(df) if encoded else df.to_dict(orient="records")
+    return encode_frame(pd.DataFrame()) if encoded else []
 
-@router.get("/behavior/results")
-async def get_behavior_results(token: str = Depends(verify_token)):
+def _rollup_rows(start: float = None, end: float = None, animal_id: str = None, granularity: float = None):
+    if not RollupStore.exists(ROLLUP_PATH):
+        return []
+    df = RollupStore(ROLLUP_PATH).query(start, end, animal_id=animal_id, granularity=granularity)
+    return df.to_dict(orient="records")
+
+def _behavior_rows():
     if os.path.exists("simulated_telemetry.csv"):
-        df = preprocess("simulated_telemetry.csv")
+        df = preprocess("simulated_telemetry.csv", cache=_feature_cache)
         result = classify_behaviors(df, method='rule')
         return result.to_dict(orient="records")
     return []
 
-@router.post("/simulate/run")
-async def run_simulation(species: str = 'deer', movement_mode: str = 'walk', sampling_rate: float = 1.0, duration: int = 60, token: str = Depends(verify_token)):
-    sim = TelemetrySimulator(species=species, movement_mode=movement_mode, sampling_rate=sampling_rate, duration=duration)
-    sim.save_to_csv('simulated_telemetry.csv')
-    return {"status": "Simulation complete"}
-
-@router.post("/model/train")
-async def train_model(label_col: str = 'behavior', token: str = Depends(verify_token)):
+def _train(label_col: str):
     if os.path.exists("simulated_telemetry.csv"):
-        df = preprocess("simulated_telemetry.csv")
+        df = preprocess("simulated_telemetry.csv", cache=_feature_cache)
         # For demo, assume 'behavior' column exists
         clf = MLBehaviorClassifier()
         clf.train(df, label_col=label_col, save_path='rf_model.joblib')
         return {"status": "Model trained and saved as rf_model.joblib"}
-    return {"status": "No data to train on"} 
\ No newline at end of file
+    return {"status": "No data to train on"}
+
+def _home_range_rows(animal_id: str = None, mcp_percent: float = 95.0, grid_size: int = 256):
+    if not os.path.exists("simulated_telemetry.csv"):
+        return []
+    # Summaries are cached next to the features, keyed on the same file identity
+    params = {"analysis": "home_range", "mcp_percent": mcp_percent, "grid_size": grid_size}
+    table = _feature_cache.get_or_compute(
+        "simulated_telemetry.csv", params,
+        lambda: home_ranges(preprocess("simulated_telemetry.csv", cache=_feature_cache), mcp_percent=mcp_percent, grid_size=grid_size))
+    if table.empty:
+        return []
+    if animal_id:
+        table = table[table["animal_id"] == animal_id]
+    return table.to_dict(orient="records")
+
+def _segment_rows(animal_id: str = None, stay: float = 0.99):
+    if not os.path.exists("simulated_telemetry.csv"):
+        return []
+    params = {"analysis": "segments", "stay": stay}
+    table = _feature_cache.get_or_compute(
+        "simulated_telemetry.csv", params,
+        lambda: segment_behaviors(preprocess("simulated_telemetry.csv", cache=_feature_cache), stay=stay))
+    if animal_id:
+        table = table[table["animal_id"] == animal_id]
+    return table.to_dict(orient="records")
+
+def _encounter_rows(species_a: str = None, species_b: str = None, start: float = None, end: float = None,
+                    distance: float = 50.0, window: float = 60.0, events: bool = True):
+    if TelemetryArchive.exists(ARCHIVE_PATH):
+        df = TelemetryArchive(ARCHIVE_PATH).query(start, end)
+    elif os.path.exists("simulated_telemetry.csv"):
+        df = _telemetry_frame()
+    else:
+        return []
+    species = (species_a, species_b or species_a) if species_a else None
+    pairs = find_encounters(df, distance=distance, window=window, species=species, start=start, end=end)
+    table = encounter_events(pairs) if events else pairs
+    return table.to_dict(orient="records")
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+_feature_cache = FeatureCache()
+_shared_data = SharedDataset()
+_ml_cache = {}
+
+def _ml_model() -> MLBehaviorClassifier:
+    # Reload the model only when the file on disk changes
+    mtime = os.path.getmtime('rf_model.joblib')
+    if _ml_cache.get('mtime') != mtime:
+        _ml_cache['clf'] = MLBehaviorClassifier('rf_model.joblib')
+        _ml_cache['mtime'] = mtime
+    return _ml_cache['clf']
+
+def _ml_predict(df: pd.DataFrame):
+    return _ml_model().predict(df)
+
+def preload():
+    """Import the heavy modules and load the model up front (pre-fork master), instead of on first request."""
+    import sklearn.ensemble  # noqa: F401
+    import joblib  # noqa: F401
+    import scipy.signal  # noqa: F401
+    if os.path.exists('rf_model.joblib'):
+        _ml_model()
+    if os.path.exists("simulated_telemetry.csv"):
+        _telemetry_frame()
+
+_batchers = {
+    'rule': MicroBatcher(RuleBasedClassifier().predict, executor=heavy_executor),
+    'ml': MicroBatcher(_ml_predict, executor=heavy_executor),
+}
+# Columns each classifier reads, checked before a batch joins the shared predict() call
+_batch_inputs = {
+    'rule': lambda: RuleBasedClassifier.inputs,
+    'ml': lambda: _ml_model().inputs,
+}
+
+def _parse_batch(body: bytes, content_type: str, method: str = 'rule') -> pd.DataFrame:
+    """Columnar JSON ({"columns": {name: [values]}}), an Arrow IPC stream or a codec blob, preprocessed per animal."""
+    try:
+        if content_type.startswith(ARROW_STREAM):
+            import pyarrow as pa
+            df = pa.ipc.open_stream(body).read_all().to_pandas()
+        elif content_type.startswith(TELEMETRY_CODEC):
+            df = decode_frame(body)
+        else:
+            payload = json.loads(body)
+            if not isinstance(payload, dict):
+                raise ValueError("expected a JSON object of columns")
+            df = pd.DataFrame(payload.get("columns", payload))
+        if "timestamp" not in df:
+            raise ValueError("batch needs a timestamp column")
+        if df.empty:
+            raise ValueError("batch has no rows")
+        df = preprocess_by_animal(df.reset_index(drop=True))
+        missing = [col for col in _batch_inputs[method]() if col not in df]
+        if missing:
+            raise ValueError(f"batch lacks the columns the {method} classifier needs: {', '.join(missing)}")
+        return df
+    except (ValueError, KeyError, TypeError, struct.error) as exc:
+        raise HTTPException(status_code=422, detail=f"Invalid telemetry batch: {exc}")
+
+# Blocking pandas/model work runs on the bounded executors, never on the event loop.
+# Concurrent identical reads share one computation (single_flight), so a burst
+# of pollers at the top of an interval costs one scan.
+@router.get("/telemetry/live")
+async def get_live_telemetry(request: Request, user: Dict = Depends(rate_limited(LIGHT))):
+    return await single_flight.run(live_executor, _live_rows, request=request)
+
+@router.get("/telemetry/history")
+async def get_historical_telemetry(request: Request, start: float = None, end: float = None, user: Dict = Depends(rate_limited(HEAVY))):
+    # Clients that accept the codec media type get the binary encoding instead of JSON rows
+    encoded = TELEMETRY_CODEC in request.headers.get("accept", "")
+    rows = await single_flight.run(heavy_executor, _history_rows, start, end, encoded, request=request)
+    return Response(content=rows, media_type=TELEMETRY_CODEC) if encoded else rows
+
+@router.get("/telemetry/rollups")
+async def get_telemetry_rollups(request: Request, start: float = None, end: float = None, animal_id: str = None, granularity: float = None, user: Dict = Depends(rate_limited(HEAVY))):
+    return await single_flight.run(heavy_executor, _rollup_rows, start, end, animal_id, granularity, request=request)
+
+@router.get("/behavior/results")
+async def get_behavior_results(request: Request, user: Dict = Depends(rate_limited(HEAVY))):
+    return await single_flight.run(heavy_executor, _behavior_rows, request=request)
+
+@router.get("/behavior/segments")
+async def get_behavior_segments(request: Request, animal_id: str = None, stay: float = 0.99, user: Dict = Depends(rate_limited(HEAVY))):
+    if not 0 < stay < 1:
+        raise HTTPException(status_code=422, detail="stay must be in (0, 1)")
+    return await single_flight.run(heavy_executor, _segment_rows, animal_id, stay, request=request)
+
+@router.get("/analytics/encounters")
+async def get_encounters(request: Request, species_a: str = None, species_b: str = None, start: float = None, end: float = None,
+                         distance: float = 50.0, window: float = 60.0, events: bool = True, user: Dict = Depends(rate_limited(HEAVY))):
+    if distance <= 0 or window <= 0:
+        raise HTTPException(status_code=422, detail="distance and window must be positive")
+    return await single_flight.run(heavy_executor, _encounter_rows, species_a, species_b, start, end, distance, window, events, request=request)
+
+@router.get("/analytics/home-range")
+async def get_home_range(request: Request, animal_id: str = None, mcp_percent: float = 95.0, grid_size: int = 256, user: Dict = Depends(rate_limited(HEAVY))):
+    if not 0 < mcp_percent <= 100 or not 16 <= grid_size <= 2048:
+        raise HTTPException(status_code=422, detail="mcp_percent must be in (0, 100] and grid_size in [16, 2048]")
+    return await single_flight.run(heavy_executor, _home_range_rows, animal_id, mcp_percent, grid_size, request=request)
+
+@router.post("/simulate/run", dependencies=[Depends(require_role("Researcher"))])
+async def run_simulation(species: str = 'deer', movement_mode: str = 'walk', sampling_rate: float = 1.0, duration: int = 60, user: Dict = Depends(rate_limited(HEAVY))):
+    sim = TelemetrySimulator(species=species, movement_mode=movement_mode, sampling_rate=sampling_rate, duration=duration)
+    await heavy_executor.run(sim.save_to_csv, 'simulated_telemetry.csv')
+    return {"status": "Simulation complete"}
+
+@router.post("/model/train", dependencies=[Depends(require_role("Researcher"))])
+async def train_model(label_col: str = 'behavior', user: Dict = Depends(rate_limited(HEAVY))):
+    return await heavy_executor.run(_train, label_col)
+
+@router.get("/metrics/executor")
+async def get_executor_metrics(user: Dict = Depends(rate_limited(LIGHT))):
+    return {**executor_metrics(), "coalescing": single_flight.snapshot(), "rate_limits": rate_limiter.snapshot()}
+
+@router.post("/behavior/classify")
+async def classify_batch(request: Request, method: str = 'rule', user: Dict = Depends(rate_limited(LIGHT))):
+    if method not in _batchers:
+        raise HTTPException(status_code=422, detail="Unknown classification method: choose 'rule' or 'ml'")
+    if method == 'ml' and not os.path.exists('rf_model.joblib'):
+        raise HTTPException(status_code=409, detail="No trained model, call /model/train first")
+    body = await request.body()
+    df = await heavy_executor.run(_parse_batch, body, request.headers.get("content-type", ""), method, request=request)
+    # Concurrent uploads are coalesced into one classifier call
+    labels = await _batchers[method].submit(df)
+    result = {"timestamp": df["timestamp"].tolist(), "behavior": labels.tolist()}
+    if "animal_id" in df:
+        result["animal_id"] = df["animal_id"].astype(str).tolist()
+    return result
@@ -0,0 +1,82 @@
+import asyncio
+import numpy as np
+import pandas as pd
+from typing import Callable, List, Optional, Tuple
+
+
+class MicroBatcher:
+    """Coalesce concurrent small classification calls into one predict() call.
+
+    Frames submitted within `max_delay` seconds of each other (or until
+    `max_rows` accumulate) are concatenated, classified together and the
+    labels are split back to each caller. If the combined call fails, each
+    frame is classified on its own, so a bad upload fails only its caller.
+    """
+
+    def __init__(self, predict_fn: Callable[[pd.DataFrame], np.ndarray], max_delay: float = 0.005,
+                 max_rows: int = 100_000, executor=None):
+        self.predict_fn = predict_fn
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+        self.executor = executor
+        self._pending: List[Tuple[pd.DataFrame, asyncio.Future]] = []
+        self._rows = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.requests = 0
+
+    async def submit(self, df: pd.DataFrame) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((df, future))
+        self._rows += len(df)
+        if self._rows >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending, self._rows = self._pending, [], 0
+        if pending:
+            asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending: List[Tuple[pd.DataFrame, asyncio.Future]]):
+        self.batches += 1
+        self.requests += len(pending)
+        frames = [df for df, _ in pending]
+        combined = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        try:
+            labels = np.asarray(await self._predict(combined))
+        except Exception as exc:
+            if len(pending) == 1:
+                self._fail(pending[0][1], exc)
+                return
+            # Retry each frame alone, so only the callers whose frames fail see the error
+            for df, future in pending:
+                try:
+                    result = np.asarray(await self._predict(df))
+                except Exception as single_exc:
+                    self._fail(future, single_exc)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+            return
+        offset = 0
+        for df, future in pending:
+            if not future.done():
+                future.set_result(labels[offset:offset + len(df)])
+            offset += len(df)
+
+    async def _predict(self, df: pd.DataFrame):
+        if self.executor is not None:
+            return await self.executor.run(self.predict_fn, df)
+        return self.predict_fn(df)
+
+    @staticmethod
+    def _fail(future: asyncio.Future, exc: Exception):
+        if not future.done():
+            future.set_exception(exc)
@@ -1,12 +1,12 @@
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report
-import joblib
-from typing import Optional
+import os
+import tempfile
+from typing import Dict, Iterable, List, Optional
 
 class RuleBasedClassifier:
+    inputs = ['speed', 'temperature']
+
     def __init__(self):
         pass
 
@@ -20,6 +20,48 @@ class RuleBasedClassifier:
         choices = ['resting', 'walking', 'running']
         return np.select(conditions, choices, default='unknown')
 
+class StratifiedReservoir:
+    """Uniform random sample of at most `capacity` rows per class from a stream of chunks."""
+
+    def __init__(self, capacity: int, n_features: int, random_state: int = 42):
+        self.capacity = capacity
+        self.n_features = n_features
+        self.rng = np.random.default_rng(random_state)
+        self.samples: Dict = {}
+        self.seen: Dict = {}
+        self.label_dtype = np.dtype(object)
+
+    def add(self, X: np.ndarray, y: np.ndarray):
+        # Labels keep their own dtype (e.g. int codes), which sklearn needs to infer the target type
+        self.label_dtype = y.dtype if not self.samples else np.result_type(self.label_dtype, y.dtype)
+        for label in np.unique(y):
+            rows = X[y == label]
+            if label not in self.samples:
+                self.samples[label] = np.empty((0, self.n_features), dtype=X.dtype)
+                self.seen[label] = 0
+            sample, seen = self.samples[label], self.seen[label]
+            # Fill the reservoir first, then item j replaces a random slot with probability capacity / (j + 1)
+            free = min(self.capacity - len(sample), len(rows))
+            if free > 0:
+                sample = np.concatenate([sample, rows[:free]])
+            rest = rows[free:]
+            if len(rest):
+                positions = seen + free + np.arange(len(rest))
+                slots = (self.rng.random(len(rest)) * (positions + 1)).astype(np.int64)
+                hit = slots < self.capacity
+                slots, rest = slots[hit], rest[hit]
+                # Later items win when several land in the same slot
+                last = len(slots) - 1 - np.unique(slots[::-1], return_index=True)[1]
+                sample[slots[last]] = rest[last]
+            self.samples[label] = sample
+            self.seen[label] = seen + len(rows)
+
+    def arrays(self):
+        labels = list(self.samples)
+        X = np.concatenate([self.samples[l] for l in labels]) if labels else np.empty((0, self.n_features))
+        y = np.repeat(np.asarray(labels, dtype=self.label_dtype), [len(self.samples[l]) for l in labels])
+        return X, y
+
 class MLBehaviorClassifier:
     def __init__(self, model_path: Optional[str] = None):
         self.model = None
@@ -28,6 +70,11 @@ class MLBehaviorClassifier:
             self.load(model_path)
 
     def train(self, df: pd.DataFrame, label_col: str = 'behavior', save_path: Optional[str] = None):
+        # sklearn/joblib are imported on first use so that serving code starts fast
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import classification_report
+        import joblib
         features = self._get_features(df)
         X = df[features]
         y = df[label_col]
@@ -40,6 +87,72 @@ class MLBehaviorClassifier:
             joblib.dump(self.model, save_path)
             self.model_path = save_path
 
+    def train_chunked(self, chunks: Iterable[pd.DataFrame], label_col: str = 'behavior', save_path: Optional[str] = None,
+                      sample_per_class: int = 200_000, test_size: float = 0.2, eval_dir: Optional[str] = None) -> Dict:
+        """Train from a stream of feature chunks that together do not fit in memory.
+
+        Each chunk is split into train/held-out rows. Training rows feed a
+        per-class reservoir sample that bounds memory, held-out rows are
+        spilled to Parquet chunks in `eval_dir` and scored after fitting; the
+        scored chunks (y_true, y_pred) are written back next to them.
+        """
+        from sklearn.ensemble import RandomForestClassifier
+        import joblib
+        eval_dir = eval_dir or tempfile.mkdtemp(prefix='wmp-eval-')
+        os.makedirs(eval_dir, exist_ok=True)
+        rng = np.random.default_rng(42)
+        features: Optional[List[str]] = None
+        reservoir = None
+        holdout_files = []
+        for i, chunk in enumerate(chunks):
+            if features is None:
+                features = self._get_features(chunk)
+                reservoir = StratifiedReservoir(sample_per_class, len(features))
+            held_out = rng.random(len(chunk)) < test_size
+            X = chunk[features].to_numpy(dtype=np.float64)
+            y = chunk[label_col].to_numpy()
+            reservoir.add(X[~held_out], y[~held_out])
+            if held_out.any():
+                path = os.path.join(eval_dir, f'holdout-{i:05d}.parquet')
+                pd.DataFrame({**{f: X[held_out, j] for j, f in enumerate(features)}, label_col: y[held_out]}).to_parquet(path, index=False)
+                holdout_files.append(path)
+        if reservoir is None:
+            raise ValueError("No training data in chunks.")
+        X_train, y_train = reservoir.arrays()
+        self.model = RandomForestClassifier(n_estimators=100, random_state=42)
+        self.model.fit(pd.DataFrame(X_train, columns=features), y_train)
+        confusion: Dict = {}
+        for path in holdout_files:
+            held = pd.read_parquet(path)
+            y_pred = self.model.predict(held[features])
+            pd.DataFrame({'y_true': held[label_col], 'y_pred': y_pred}).to_parquet(path.replace('holdout-', 'eval-'), index=False)
+            for pair, count in pd.Series(list(zip(held[label_col], y_pred))).value_counts().items():
+                confusion[pair] = confusion.get(pair, 0) + int(count)
+        report = self._report_from_confusion(confusion)
+        print(pd.DataFrame({k: v for k, v in report.items() if k != 'accuracy'}).T)
+        print(f"accuracy: {report['accuracy']:.3f}")
+        if save_path:
+            joblib.dump(self.model, save_path)
+            self.model_path = save_path
+        return report
+
+    @staticmethod
+    def _report_from_confusion(confusion: Dict) -> Dict:
+        labels = sorted({l for pair in confusion for l in pair})
+        report = {}
+        for label in labels:
+            tp = confusion.get((label, label), 0)
+            predicted = sum(c for (t, p), c in confusion.items() if p == label)
+            support = sum(c for (t, p), c in confusion.items() if t == label)
+            precision = tp / predicted if predicted else 0.0
+            recall = tp / support if support else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+            report[label] = {'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}
+        total = sum(confusion.values())
+        correct = sum(c for (t, p), c in confusion.items() if t == p)
+        report['accuracy'] = correct / total if total else 0.0
+        return report
+
     def predict(self, df: pd.DataFrame) -> pd.Series:
         if not self.model:
             raise ValueError("Model not loaded or trained.")
@@ -47,7 +160,15 @@ class MLBehaviorClassifier:
         X = df[features]
         return self.model.predict(X)
 
+    @property
+    def inputs(self) -> List[str]:
+        """Columns predict() needs: the features the model was fitted on."""
+        if not self.model:
+            raise ValueError("Model not loaded or trained.")
+        return list(getattr(self.model, 'feature_names_in_', []))
+
     def load(self, path: str):
+        import joblib
         self.model = joblib.load(path)
         self.model_path = path
 
@@ -78,7 +199,8 @@ if __name__ == "__main__":
     # For rule-based
     df = pd.read_csv('simulated_telemetry.csv')
     from processor.preprocessing import preprocess
-    df = preprocess('simulated_telemetry.csv')
+    from processor.cache import FeatureCache
+    df = preprocess('simulated_telemetry.csv', cache=FeatureCache())
     result = classify_behaviors(df, method='rule')
     print(result.head())
     # For ML-based (requires labeled data and a trained model)
@@ -1,47 +1,120 @@
-from fastapi import FastAPI, WebSocket, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, WebSocket, Request
+from fastapi.responses import HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 import pandas as pd
-import plotly.graph_objs as go
-import plotly.io as pio
+import hashlib
+import json
 import os
+from collections import OrderedDict
+from processor.preprocessing import ingest_data
+from storage.archive import TelemetryArchive, ARCHIVE_PATH
+from storage.rollups import RollupStore, ROLLUP_PATH
+from storage.shared import SharedDataset, SHARED_DATA
+from dashboard.tiles import TileStore, MAX_TILES_PER_VIEW, tile_bounds
+from api.executor import live_executor, heavy_executor, executor_metrics
 
 app = FastAPI()
 templates = Jinja2Templates(directory="dashboard/templates")
 app.mount("/static", StaticFiles(directory="dashboard/static"), name="static")
 
-# Load or simulate data for demo
+# Demo data is read on first use (not at import) and re-read when the file changes.
+# By default it is published once per host as shared column buffers that every
+# worker maps read-only, instead of each worker holding its own copy.
 DATA_PATH = "simulated_telemetry.csv"
-if os.path.exists(DATA_PATH):
-    df = pd.read_csv(DATA_PATH)
-else:
-    df = pd.DataFrame()
+_data = {"mtime": None, "df": pd.DataFrame()}
+_shared = SharedDataset()
+
+def _frame() -> pd.DataFrame:
+    try:
+        mtime = os.path.getmtime(DATA_PATH)
+    except FileNotFoundError:
+        return pd.DataFrame()
+    if SHARED_DATA:
+        return _shared.load(DATA_PATH, ingest_data)
+    if _data["mtime"] != mtime:
+        _data["df"] = ingest_data(DATA_PATH)
+        _data["mtime"] = mtime
+    return _data["df"]
+
+def preload():
+    """Load data and plotting modules up front, e.g. in a pre-fork master so workers share them."""
+    import plotly.graph_objs  # noqa: F401
+    _frame()
+
+# Plot endpoints return Plotly figure JSON (render with Plotly.react) rather than
+# HTML. The ETag is derived from the plot, its parameters and the dataset
+# version, so a poll with a matching If-None-Match is answered with 304 before
+# anything is built, and rendered bodies are reused until the data changes.
+FIGURE_CACHE_SIZE = 32
+_figures = OrderedDict()
+
+def _dataset_version() -> str:
+    parts = []
+    for path in (DATA_PATH, os.path.join(ROLLUP_PATH, "last_fix.json")):
+        try:
+            st = os.stat(path)
+            parts.append(f"{st.st_ino}-{st.st_size}-{st.st_mtime_ns}")
+        except FileNotFoundError:
+            parts.append("-")
+    return ":".join(parts)
+
+def _figure_json(fig) -> bytes:
+    if isinstance(fig, dict):
+        return json.dumps(fig).encode()
+    # NumPy-backed trace data is written as {"dtype", "bdata"} base64 typed arrays
+    return fig.to_json().encode()
+
+async def _figure_response(request: Request, name: str, build, *args):
+    key = json.dumps([name, _dataset_version(), *args])
+    etag = '"%s"' % hashlib.sha1(key.encode()).hexdigest()[:20]
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    body = _figures.get(etag)
+    if body is None:
+        body = await heavy_executor.run(lambda: _figure_json(build(*args)), request=request)
+        _figures[etag] = body
+        while len(_figures) > FIGURE_CACHE_SIZE:
+            _figures.popitem(last=False)
+    else:
+        _figures.move_to_end(etag)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     # Show main dashboard page
     return templates.TemplateResponse("index.html", {"request": request})
 
-@app.get("/api/data")
-async def get_data():
+def _get_data():
     # Return latest telemetry data (for AJAX/JS polling)
+    df = _frame()
     if not df.empty:
         return df.tail(100).to_dict(orient="records")
     return []
 
-@app.get("/api/plot/gps")
-async def plot_gps():
+@app.get("/api/data")
+async def get_data(request: Request):
+    return await live_executor.run(_get_data, request=request)
+
+def _empty_figure(message: str):
+    return {"data": [], "layout": {"title": {"text": message}}}
+
+def _plot_gps():
     # Plot GPS tracks on a map
+    import plotly.graph_objs as go
+    df = _frame()
     if df.empty:
-        return {"html": "<p>No data</p>"}
+        return _empty_figure("No data")
+    # NumPy inputs serialize as base64 typed arrays; hover text is formatted client-side
     fig = go.Figure(go.Scattermapbox(
-        lat=df["latitude"],
-        lon=df["longitude"],
+        lat=df["latitude"].to_numpy(),
+        lon=df["longitude"].to_numpy(),
         mode="lines+markers",
         marker=dict(size=6, color="blue"),
         line=dict(width=2, color="blue"),
-        text=df["timestamp"].astype(str)
+        customdata=df["timestamp"].to_numpy(),
+        hovertemplate="%{customdata}<extra></extra>"
     ))
     fig.update_layout(
         mapbox_style="open-street-map",
@@ -49,62 +122,164 @@ async def plot_gps():
         mapbox_center={"lat": df["latitude"].mean(), "lon": df["longitude"].mean()},
         margin={"l":0,"r":0,"t":0,"b":0}
     )
-    html = pio.to_html(fig, full_html=False)
-    return {"html": html}
+    return fig
 
-@app.get("/api/plot/behavior")
-async def plot_behavior():
+@app.get("/api/plot/gps")
+async def plot_gps(request: Request):
+    return await _figure_response(request, "gps", _plot_gps)
+
+def _plot_behavior(start: float = None, end: float = None, granularity: float = None):
     # Plot behavior classification over time
+    import plotly.graph_objs as go
+    rollups = RollupStore(ROLLUP_PATH).query(start, end, granularity=granularity) if RollupStore.exists(ROLLUP_PATH) else None
+    budgets = [c for c in rollups if c.startswith("budget_")] if rollups is not None else []
+    if budgets:
+        # Long ranges: stacked time budgets per bucket instead of one point per sample
+        per_bucket = rollups.groupby("bucket")[budgets].sum()
+        fig = go.Figure()
+        for col in budgets:
+            fig.add_trace(go.Bar(x=per_bucket.index.to_numpy(), y=per_bucket[col].to_numpy(), name=col[len("budget_"):]))
+        fig.update_layout(barmode="stack", title="Behavior Time Budget", xaxis_title="Time", yaxis_title="Seconds")
+        return fig
+    df = _frame()
     if df.empty or "behavior" not in df:
-        return {"html": "<p>No behavior data</p>"}
+        return _empty_figure("No behavior data")
+    # Labels go out as small integer codes with the names on the axis ticks
+    codes, labels = pd.factorize(df["behavior"], sort=True)
     fig = go.Figure()
     fig.add_trace(go.Scatter(
-        x=df["timestamp"],
-        y=df["behavior"],
+        x=df["timestamp"].to_numpy(),
+        y=codes.astype("int8"),
         mode="lines+markers",
         marker=dict(size=6, color="orange"),
         line=dict(width=2, color="orange"),
         name="Behavior"
     ))
-    fig.update_layout(title="Behavior Over Time", xaxis_title="Time", yaxis_title="Behavior")
-    html = pio.to_html(fig, full_html=False)
-    return {"html": html}
+    fig.update_layout(title="Behavior Over Time", xaxis_title="Time", yaxis_title="Behavior",
+                      yaxis=dict(tickvals=list(range(len(labels))), ticktext=[str(label) for label in labels]))
+    return fig
 
-@app.get("/api/plot/sensors")
-async def plot_sensors():
+@app.get("/api/plot/behavior")
+async def plot_behavior(request: Request, start: float = None, end: float = None, granularity: float = None):
+    return await _figure_response(request, "behavior", _plot_behavior, start, end, granularity)
+
+def _plot_sensors(start: float = None, end: float = None, granularity: float = None):
     # Plot sensor data (e.g., speed, accel_mag, temp)
+    import plotly.graph_objs as go
+    if RollupStore.exists(ROLLUP_PATH):
+        rollups = RollupStore(ROLLUP_PATH).query(start, end, granularity=granularity)
+        if not rollups.empty:
+            fig = go.Figure()
+            for col in ["speed", "accel_mag", "temperature"]:
+                if f"{col}_mean" in rollups:
+                    for animal, group in rollups.groupby("animal_id"):
+                        fig.add_trace(go.Scatter(x=group["bucket"].to_numpy(), y=group[f"{col}_mean"].to_numpy(),
+                                                 mode="lines", name=f"{col} ({animal})"))
+            fig.update_layout(title="Sensor Data Over Time", xaxis_title="Time")
+            return fig
+    df = _frame()
     if df.empty:
-        return {"html": "<p>No data</p>"}
+        return _empty_figure("No data")
     fig = go.Figure()
     for col in ["speed", "accel_mag", "temperature"]:
         if col in df:
-            fig.add_trace(go.Scatter(x=df["timestamp"], y=df[col], mode="lines", name=col))
+            fig.add_trace(go.Scatter(x=df["timestamp"].to_numpy(), y=df[col].to_numpy(), mode="lines", name=col))
     fig.update_layout(title="Sensor Data Over Time", xaxis_title="Time")
-    html = pio.to_html(fig, full_html=False)
-    return {"html": html}
+    return fig
+
+@app.get("/api/plot/sensors")
+async def plot_sensors(request: Request, start: float = None, end: float = None, granularity: float = None):
+    return await _figure_response(request, "sensors", _plot_sensors, start, end, granularity)
+
+# Heatmap tiles: the map asks /api/tiles/view for the tiles of its viewport
+# (never more than MAX_TILES_PER_VIEW) and then loads each PNG.
+TILE_LAYERS = ("density", "behavior")
+_tiles = TileStore()
+
+def _sync_tiles():
+    df = _frame()
+    if df.empty:
+        return
+    # Same file and same first fix: rows past the last sync are new and only those get binned
+    source = {"path": os.path.abspath(DATA_PATH), "inode": os.stat(DATA_PATH).st_ino,
+              "first": float(df["timestamp"].iloc[0])}
+    _tiles.sync(df, source)
+
+def _tile_view(west: float, south: float, east: float, north: float, zoom: int, layer: str):
+    _sync_tiles()
+    z, tiles = _tiles.view(west, south, east, north, zoom)
+    return {"zoom": z, "max_tiles": MAX_TILES_PER_VIEW,
+            "tiles": [{"z": z, "x": x, "y": y, "bounds": tile_bounds(z, x, y),
+                       "url": f"/api/tiles/{z}/{x}/{y}.png?layer={layer}"} for z, x, y in tiles]}
+
+@app.get("/api/tiles/view")
+async def tile_view(request: Request, west: float, south: float, east: float, north: float, zoom: int, layer: str = "density"):
+    if layer not in TILE_LAYERS:
+        raise HTTPException(status_code=422, detail=f"layer must be one of {TILE_LAYERS}")
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise HTTPException(status_code=422, detail="Invalid bounding box")
+    return await heavy_executor.run(_tile_view, west, south, east, north, zoom, layer, request=request)
+
+@app.get("/api/tiles/{z}/{x}/{y}.png")
+async def tile_png(request: Request, z: int, x: int, y: int, layer: str = "density"):
+    if layer not in TILE_LAYERS or not 0 <= z <= _tiles.max_zoom or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise HTTPException(status_code=404, detail="No such tile")
+    png = await live_executor.run(_tiles.render, z, x, y, layer, request=request)
+    if png is None:
+        return Response(status_code=204)
+    etag = '"%s"' % hashlib.sha1(png).hexdigest()[:20]
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=png, media_type="image/png", headers=headers)
+
+WS_INTERVAL = 1.0
+WS_MAX_BACKOFF = 8.0
 
 @app.websocket("/ws/data")
 async def websocket_data(websocket: WebSocket):
     await websocket.accept()
     # For demo: send last 10 rows every second
     import asyncio
+    delay = WS_INTERVAL
     while True:
-        if not df.empty:
-            await websocket.send_json(df.tail(10).to_dict(orient="records"))
-        await asyncio.sleep(1)
+        try:
+            rows = await live_executor.run(lambda: _frame().tail(10).to_dict(orient="records"))
+        except HTTPException:
+            # Live lane saturated: skip this tick and back off instead of dropping the socket
+            delay = min(delay * 2, WS_MAX_BACKOFF)
+        else:
+            delay = WS_INTERVAL
+            if rows:
+                await websocket.send_json(rows)
+        await asyncio.sleep(delay)
 
 # Historical playback and filtering endpoint
-@app.get("/api/data/filter")
-async def filter_data(start: float = None, end: float = None, behavior: str = None):
-    filtered = df.copy()
-    if start is not None:
-        filtered = filtered[filtered["timestamp"] >= start]
-    if end is not None:
-        filtered = filtered[filtered["timestamp"] <= end]
+def _filter_data(start: float = None, end: float = None, behavior: str = None):
+    if TelemetryArchive.exists(ARCHIVE_PATH) and (start is not None or end is not None):
+        # Time-range playback maps only the archive pages covering [start, end]
+        filtered = TelemetryArchive(ARCHIVE_PATH).query(start, end)
+    else:
+        filtered = _frame()
+        if start is not None:
+            filtered = filtered[filtered["timestamp"] >= start]
+        if end is not None:
+            filtered = filtered[filtered["timestamp"] <= end]
     if behavior and "behavior" in filtered:
         filtered = filtered[filtered["behavior"] == behavior]
     return filtered.to_dict(orient="records")
 
+@app.get("/api/data/filter")
+async def filter_data(request: Request, start: float = None, end: float = None, behavior: str = None):
+    return await heavy_executor.run(_filter_data, start, end, behavior, request=request)
+
+@app.get("/api/metrics/executor")
+async def get_executor_metrics():
+    return executor_metrics()
+
+if os.environ.get("WMP_PRELOAD") == "1":
+    preload()
+
 # --- TEMPLATES & STATIC FILES ---
 # You will need to create:
 # - dashboard/templates/index.html (main dashboard page)
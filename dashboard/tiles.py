@@ -0,0 +1,244 @@
+import fcntl
+import glob
+import json
+import os
+import shutil
+import struct
+import zlib
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+from analytics.segmentation import BEHAVIOR_STATES
+
+# Heatmap tile pyramid (Web Mercator XYZ, like OSM tiles):
+#   <root>/state.json          source identity, rows already binned and the peak count per zoom
+#   <root>/<z>/<x>/<y>.npz     non-empty cells of one tile with their fix and per-behavior counts
+#   <root>/<z>/<x>/<y>-<layer>-<peak>.png  rendered tile, keyed on the zoom's peak and deleted whenever the counts change
+# Counts are additive, so new fixes are binned and added to the tiles they
+# touch; nothing is recomputed for data already seen.
+TILE_PATH = os.environ.get("WMP_TILE_PATH", ".tile_cache")
+MAX_ZOOM = int(os.environ.get("WMP_TILE_MAX_ZOOM", 14))
+TILE_BINS = 128  # histogram cells per tile side; power of two
+TILE_PIXELS = 256
+MAX_TILES_PER_VIEW = 64
+MAX_LATITUDE = 85.05112878
+_BIN_BITS = TILE_BINS.bit_length() - 1
+# Density ramp (light yellow -> red) and one colour per behavior state
+_RAMP = np.array([[255, 255, 178], [254, 204, 92], [253, 141, 60], [240, 59, 32], [189, 0, 38]], dtype=np.float64)
+_BEHAVIOR_COLORS = np.array([[49, 130, 189], [49, 163, 84], [222, 45, 38]], dtype=np.uint8)
+
+
+def mercator_cells(lat: np.ndarray, lon: np.ndarray, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Global histogram cell (x, y) of each fix at `zoom`; tile = cell >> log2(TILE_BINS)."""
+    size = (1 << zoom) * TILE_BINS
+    lat = np.deg2rad(np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0
+    y = (1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0
+    return (np.clip((x * size).astype(np.int64), 0, size - 1),
+            np.clip((y * size).astype(np.int64), 0, size - 1))
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(west, south, east, north) of a tile in degrees."""
+    n = 1 << z
+    lat = lambda t: float(np.rad2deg(np.arctan(np.sinh(np.pi * (1 - 2 * t / n)))))
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """Minimal RGBA PNG writer (no imaging library needed)."""
+    h, w, _ = rgba.shape
+    raw = np.concatenate([np.zeros((h, 1), dtype=np.uint8), rgba.reshape(h, w * 4)], axis=1).tobytes()
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 6)) + chunk(b'IEND', b''))
+
+
+class TileStore:
+    """Disk-cached, incrementally updated fix-density (and dominant-behavior) tiles."""
+
+    def __init__(self, root: str = TILE_PATH, max_zoom: int = MAX_ZOOM, states: Sequence[str] = BEHAVIOR_STATES):
+        self.root = root
+        self.max_zoom = max_zoom
+        self.states = list(states)
+
+    def _path(self, z: int, x: int, y: int, suffix: str = '.npz') -> str:
+        return os.path.join(self.root, str(z), str(x), f"{y}{suffix}")
+
+    @contextmanager
+    def _lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def state(self) -> Dict:
+        path = os.path.join(self.root, 'state.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        return {'source': None, 'rows': 0, 'peak': {}}
+
+    def _save_state(self, state: Dict):
+        path = os.path.join(self.root, 'state.json')
+        tmp = f"{path}.tmp.{os.getpid()}"
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    # --- building ---
+    def _add(self, lat: np.ndarray, lon: np.ndarray, behavior: Optional[np.ndarray], state: Dict) -> int:
+        """Bin fixes into every zoom level and add them to the stored tiles; returns tiles written."""
+        keep = np.isfinite(lat) & np.isfinite(lon)
+        lat, lon = lat[keep], lon[keep]
+        k = len(self.states)
+        codes = np.full(len(lat), k, dtype=np.int64)  # k = no or unknown behavior
+        if behavior is not None:
+            labels = pd.Categorical(np.asarray(behavior)[keep].astype(str), categories=self.states)
+            codes = np.where(labels.codes >= 0, labels.codes, k).astype(np.int64)
+        cx, cy = mercator_cells(lat, lon, self.max_zoom)
+        written = 0
+        for z in range(self.max_zoom, -1, -1):
+            shift = self.max_zoom - z
+            x, y = cx >> shift, cy >> shift
+            # One sparse histogram over (tile, cell, behavior) keys instead of a dense grid per tile
+            per_side = np.int64(1 << z)
+            cell = ((y & (TILE_BINS - 1)) << _BIN_BITS) | (x & (TILE_BINS - 1))
+            tile = (x >> _BIN_BITS) * per_side + (y >> _BIN_BITS)
+            keys, counts = np.unique((tile * TILE_BINS * TILE_BINS + cell) * (k + 1) + codes, return_counts=True)
+            tiles = keys // (TILE_BINS * TILE_BINS * (k + 1))
+            starts = np.flatnonzero(np.append(True, tiles[1:] != tiles[:-1]))
+            ends = np.append(starts[1:], len(keys))
+            peak = state['peak'].get(str(z), 0)
+            for a, b in zip(starts, ends):
+                tx, ty = divmod(int(tiles[a]), int(per_side))
+                rest = keys[a:b] % (TILE_BINS * TILE_BINS * (k + 1))
+                data = self.read(z, tx, ty) or {'counts': np.zeros((TILE_BINS, TILE_BINS), dtype=np.uint32),
+                                                'behavior': np.zeros((k, TILE_BINS, TILE_BINS), dtype=np.uint32)}
+                flat_cell, code = rest // (k + 1), rest % (k + 1)
+                np.add.at(data['counts'].reshape(-1), flat_cell, counts[a:b].astype(np.uint32))
+                known = code < k
+                np.add.at(data['behavior'].reshape(k, -1), (code[known], flat_cell[known]), counts[a:b][known].astype(np.uint32))
+                self._write(z, tx, ty, data)
+                peak = max(peak, int(data['counts'].max()))
+                written += 1
+            state['peak'][str(z)] = peak
+        return written
+
+    def _write(self, z: int, x: int, y: int, data: Dict):
+        path = self._path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp.{os.getpid()}.npz"
+        # Stored sparse: tracks cover few cells, and this is far cheaper than compressing dense grids
+        cells = np.flatnonzero(data['counts'])
+        np.savez(tmp, cells=cells.astype(np.uint16), counts=data['counts'].reshape(-1)[cells],
+                 behavior=data['behavior'].reshape(len(self.states), -1)[:, cells])
+        os.replace(tmp, path)
+        for png in glob.glob(self._path(z, x, y, '-*.png')):
+            try:
+                os.remove(png)
+            except FileNotFoundError:
+                pass
+
+    def sync(self, df: pd.DataFrame, source: Dict) -> int:
+        """Bring the tiles up to date with `df`, the current contents of `source`.
+
+        If `source` is the one already binned and `df` only grew, just the new
+        rows are added; a different source (or a shrunk one) rebuilds the
+        pyramid. Returns the number of rows binned.
+        """
+        with self._lock():
+            state = self.state()
+            if state['source'] != source or len(df) < state['rows']:
+                for entry in os.listdir(self.root):
+                    if entry.isdigit():
+                        shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
+                state = {'source': source, 'rows': 0, 'peak': {}}
+            new = df.iloc[state['rows']:]
+            if len(new):
+                self._add(new['latitude'].to_numpy(dtype=np.float64), new['longitude'].to_numpy(dtype=np.float64),
+                          new['behavior'].to_numpy() if 'behavior' in new else None, state)
+            state['rows'] = len(df)
+            self._save_state(state)
+            return len(new)
+
+    # --- serving ---
+    def read(self, z: int, x: int, y: int) -> Optional[Dict[str, np.ndarray]]:
+        try:
+            with np.load(self._path(z, x, y)) as data:
+                cells, counts, behavior = data['cells'], data['counts'], data['behavior']
+        except FileNotFoundError:
+            return None
+        dense = {'counts': np.zeros(TILE_BINS * TILE_BINS, dtype=np.uint32),
+                 'behavior': np.zeros((len(self.states), TILE_BINS * TILE_BINS), dtype=np.uint32)}
+        dense['counts'][cells] = counts
+        dense['behavior'][:, cells] = behavior
+        return {'counts': dense['counts'].reshape(TILE_BINS, TILE_BINS),
+                'behavior': dense['behavior'].reshape(-1, TILE_BINS, TILE_BINS)}
+
+    def exists(self, z: int, x: int, y: int) -> bool:
+        return os.path.exists(self._path(z, x, y))
+
+    def render(self, z: int, x: int, y: int, layer: str = 'density') -> Optional[bytes]:
+        """PNG of one tile (cached on disk until its counts or the zoom's peak change), or None for an empty tile."""
+        # Log scale against the busiest cell at this zoom, so neighbouring tiles use the same colours;
+        # the peak is part of the cache key, so a higher peak re-renders every tile on the new scale
+        peak = max(self.state()['peak'].get(str(z), 1), 1)
+        try:
+            with open(self._path(z, x, y, f'-{layer}-{peak}.png'), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        # Counts and peak from one moment: sync holds the same lock while it writes them
+        with self._lock():
+            peak = max(self.state()['peak'].get(str(z), 1), 1)
+            data = self.read(z, x, y)
+            version = os.stat(self._path(z, x, y)).st_mtime_ns if data is not None else None
+        if data is None:
+            return None
+        counts = data['counts'].astype(np.float64)
+        level = np.log1p(counts) / np.log1p(peak)
+        rgba = np.zeros((TILE_BINS, TILE_BINS, 4), dtype=np.uint8)
+        if layer == 'behavior':
+            dominant = data['behavior'].argmax(axis=0)
+            rgba[..., :3] = _BEHAVIOR_COLORS[dominant % len(_BEHAVIOR_COLORS)]
+            visible = data['behavior'].sum(axis=0) > 0
+        else:
+            stops = np.linspace(0, 1, len(_RAMP))
+            for c in range(3):
+                rgba[..., c] = np.interp(level, stops, _RAMP[:, c]).astype(np.uint8)
+            visible = counts > 0
+        rgba[..., 3] = np.where(visible, 96 + 159 * level, 0).astype(np.uint8)
+        scale = TILE_PIXELS // TILE_BINS
+        png = encode_png(np.repeat(np.repeat(rgba, scale, axis=0), scale, axis=1))
+        png_path = self._path(z, x, y, f'-{layer}-{peak}.png')
+        with self._lock():
+            # A sync that rewrote the tile meanwhile has made this rendering stale: serve it, don't cache it
+            try:
+                current = os.stat(self._path(z, x, y)).st_mtime_ns == version
+            except FileNotFoundError:
+                current = False
+            if current:
+                tmp = f"{png_path}.tmp.{os.getpid()}"
+                with open(tmp, 'wb') as f:
+                    f.write(png)
+                os.replace(tmp, png_path)
+        return png
+
+    def view(self, west: float, south: float, east: float, north: float, zoom: int,
+             max_tiles: int = MAX_TILES_PER_VIEW) -> Tuple[int, List[Tuple[int, int, int]]]:
+        """Non-empty tiles covering a bounding box, at the highest zoom <= `zoom` that needs at most `max_tiles` tiles."""
+        zoom = max(0, min(int(zoom), self.max_zoom))
+        while True:
+            (x0, x1), (y1, y0) = (v >> _BIN_BITS for v in mercator_cells(np.array([south, north]), np.array([west, east]), zoom))
+            x0, x1 = int(min(x0, x1)), int(max(x0, x1))
+            y0, y1 = int(min(y0, y1)), int(max(y0, y1))
+            if (x1 - x0 + 1) * (y1 - y0 + 1) <= max_tiles or zoom == 0:
+                break
+            zoom -= 1
+        tiles = [(zoom, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if self.exists(zoom, x, y)]
+        return zoom, tiles[:max_tiles]
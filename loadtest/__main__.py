@@ -0,0 +1,29 @@
+import argparse
+import json
+from loadtest.harness import TRAFFIC_MIXES, format_report, parse_mix, run_local
+
+parser = argparse.ArgumentParser(prog="python -m loadtest", description="Load-test a local API/dashboard node.")
+parser.add_argument("--viewers", type=int, default=100, help="concurrent HTTP viewers following --mix")
+parser.add_argument("--collars", type=int, default=0, help="collars uploading telemetry batches")
+parser.add_argument("--ws", type=int, default=0, help="dashboard WebSocket subscribers")
+parser.add_argument("--duration", type=float, default=30.0, help="seconds of steady load after the ramp")
+parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which clients start")
+parser.add_argument("--mix", default="dashboard", help=f"one of {sorted(TRAFFIC_MIXES)} or e.g. live=70,history=30")
+parser.add_argument("--think", type=float, default=1.0, help="mean seconds between a viewer's requests")
+parser.add_argument("--collar-interval", type=float, default=10.0, help="seconds between a collar's uploads")
+parser.add_argument("--workers", type=int, default=1, help="uvicorn workers per server")
+parser.add_argument("--animals", type=int, default=20, help="animals in the generated dataset")
+parser.add_argument("--user", default="admin:password", help="username:password the clients log in with")
+parser.add_argument("--rate-limits", default="off",
+                    help="server rate-limit policy, e.g. Admin=50:200 ('' for the defaults, 'off' to disable)")
+parser.add_argument("--json", help="also write the full report (histograms, status codes) to this file")
+args = parser.parse_args()
+
+report = run_local(viewers=args.viewers, collars=args.collars, ws_clients=args.ws, duration=args.duration,
+                   workers=args.workers, animals=args.animals, ramp=args.ramp, mix=parse_mix(args.mix),
+                   think=args.think, collar_interval=args.collar_interval,
+                   rate_limits=args.rate_limits, credentials=tuple(args.user.split(":", 1)))
+print(format_report(report))
+if args.json:
+    with open(args.json, "w") as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,369 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+from simulator.generator import TelemetrySimulator
+from simulator.fleet import FLEET_EPOCH, fleet_specs, save_fleet
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Weighted request mixes for HTTP viewers; collars and WebSocket viewers are sized separately
+TRAFFIC_MIXES = {
+    'dashboard': {'live': 80, 'history': 15, 'behavior': 5},
+    'analyst': {'live': 20, 'history': 50, 'behavior': 30},
+    'live': {'live': 100},
+}
+ENDPOINTS = {
+    'live': '/api/telemetry/live',
+    'history': '/api/telemetry/history',
+    'behavior': '/api/behavior/results',
+}
+# Upper edges (ms) of the latency histogram buckets
+HISTOGRAM_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, np.inf]
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """A named mix from TRAFFIC_MIXES or 'live=70,history=20,behavior=10'."""
+    if text in TRAFFIC_MIXES:
+        return TRAFFIC_MIXES[text]
+    mix = {}
+    for item in text.split(','):
+        name, weight = item.split('=')
+        if name.strip() not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}', choose from {sorted(ENDPOINTS)}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class LoadStats:
+    """Per-endpoint latencies, status counts and bytes, summarized at the end of a run."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.throttled: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.bytes: Dict[str, int] = {}
+
+    def record(self, endpoint: str, seconds: float, status, size: int = 0):
+        """`status` is an HTTP status code or an exception name."""
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        codes = self.statuses.setdefault(endpoint, {})
+        codes[str(status)] = codes.get(str(status), 0) + 1
+        if status == 429:
+            self.throttled[endpoint] = self.throttled.get(endpoint, 0) + 1
+        elif not isinstance(status, int) or status >= 400:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        self.bytes[endpoint] = self.bytes.get(endpoint, 0) + size
+
+    def summary(self, elapsed: float) -> Dict[str, Dict]:
+        result = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            ms = np.asarray(values) * 1000
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            counts = np.histogram(ms, bins=[0] + HISTOGRAM_MS)[0]
+            result[endpoint] = {
+                'requests': len(ms),
+                'throughput_rps': len(ms) / elapsed,
+                'errors': self.errors.get(endpoint, 0),
+                'error_rate': self.errors.get(endpoint, 0) / len(ms),
+                'throttled': self.throttled.get(endpoint, 0),
+                'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99), 'max_ms': float(ms.max()),
+                'histogram_ms': {f"<={edge:g}": int(c) for edge, c in zip(HISTOGRAM_MS, counts)},
+                'statuses': self.statuses.get(endpoint, {}),
+                'mb_received': self.bytes.get(endpoint, 0) / 1e6,
+            }
+        return result
+
+
+class ResourceMonitor:
+    """Samples CPU and RSS of a server process and its children from /proc."""
+
+    def __init__(self, pids: Sequence[int], interval: float = 0.5):
+        self.pids = list(pids)
+        self.interval = interval
+        self.samples: List[Tuple[float, float, int]] = []  # (wall time, cpu seconds, rss bytes)
+        self._task = None
+
+    @staticmethod
+    def _tree(roots: Sequence[int]) -> List[int]:
+        parents = {}
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as f:
+                        parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+        tree, frontier = set(roots), list(roots)
+        while frontier:
+            pid = frontier.pop()
+            children = [child for child, parent in parents.items() if parent == pid and child not in tree]
+            tree.update(children)
+            frontier.extend(children)
+        return sorted(tree)
+
+    def sample(self):
+        cpu, rss = 0.0, 0
+        ticks, page = os.sysconf('SC_CLK_TCK'), os.sysconf('SC_PAGE_SIZE')
+        for pid in self._tree(self.pids):
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                with open(f'/proc/{pid}/statm') as f:
+                    rss += int(f.read().split()[1]) * page
+            except (OSError, IndexError):
+                continue  # process exited between listing and reading
+            cpu += (int(fields[11]) + int(fields[12])) / ticks  # utime + stime
+        self.samples.append((time.monotonic(), cpu, rss))
+
+    async def _loop(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if os.path.isdir('/proc') and self.pids:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> Optional[Dict]:
+        if self._task is None:
+            return None
+        self._task.cancel()
+        self.sample()
+        if len(self.samples) < 2:
+            return None
+        t, cpu, rss = (np.asarray(v, dtype=np.float64) for v in zip(*self.samples))
+        busy = np.diff(cpu) / np.maximum(np.diff(t), 1e-9) * 100
+        return {
+            'processes': len(self._tree(self.pids)),
+            'cpu_percent_mean': float((cpu[-1] - cpu[0]) / max(t[-1] - t[0], 1e-9) * 100),
+            'cpu_percent_peak': float(busy.max()),
+            'rss_mb_peak': float(rss.max() / 1e6),
+            'rss_mb_end': float(rss[-1] / 1e6),
+        }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LocalServer:
+    """A uvicorn process serving `app` from `workdir` on a free local port."""
+
+    def __init__(self, app: str, workdir: str, workers: int = 1, port: Optional[int] = None, env: Optional[Dict] = None):
+        self.app = app
+        self.workdir = workdir
+        self.workers = workers
+        self.port = port or _free_port()
+        self.env = {**os.environ, 'PYTHONPATH': REPO_ROOT, **(env or {})}
+        self.proc = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', self.app, '--host', '127.0.0.1', '--port', str(self.port),
+             '--workers', str(self.workers), '--log-level', 'warning'],
+            cwd=self.workdir, env=self.env)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"{self.app} exited with code {self.proc.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.2).close()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.__exit__()
+        raise RuntimeError(f"{self.app} did not start listening on port {self.port}")
+
+    def __exit__(self, *exc):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+def prepare_workdir(workdir: str, animals: int = 20, duration: int = 3600, sampling_rate: float = 1.0,
+                    data_seed: int = 0) -> Tuple[float, float]:
+    """Simulated telemetry for the servers to read; returns its time range.
+
+    The dataset is seeded (simulator.fleet), so runs of different releases
+    are measured on identical data; its manifest is written next to it.
+    """
+    manifest = save_fleet(os.path.join(workdir, 'simulated_telemetry.csv'),
+                          fleet_specs(animals, duration, sampling_rate), seed=data_seed)
+    # The dashboard resolves templates and static files relative to its working directory
+    link = os.path.join(workdir, 'dashboard')
+    if not os.path.exists(link):
+        os.symlink(os.path.join(REPO_ROOT, 'dashboard'), link)
+    start = manifest['start_time']
+    return start, start + max(int(duration * sampling_rate) - 1, 0) / sampling_rate
+
+
+async def _login(client, stats: LoadStats, username: str, password: str) -> Optional[str]:
+    started = time.perf_counter()
+    try:
+        resp = await client.post('/api/token', data={'username': username, 'password': password})
+    except Exception as exc:
+        stats.record('token', time.perf_counter() - started, type(exc).__name__)
+        return None
+    stats.record('token', time.perf_counter() - started, resp.status_code, len(resp.content))
+    return resp.json()['access_token'] if resp.status_code == 200 else None
+
+
+async def _request(client, stats: LoadStats, endpoint: str, method: str, url: str, **kwargs):
+    started = time.perf_counter()
+    try:
+        resp = await client.request(method, url, **kwargs)
+    except Exception as exc:
+        stats.record(endpoint, time.perf_counter() - started, type(exc).__name__)
+        return
+    stats.record(endpoint, time.perf_counter() - started, resp.status_code, len(resp.content))
+
+
+async def _viewer(client, stats, deadline, rng, mix, think, time_range, credentials):
+    token = await _login(client, stats, *credentials)
+    if token is None:
+        return
+    headers = {'Authorization': f'Bearer {token}'}
+    names = list(mix)
+    weights = np.asarray([mix[n] for n in names], dtype=np.float64)
+    weights /= weights.sum()
+    while time.monotonic() < deadline:
+        name = names[rng.choice(len(names), p=weights)]
+        params = {}
+        if name == 'history':
+            # A random ten-minute playback window inside the data
+            start = rng.uniform(time_range[0], max(time_range[0], time_range[1] - 600))
+            params = {'start': start, 'end': start + 600}
+        await _request(client, stats, name, 'GET', ENDPOINTS[name], headers=headers, params=params)
+        await asyncio.sleep(rng.exponential(think))
+
+
+async def _collar(client, stats, deadline, rng, interval, batch_seconds, credentials, index):
+    token = await _login(client, stats, *credentials)
+    if token is None:
+        return
+    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+    df = TelemetrySimulator(species='deer', sampling_rate=1, duration=batch_seconds, animal_id=f"collar-{index}",
+                            seed=int(rng.integers(2 ** 63)), start_time=FLEET_EPOCH).generate_batch().to_frame()
+    body = json.dumps({'columns': {col: df[col].astype(str).tolist() if df[col].dtype == 'category' else df[col].tolist()
+                                   for col in df}})
+    await asyncio.sleep(rng.uniform(0, interval))  # spread uploads over the interval
+    while time.monotonic() < deadline:
+        await _request(client, stats, 'classify', 'POST', '/api/behavior/classify', headers=headers, content=body)
+        await asyncio.sleep(interval)
+
+
+async def _ws_viewer(url, stats, deadline):
+    import websockets
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(url, open_timeout=30) as ws:
+            stats.record('ws_connect', time.perf_counter() - started, 101)
+            while time.monotonic() < deadline:
+                waited = time.perf_counter()
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=max(deadline - time.monotonic(), 0.01))
+                except asyncio.TimeoutError:
+                    break
+                stats.record('ws_message', time.perf_counter() - waited, 200, len(message))
+    except Exception as exc:
+        stats.record('ws_connect', time.perf_counter() - started, type(exc).__name__)
+
+
+async def run_load(api_url: str, dashboard_url: Optional[str] = None, viewers: int = 100, collars: int = 0,
+                   ws_clients: int = 0, duration: float = 30.0, mix: Dict[str, float] = TRAFFIC_MIXES['dashboard'],
+                   think: float = 1.0, collar_interval: float = 10.0, collar_batch: int = 10,
+                   time_range: Tuple[float, float] = (0.0, 0.0), credentials: Tuple[str, str] = ('admin', 'password'),
+                   ramp: float = 5.0, server_pids: Sequence[int] = (), seed: int = 0, transport=None) -> Dict:
+    """Drive the API (and the dashboard WebSocket) with concurrent simulated clients.
+
+    Viewers log in, then loop over the request `mix` with exponential think
+    times; collars upload a `collar_batch`-second telemetry batch every
+    `collar_interval` seconds; WebSocket viewers stay subscribed to /ws/data.
+    Clients start spread over `ramp` seconds. `transport` replaces the
+    network, e.g. httpx.ASGITransport for an in-process app.
+    """
+    import httpx
+    if ws_clients and dashboard_url is None:
+        raise ValueError("ws_clients needs dashboard_url")
+    stats = LoadStats()
+    monitor = ResourceMonitor(server_pids)
+    limits = httpx.Limits(max_connections=max(viewers + collars, 1), max_keepalive_connections=max(viewers + collars, 1))
+    seeds = np.random.SeedSequence(seed).spawn(viewers + collars)
+    started = time.monotonic()
+    deadline = started + ramp + duration
+
+    async def delayed(coro_fn, delay, *args):
+        await asyncio.sleep(delay)
+        await coro_fn(*args)
+
+    async with httpx.AsyncClient(base_url=api_url, limits=limits, timeout=60.0, transport=transport) as client:
+        monitor.start()
+        tasks = []
+        for i in range(viewers):
+            rng = np.random.default_rng(seeds[i])
+            tasks.append(delayed(_viewer, rng.uniform(0, ramp), client, stats, deadline, rng, mix, think, time_range, credentials))
+        for i in range(collars):
+            rng = np.random.default_rng(seeds[viewers + i])
+            tasks.append(delayed(_collar, rng.uniform(0, ramp), client, stats, deadline, rng, collar_interval,
+                                 collar_batch, credentials, i))
+        ws_url = dashboard_url.replace('http', 'ws', 1) + '/ws/data' if dashboard_url else None
+        tasks += [delayed(_ws_viewer, ramp * i / max(ws_clients, 1), ws_url, stats, deadline) for i in range(ws_clients)]
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+        resources = await monitor.stop()
+    return {
+        'config': {'viewers': viewers, 'collars': collars, 'ws_clients': ws_clients, 'duration': duration,
+                   'ramp': ramp, 'mix': mix, 'think': think, 'collar_interval': collar_interval},
+        'elapsed': elapsed,
+        'endpoints': stats.summary(elapsed),
+        'server': resources,
+    }
+
+
+def format_report(report: Dict) -> str:
+    lines = [f"{'endpoint':<12}{'requests':>10}{'rps':>9}{'err%':>7}{'429':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"]
+    for name, s in report['endpoints'].items():
+        lines.append(f"{name:<12}{s['requests']:>10}{s['throughput_rps']:>9.1f}{s['error_rate'] * 100:>7.2f}{s['throttled']:>6}"
+                     f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}")
+    server = report.get('server')
+    if server:
+        lines.append(f"server: {server['processes']} processes, cpu {server['cpu_percent_mean']:.0f}% mean / "
+                     f"{server['cpu_percent_peak']:.0f}% peak, rss {server['rss_mb_peak']:.0f} MB peak")
+    return "\n".join(lines)
+
+
+def run_local(viewers: int = 100, collars: int = 0, ws_clients: int = 0, duration: float = 30.0, workers: int = 1,
+              animals: int = 20, data_seconds: int = 3600, workdir: Optional[str] = None,
+              rate_limits: str = 'off', **kwargs) -> Dict:
+    """Generate data, start the API (and dashboard when `ws_clients`) under uvicorn and run the load.
+
+    All clients log in as the same user, so per-user rate limiting is off
+    unless `rate_limits` gives a policy (see api.limits.parse_limits; ''
+    for the server defaults).
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='wmp-loadtest-')
+    time_range = prepare_workdir(workdir, animals=animals, duration=data_seconds)
+    with LocalServer('api.main:app', workdir, workers=workers, env={'WMP_RATE_LIMITS': rate_limits}) as api:
+        pids = [api.proc.pid]
+        if ws_clients:
+            with LocalServer('dashboard.app:app', workdir, workers=workers) as dashboard:
+                return asyncio.run(run_load(api.url, dashboard.url, viewers, collars, ws_clients, duration,
+                                            time_range=time_range, server_pids=pids + [dashboard.proc.pid], **kwargs))
+        return asyncio.run(run_load(api.url, None, viewers, collars, 0, duration,
+                                    time_range=time_range, server_pids=pids, **kwargs))
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+from typing import Optional
+from simulator.records import BurstBatch, BURST_AXES, BURST_CATEGORICAL_COLUMNS
+from processor.preprocessing import DEFAULT_MAX_GAP, clean_and_normalize, extract_features
+
+
+def burst_features(bursts: BurstBatch) -> pd.DataFrame:
+    """One row of accelerometer summary features per burst, stamped at the burst midpoint.
+
+    Every feature is a reduction over the sample axis of the (bursts, samples,
+    axes) block: per-axis mean/std, mean magnitude (accel_mag), ODBA/VeDBA
+    (dynamic body acceleration after removing the burst's static component)
+    and the dominant frequency of the magnitude signal.
+    """
+    a = bursts.samples.astype(np.float64)
+    dynamic = a - a.mean(axis=1, keepdims=True)
+    mag = np.sqrt((a ** 2).sum(axis=2))
+    data = {'timestamp': bursts.start + (bursts.burst_length - 1) / (2 * bursts.rate)}
+    for col in BURST_CATEGORICAL_COLUMNS:
+        data[col] = pd.Categorical.from_codes(bursts.codes[col], categories=bursts.categories[col])
+    for k, axis in enumerate(BURST_AXES):
+        data[f'{axis}_mean'] = a[:, :, k].mean(axis=1)
+        data[f'{axis}_std'] = a[:, :, k].std(axis=1)
+    data['accel_mag'] = mag.mean(axis=1)
+    data['odba'] = np.abs(dynamic).sum(axis=2).mean(axis=1)
+    data['vedba'] = np.sqrt((dynamic ** 2).sum(axis=2)).mean(axis=1)
+    if bursts.burst_length > 1:
+        spectrum = np.abs(np.fft.rfft(mag - mag.mean(axis=1, keepdims=True), axis=1))
+        freqs = np.fft.rfftfreq(bursts.burst_length, d=1.0 / bursts.rate)
+        data['dominant_freq'] = freqs[spectrum[:, 1:].argmax(axis=1) + 1] if len(freqs) > 1 else 0.0
+    else:
+        data['dominant_freq'] = np.zeros(len(bursts))
+    return pd.DataFrame(data)
+
+
+def join_bursts_to_fixes(fixes: pd.DataFrame, features: pd.DataFrame, tolerance: Optional[float] = None) -> pd.DataFrame:
+    """Attach the nearest GPS fix of the same animal to every burst (sorted merge, no cross join).
+
+    The fix's own time is kept as `fix_timestamp`; bursts with no fix within
+    `tolerance` seconds get NaN fix columns.
+    """
+    key = 'animal_id' if 'animal_id' in features and 'animal_id' in fixes else None
+    right = fixes.drop(columns=[c for c in fixes if c in features and c not in ('timestamp', key)])
+    right = right.assign(fix_timestamp=right['timestamp'])
+    left = features.assign(_burst=np.arange(len(features)))
+    if key:
+        # merge_asof needs identical key dtypes; categoricals from two sources rarely share categories
+        left = left.assign(**{key: left[key].astype(str)})
+        right = right.assign(**{key: right[key].astype(str)})
+    left = left.sort_values('timestamp', kind='stable')
+    right = right.sort_values('timestamp', kind='stable')
+    joined = pd.merge_asof(left, right, on='timestamp', by=key, direction='nearest', tolerance=tolerance)
+    return joined.sort_values('_burst').drop(columns='_burst').reset_index(drop=True)
+
+
+def preprocess_dual_rate(fixes: pd.DataFrame, bursts: BurstBatch, max_gap: float = DEFAULT_MAX_GAP,
+                         tolerance: Optional[float] = None) -> pd.DataFrame:
+    """Fix-rate features (speed, heading, temp_trend) joined onto per-burst accelerometer features."""
+    fixes = extract_features(clean_and_normalize(fixes, max_gap=max_gap))
+    return join_bursts_to_fixes(fixes, burst_features(bursts), tolerance=tolerance)
@@ -0,0 +1,97 @@
+import fcntl
+import hashlib
+import json
+import os
+import uuid
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+from processor.preprocessing import TELEMETRY_DTYPES
+
+CACHE_DIR = os.environ.get("WMP_FEATURE_CACHE", ".feature_cache")
+CACHE_MAX_BYTES = int(os.environ.get("WMP_FEATURE_CACHE_BYTES", 2 * 1024**3))
+# Bump when feature extraction changes so stale entries are never served. The
+# declared ingest dtypes are part of the key as well, so a schema change
+# invalidates entries without a bump.
+CACHE_VERSION = 2
+_SCHEMA = {col: np.dtype(dtype).name if dtype != 'category' else dtype for col, dtype in TELEMETRY_DTYPES.items()}
+
+
+class FeatureCache:
+    """On-disk cache of preprocessed feature frames, keyed by input identity and parameters.
+
+    Entries are Parquet files written to a temporary name and renamed into
+    place, so concurrent workers never read a partial file. Reads refresh the
+    file mtime, which eviction uses as the LRU clock.
+    """
+
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def key(self, filepath: str, params: Dict) -> str:
+        st = os.stat(filepath)
+        identity = {
+            "path": os.path.abspath(filepath),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "inode": st.st_ino,
+            "params": params,
+            "version": CACHE_VERSION,
+            "schema": _SCHEMA,
+        }
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.parquet")
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        path = self._path(key)
+        try:
+            df = pd.read_parquet(path)
+            os.utime(path)
+            return df
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+
+    def put(self, key: str, df: pd.DataFrame):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(key)
+        tmp = os.path.join(self.root, f".{key}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        try:
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        with open(os.path.join(self.root, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            for name in os.listdir(self.root):
+                if name.endswith(".parquet"):
+                    try:
+                        st = os.stat(os.path.join(self.root, name))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def get_or_compute(self, filepath: str, params: Dict, compute) -> pd.DataFrame:
+        key = self.key(filepath, params)
+        df = self.get(key)
+        if df is None:
+            df = compute()
+            self.put(key, df)
+        return df
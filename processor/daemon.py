@@ -0,0 +1,239 @@
+import fcntl
+import glob
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+import pandas as pd
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from classifier.behavior_model import RuleBasedClassifier
+from processor.preprocessing import TELEMETRY_DTYPES, _apply_dtypes, fit_scaling, preprocess_by_animal, read_csv_chunks
+
+# Shared store layout:
+#   <store>/checkpoint.json                       per-source committed byte offset, claims and finished segments
+#   <store>/features/<source>-<start>-<end>.parquet  features + behavior of one file segment
+#   <store>/quarantine/<source>-<start>-<end>.csv     raw lines of a segment that failed to process
+# A segment is a byte range of whole CSV lines. Workers claim segments under
+# a lock with a lease, write their output under a name derived from the
+# range (so a retry overwrites instead of duplicating) and then commit.
+# Sensor columns are scaled with statistics fitted once per source over the
+# data present when it is first seen, and each segment is preprocessed with
+# a few lines of context around it, so labels do not depend on where the
+# segment boundaries fall.
+STORE_PATH = os.environ.get("WMP_PROCESSOR_STORE", "processed")
+SEGMENT_BYTES = 8 * 1024 * 1024
+LEASE_SECONDS = 300.0
+POLL_SECONDS = 1.0
+CONTEXT_LINES = 8  # whole lines read on each side of a segment, so speeds and smoothing see across its edges
+CONTEXT_BYTES = 64 * 1024
+
+
+def _write_json(path: str, data: dict):
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class ProcessorDaemon:
+    """Resident processor: tails CSV files and turns new lines into feature files, exactly once per segment."""
+
+    def __init__(self, store: str = STORE_PATH, inbox: Optional[str] = None, tail: Optional[List[str]] = None,
+                 segment_bytes: int = SEGMENT_BYTES, lease: float = LEASE_SECONDS, poll: float = POLL_SECONDS):
+        self.store = store
+        self.inbox = inbox
+        self.tail = list(tail or [])
+        self.segment_bytes = segment_bytes
+        self.lease = lease
+        self.poll = poll
+        self.owner = f"{os.uname().nodename}:{os.getpid()}"
+        self.classifier = RuleBasedClassifier()
+
+    # --- checkpoint ---
+    @contextmanager
+    def _state(self):
+        """Checkpoint dict, locked across processes; changes are saved on exit."""
+        os.makedirs(self.store, exist_ok=True)
+        with open(os.path.join(self.store, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            path = os.path.join(self.store, 'checkpoint.json')
+            state = {'sources': {}}
+            if os.path.exists(path):
+                with open(path) as f:
+                    state = json.load(f)
+            yield state
+            _write_json(path, state)
+
+    def sources(self) -> List[str]:
+        paths = [p for p in self.tail if os.path.exists(p)]
+        if self.inbox and os.path.isdir(self.inbox):
+            paths += sorted(glob.glob(os.path.join(self.inbox, '*.csv')))
+        return paths
+
+    @staticmethod
+    def _identity(path: str):
+        """(source id, header bytes); the id changes when the file is replaced or rewritten."""
+        with open(path, 'rb') as f:
+            header = f.readline()
+            first = f.readline()
+        if not header.endswith(b'\n') or not first.endswith(b'\n'):
+            return None, None  # nothing complete to process yet
+        st = os.stat(path)
+        digest = hashlib.sha1(f"{os.path.abspath(path)}:{st.st_ino}".encode() + header + first).hexdigest()[:16]
+        return digest, header
+
+    def _segment_end(self, path: str, start: int, size: int) -> int:
+        # Extend the read until it ends on a newline; a trailing partial line waits for the writer
+        length = self.segment_bytes
+        with open(path, 'rb') as f:
+            while True:
+                f.seek(start)
+                data = f.read(min(length, size - start))
+                cut = data.rfind(b'\n')
+                if cut >= 0:
+                    return start + cut + 1
+                if start + length >= size:
+                    return start
+                length *= 2
+
+    # --- claiming ---
+    def claim(self) -> Optional[Dict]:
+        """Reserve the next unprocessed segment (or one whose lease expired) for this worker."""
+        now = time.time()
+        with self._state() as state:
+            for path in self.sources():
+                key, header = self._identity(path)
+                if key is None:
+                    continue
+                src = state['sources'].setdefault(key, {
+                    'path': path, 'header': header.decode(), 'committed': len(header), 'next': len(header),
+                    'claims': {}, 'done': []})
+                if 'scaling' not in src:
+                    src['scaling'] = fit_scaling(read_csv_chunks(path))
+                for start, claim in sorted(src['claims'].items(), key=lambda item: int(item[0])):
+                    if claim['expires'] < now:
+                        claim.update(owner=self.owner, expires=now + self.lease)
+                        return {'source': key, 'path': path, 'header': src['header'], 'start': int(start), 'end': claim['end'],
+                                'scaling': src['scaling']}
+                size = os.path.getsize(path)
+                if size <= src['next']:
+                    continue
+                start = src['next']
+                end = self._segment_end(path, start, size)
+                if end <= start:
+                    continue
+                src['next'] = end
+                src['claims'][str(start)] = {'end': end, 'owner': self.owner, 'expires': now + self.lease}
+                return {'source': key, 'path': path, 'header': src['header'], 'start': start, 'end': end,
+                        'scaling': src['scaling']}
+        return None
+
+    def commit(self, segment: Dict):
+        """Mark a segment done and advance the contiguous committed offset of its source."""
+        with self._state() as state:
+            src = state['sources'][segment['source']]
+            src['claims'].pop(str(segment['start']), None)
+            if segment['end'] <= src['committed'] or [segment['start'], segment['end']] in src['done']:
+                return  # a worker whose lease had expired finished the same segment first
+            done = sorted(src['done'] + [[segment['start'], segment['end']]])
+            while done and done[0][0] == src['committed']:
+                src['committed'] = done.pop(0)[1]
+            src['done'] = done
+
+    # --- processing ---
+    def output_path(self, segment: Dict, kind: str = 'features', ext: str = 'parquet') -> str:
+        return os.path.join(self.store, kind, f"{segment['source']}-{segment['start']:012d}-{segment['end']:012d}.{ext}")
+
+    @staticmethod
+    def _read(segment: Dict, context: int = 0) -> Tuple[bytes, bytes, bytes]:
+        """(up to `context` whole lines before the segment, its lines, up to `context` whole lines after it)."""
+        body = len(segment['header'].encode())
+        lo = max(body, segment['start'] - CONTEXT_BYTES) if context else segment['start']
+        with open(segment['path'], 'rb') as f:
+            f.seek(lo)
+            before = f.read(segment['start'] - lo)
+            data = f.read(segment['end'] - segment['start'])
+            after = f.read(CONTEXT_BYTES) if context else b''
+        before = before.splitlines(keepends=True)[1 if lo > body else 0:]  # the first may be cut
+        after = [line for line in after.splitlines(keepends=True) if line.endswith(b'\n')]
+        return b''.join(before[-context:] if context else []), data, b''.join(after[:context])
+
+    def process(self, segment: Dict) -> int:
+        """Preprocess and classify one segment; the output file appears atomically."""
+        header = segment['header'].encode()
+        text = {c: str for c in segment['header'].strip().split(',') if c in TELEMETRY_DTYPES}
+        parts = [pd.read_csv(io.BytesIO(header + block), dtype=text, on_bad_lines='skip').assign(_context=i != 1)
+                 for i, block in enumerate(self._read(segment, CONTEXT_LINES))]
+        # Same row checks as ingest_data: lines whose numbers do not parse are dropped, not fatal
+        df = _apply_dtypes(pd.concat(parts, ignore_index=True))
+        if len(df):
+            df = preprocess_by_animal(df, scaling=segment.get('scaling'))
+            df['behavior'] = self.classifier.predict(df)
+        df = df[~df['_context']].drop(columns='_context').reset_index(drop=True)
+        path = self.output_path(segment)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp.{os.getpid()}"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        return len(df)
+
+    def quarantine(self, segment: Dict, error: Exception):
+        """Set a segment that failed to process aside (raw lines plus the error) so the source moves on."""
+        path = self.output_path(segment, kind='quarantine', ext='csv')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp.{os.getpid()}"
+        with open(tmp, 'wb') as f:
+            f.write(segment['header'].encode() + self._read(segment)[1])
+        os.replace(tmp, path)
+        with self._state() as state:
+            quarantined = state['sources'][segment['source']].setdefault('quarantined', [])
+            if all(q['start'] != segment['start'] for q in quarantined):
+                quarantined.append({'start': segment['start'], 'end': segment['end'], 'error': f"{type(error).__name__}: {error}"})
+
+    def run_once(self) -> bool:
+        """Process one segment if any is available; returns whether work was done."""
+        segment = self.claim()
+        if segment is None:
+            return False
+        try:
+            self.process(segment)
+        except Exception as exc:
+            # A segment that cannot be processed would otherwise kill every worker that retries it
+            self.quarantine(segment, exc)
+        self.commit(segment)
+        return True
+
+    def run_worker(self, stop=None):
+        self.owner = f"{os.uname().nodename}:{os.getpid()}"
+        while stop is None or not stop.is_set():
+            if not self.run_once():
+                time.sleep(self.poll)
+
+    def run(self, workers: int = 1):
+        """Run `workers` processes until interrupted; they coordinate only through the checkpoint."""
+        if workers <= 1:
+            return self.run_worker()
+        procs = [multiprocessing.Process(target=self.run_worker, daemon=True) for _ in range(workers)]
+        for p in procs:
+            p.start()
+        try:
+            for p in procs:
+                p.join()
+        except KeyboardInterrupt:
+            for p in procs:
+                p.terminate()
+
+
+def read_processed(store: str = STORE_PATH) -> pd.DataFrame:
+    """All processed segments in source and offset order."""
+    files = sorted(glob.glob(os.path.join(store, 'features', '*.parquet')))
+    return pd.concat([pd.read_parquet(f) for f in files], ignore_index=True) if files else pd.DataFrame()
+
+
+if __name__ == "__main__":
+    tail = [p for p in os.environ.get("WMP_PROCESSOR_TAIL", "simulated_telemetry.csv").split(",") if p]
+    daemon = ProcessorDaemon(inbox=os.environ.get("WMP_PROCESSOR_INBOX", "inbox"), tail=tail)
+    daemon.run(workers=int(os.environ.get("WMP_PROCESSOR_WORKERS", 1)))
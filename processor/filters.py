@@ -0,0 +1,120 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# Blocks smaller than this are filtered on the calling thread
+PARALLEL_MIN_ROWS = 200_000
+FILTER_WORKERS = int(os.environ.get("WMP_FILTER_WORKERS", os.cpu_count() or 1))
+
+
+def _moving_average(block: np.ndarray, bounds: np.ndarray, window: int) -> np.ndarray:
+    # Centered window like pandas rolling(window, min_periods=1, center=True), clipped to each segment
+    n = len(block)
+    before, after = window // 2, window - 1 - window // 2
+    csum = np.zeros((n + 1, block.shape[1]), dtype=np.float64, order='F')
+    np.cumsum(block, axis=0, out=csum[1:])
+    out = np.empty_like(csum[1:])
+    if n >= window:
+        # Full windows by slicing; only rows near a segment edge need the clipped formula below
+        np.subtract(csum[window:], csum[:-window], out=out[before:n - after])
+        out[before:n - after] /= window
+    # Row i averages [i - before, i + after], which straddles edge b for i in [b - after, b + before)
+    edge = (bounds[:, None] + np.arange(-after, before)).ravel()
+    edge = np.unique(edge[(edge >= 0) & (edge < n)])
+    if len(edge):
+        seg = np.searchsorted(bounds, edge, side='right') - 1
+        lo = np.maximum(edge - before, bounds[seg])
+        hi = np.minimum(edge + after + 1, bounds[seg + 1])
+        out[edge] = (csum[hi] - csum[lo]) / (hi - lo)[:, None]
+    return out
+
+
+def _savgol(segment: np.ndarray, window: int, polyorder: int = 2) -> np.ndarray:
+    from scipy.signal import savgol_filter
+    window = min(window, len(segment))
+    if window % 2 == 0:
+        window -= 1
+    if window <= polyorder:
+        return segment  # too few samples to smooth
+    return savgol_filter(segment, window_length=window, polyorder=polyorder, axis=0)
+
+
+def _butterworth(segment: np.ndarray, window: int, cutoff: float = 0.1, order: int = 4) -> np.ndarray:
+    """Zero-phase low-pass; `cutoff` is a fraction of the Nyquist frequency (`window` is unused)."""
+    from scipy.signal import butter, sosfiltfilt
+    sos = butter(order, cutoff, output='sos')
+    padlen = min(3 * (2 * len(sos) + 1), len(segment) - 1)
+    if padlen < 1:
+        return segment
+    return sosfiltfilt(sos, segment, axis=0, padlen=padlen)
+
+
+def _median(segment: np.ndarray, window: int) -> np.ndarray:
+    from scipy.ndimage import median_filter
+    return median_filter(segment, size=(window, 1), mode='nearest')
+
+
+# Per-segment kernels: f(segment, window, **params) -> filtered segment, all along axis 0
+KERNELS: Dict[str, Callable] = {
+    'savgol': _savgol,
+    'butterworth': _butterworth,
+    'median': _median,
+}
+KERNEL_NAMES = ['moving_average', *KERNELS]
+
+
+def segment_bounds(segments: Optional[np.ndarray], n: int) -> np.ndarray:
+    """Start offsets of runs of equal segment id, plus n; one run when segments is None."""
+    if segments is None or n == 0:
+        return np.array([0, n], dtype=np.int64)
+    change = np.flatnonzero(segments[1:] != segments[:-1]) + 1
+    return np.concatenate([[0], change, [n]]).astype(np.int64)
+
+
+def _filter_rows(block: np.ndarray, bounds: np.ndarray, kernel: str, window: int, params: Dict) -> np.ndarray:
+    if kernel == 'moving_average':
+        return _moving_average(block, bounds, window)
+    func = KERNELS[kernel]
+    out = np.empty_like(block)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        out[start:end] = func(block[start:end], window, **params)
+    return out
+
+
+def apply_filter(block: np.ndarray, kernel: str = 'moving_average', window: int = 5,
+                 segments: Optional[np.ndarray] = None, workers: Optional[int] = None, **params) -> np.ndarray:
+    """Filter every column of a 2-D (rows, channels) block along time.
+
+    Rows must be in time order within each run of equal `segments` id; no
+    kernel reaches across a run boundary. Large blocks are split into chunks
+    filtered on a thread pool (NumPy/SciPy release the GIL); the result does
+    not depend on the number of workers.
+    """
+    if kernel not in KERNEL_NAMES:
+        raise ValueError(f"Unknown filter kernel {kernel!r}: choose one of {', '.join(KERNEL_NAMES)}")
+    block = np.asarray(block, dtype=np.float64)
+    if block.ndim == 1:
+        return apply_filter(block[:, None], kernel, window, segments, workers, **params)[:, 0]
+    n = len(block)
+    bounds = segment_bounds(segments, n)
+    workers = workers or FILTER_WORKERS
+    if workers <= 1 or n < PARALLEL_MIN_ROWS:
+        return _filter_rows(block, bounds, kernel, window, params)
+    if kernel == 'butterworth':
+        # IIR responses never die out, so only cut at segment boundaries
+        cuts, halo = bounds[np.searchsorted(bounds, np.linspace(0, n, workers + 1)[1:-1])], 0
+    else:
+        # Finite kernels: equal chunks, each filtered with `window` extra rows on both sides
+        cuts, halo = np.linspace(0, n, workers + 1)[1:-1].astype(np.int64), window
+    edges = np.unique(np.concatenate([[0], cuts, [n]]))
+    out = np.empty_like(block)
+
+    def run(start, end):
+        lo, hi = max(start - halo, 0), min(end + halo, n)
+        local = np.unique(np.concatenate([[lo, hi], bounds[(bounds > lo) & (bounds < hi)]])) - lo
+        out[start:end] = _filter_rows(block[lo:hi], local, kernel, window, params)[start - lo:end - lo]
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wmp-filter") as pool:
+        list(pool.map(run, edges[:-1], edges[1:]))
+    return out
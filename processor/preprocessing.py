@@ -1,51 +1,277 @@
 import pandas as pd
 import numpy as np
-from scipy.signal import savgol_filter
+from typing import Dict, Iterable, Optional, Tuple
+from simulator.records import NUMERIC_COLUMNS, CATEGORICAL_COLUMNS
+from processor.filters import apply_filter
 
-def ingest_data(filepath: str) -> pd.DataFrame:
-    """Read telemetry data from CSV."""
-    df = pd.read_csv(filepath)
+# Known telemetry columns: float64 for time and coordinates, float32 sensors, categorical strings
+TELEMETRY_DTYPES = {**NUMERIC_COLUMNS, **{col: 'category' for col in CATEGORICAL_COLUMNS}}
+
+def _read_csv_arrow(filepath: str, columns, numeric_as_text: bool = False) -> pd.DataFrame:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    types = {col: pa.dictionary(pa.int32(), pa.string()) if TELEMETRY_DTYPES[col] == 'category'
+             else pa.string() if numeric_as_text
+             else pa.from_numpy_dtype(np.dtype(TELEMETRY_DTYPES[col]))
+             for col in columns if col in TELEMETRY_DTYPES}
+    table = pacsv.read_csv(
+        filepath,
+        read_options=pacsv.ReadOptions(use_threads=True),
+        # Rows with the wrong number of fields are dropped while parsing
+        parse_options=pacsv.ParseOptions(invalid_row_handler=lambda row: 'skip'),
+        convert_options=pacsv.ConvertOptions(column_types=types),
+    )
+    return table.to_pandas()
+
+def _read_csv_lenient(filepath: str, columns) -> pd.DataFrame:
+    # Slow path: parse numeric columns as text and drop rows whose values do not convert
+    numeric = [col for col in columns if col in NUMERIC_COLUMNS]
+    try:
+        df = _read_csv_arrow(filepath, columns, numeric_as_text=True)
+    except ImportError:
+        df = pd.read_csv(filepath, dtype={col: str for col in numeric}, on_bad_lines='skip')
+    return _apply_dtypes(df)
+
+def _apply_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    # Convert text columns to the declared dtypes, dropping rows whose numbers do not parse
+    columns = df.columns
+    numeric = [col for col in columns if col in NUMERIC_COLUMNS]
+    bad = np.zeros(len(df), dtype=bool)
+    for col in numeric:
+        values = pd.to_numeric(df[col], errors='coerce')
+        bad |= values.isna().to_numpy() & df[col].notna().to_numpy()
+        df[col] = values.astype(NUMERIC_COLUMNS[col])
+    df = df[~bad].reset_index(drop=True)
+    for col in columns:
+        if col in CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype('category')
     return df
 
-def clean_and_normalize(df: pd.DataFrame) -> pd.DataFrame:
-    """Clean missing values and normalize sensor columns."""
+def read_csv_chunks(filepath: str, chunksize: int = 1_000_000):
+    """Yield a large telemetry CSV in chunks with the same declared dtypes and row checks as ingest_data.
+
+    Known columns are streamed as text and cast per chunk; a chunk with a
+    value that does not convert takes the lenient path, which drops those
+    rows instead of failing the whole file.
+    """
+    columns = pd.read_csv(filepath, nrows=0).columns
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        text = {col: str for col in columns if col in TELEMETRY_DTYPES}
+        for chunk in pd.read_csv(filepath, chunksize=chunksize, dtype=text, on_bad_lines='skip'):
+            yield _apply_dtypes(chunk)
+        return
+    reader = pacsv.open_csv(
+        filepath,
+        parse_options=pacsv.ParseOptions(invalid_row_handler=lambda row: 'skip'),
+        convert_options=pacsv.ConvertOptions(column_types={col: pa.string() for col in columns if col in TELEMETRY_DTYPES},
+                                             strings_can_be_null=True),
+    )
+    batches, rows = [], 0
+    for batch in reader:
+        batches.append(batch)
+        rows += batch.num_rows
+        if rows >= chunksize:
+            yield _cast_chunk(pa.Table.from_batches(batches))
+            batches, rows = [], 0
+    if rows:
+        yield _cast_chunk(pa.Table.from_batches(batches))
+
+def _cast_chunk(table) -> pd.DataFrame:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    try:
+        for i, name in enumerate(table.column_names):
+            if name in NUMERIC_COLUMNS:
+                table = table.set_column(i, name, pc.cast(table[name], pa.from_numpy_dtype(np.dtype(NUMERIC_COLUMNS[name]))))
+            elif name in CATEGORICAL_COLUMNS:
+                table = table.set_column(i, name, pc.dictionary_encode(table[name]))
+    except pa.ArrowInvalid:
+        return _apply_dtypes(table.to_pandas())
+    return table.to_pandas()
+
+def ingest_data(filepath: str) -> pd.DataFrame:
+    """Read telemetry data from CSV with the declared column dtypes.
+
+    Uses the multithreaded pyarrow CSV reader when available; malformed rows are skipped.
+    """
+    columns = pd.read_csv(filepath, nrows=0).columns
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return _read_csv_lenient(filepath, columns)
+    try:
+        return _read_csv_arrow(filepath, columns)
+    except pa.ArrowInvalid:
+        # Some value does not convert to its declared type
+        return _read_csv_lenient(filepath, columns)
+
+def ingest_to_archive(filepath: str, archive_path: str = 'telemetry_archive', chunksize: int = 1_000_000,
+                      rollup_path: Optional[str] = 'telemetry_rollups') -> int:
+    """Append a telemetry CSV to the binary archive (and rollups) in chunks; returns rows written."""
+    from storage.archive import TelemetryArchive
+    from storage.rollups import RollupStore
+    archive = TelemetryArchive(archive_path)
+    rollups = RollupStore(rollup_path) if rollup_path else None
+    rows = 0
+    for chunk in read_csv_chunks(filepath, chunksize=chunksize):
+        # Rollups first: rows marked rolled up must really be in them, or expiry would lose them
+        if rollups is not None:
+            rollups.update(chunk)
+        archive.append(chunk, rolled_up=rollups is not None)
+        rows += len(chunk)
+    return rows
+
+# A collar silent for longer than this starts a new track segment (seconds)
+DEFAULT_MAX_GAP = 600.0
+SENSOR_COLS = ['accel_x', 'accel_y', 'accel_z', 'gyro_x', 'gyro_y', 'gyro_z', 'temperature']
+
+def _track_order(df: pd.DataFrame, max_gap: float):
+    """Row order by (animal, time), sorted timestamps and the segment id of each sorted row."""
+    n = len(df)
+    ts = df['timestamp'].to_numpy(dtype=np.float64) if 'timestamp' in df else np.arange(n, dtype=np.float64)
+    key = 'animal_id' if 'animal_id' in df else 'species' if 'species' in df else None
+    animals = pd.factorize(df[key])[0] if key else np.zeros(n, dtype=np.int64)
+    order = np.lexsort((ts, animals))
+    t, a = ts[order], animals[order]
+    new = np.ones(n, dtype=bool)
+    new[1:] = (a[1:] != a[:-1]) | (np.diff(t) > max_gap)
+    return order, t, np.cumsum(new) - 1
+
+def segment_tracks(df: pd.DataFrame, max_gap: float = DEFAULT_MAX_GAP) -> np.ndarray:
+    """Segment id per row; a segment ends when the animal changes or the collar is silent > max_gap."""
+    order, _, seg_sorted = _track_order(df, max_gap)
+    seg = np.empty(len(df), dtype=np.int64)
+    seg[order] = seg_sorted
+    return seg
+
+def _fill_within_segments(x: np.ndarray, t: np.ndarray, seg: np.ndarray, max_gap: float) -> np.ndarray:
+    """Fill NaNs of a time-sorted column without crossing segment boundaries.
+
+    Interior holes spanning at most max_gap are interpolated linearly in time,
+    longer holes and segment edges hold the nearest valid value of the
+    segment, and only segments without any valid value use the column mean.
+    Work is proportional to the number of missing values.
+    """
+    missing = np.flatnonzero(np.isnan(x))
+    good = np.flatnonzero(~np.isnan(x))
+    if len(missing) == 0:
+        return x
+    x = x.copy()
+    if len(good) == 0:
+        return x
+    pos = np.searchsorted(good, missing)
+    p = good[np.clip(pos - 1, 0, len(good) - 1)]
+    q = good[np.clip(pos, 0, len(good) - 1)]
+    has_prev = (pos > 0) & (seg[p] == seg[missing])
+    has_next = (pos < len(good)) & (seg[q] == seg[missing])
+    tp, tq, tm = t[p], t[q], t[missing]
+    inner = has_prev & has_next & (tq - tp <= max_gap)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = np.where(tq > tp, (tm - tp) / (tq - tp), 0.0)
+    use_prev = has_prev & (~has_next | (tm - tp <= tq - tm))
+    values = np.where(inner, x[p] + (x[q] - x[p]) * w, np.where(use_prev, x[p], x[q]))
+    values[~(has_prev | has_next)] = x[good].mean()
+    x[missing] = values
+    return x
+
+def clean_and_normalize(df: pd.DataFrame, max_gap: float = DEFAULT_MAX_GAP,
+                        scaling: Optional[Dict[str, Tuple[float, float]]] = None) -> pd.DataFrame:
+    """Clean missing values per track segment and normalize sensor columns.
+
+    Sensor columns are z-scored with the frame's own mean and std, or with
+    the fixed (mean, std) pairs in `scaling` (see fit_scaling), so that
+    pieces of one file get the same scale as the whole. Adds a `segment_id`
+    column; see segment_tracks and _fill_within_segments.
+    """
     df = df.copy()
-    # Fill missing values with interpolation or mean
-    df.interpolate(method='linear', inplace=True)
-    df.fillna(df.mean(numeric_only=True), inplace=True)
-    # Normalize sensor columns
-    sensor_cols = ['accel_x', 'accel_y', 'accel_z', 'gyro_x', 'gyro_y', 'gyro_z', 'temperature']
-    for col in sensor_cols:
-        if col in df:
-            mean = df[col].mean()
-            std = df[col].std()
+    if 'timestamp' in df and df['timestamp'].isna().any():
+        df['timestamp'] = df['timestamp'].interpolate(limit_direction='both')
+    order, t, seg = _track_order(df, max_gap)
+    in_order = bool(np.all(order[1:] > order[:-1]))
+    for col in df.select_dtypes('number').columns:
+        if col in ('timestamp', 'segment_id'):
+            continue
+        values = df[col].to_numpy()
+        dtype = values.dtype if values.dtype.kind == 'f' else np.float64
+        if np.isnan(values.astype(np.float64, copy=False)).any():
+            sorted_values = values.astype(np.float64) if in_order else values.astype(np.float64)[order]
+            filled = _fill_within_segments(sorted_values, t, seg, max_gap)
+            values = np.empty_like(filled)
+            values[order] = filled
+        # Normalize sensor columns (z-score, sample std like pandas)
+        if col in SENSOR_COLS and (col in scaling if scaling is not None else len(values) > 1):
+            values = values.astype(np.float64)
+            mean, std = scaling[col] if scaling is not None else (values.mean(), values.std(ddof=1))
             if std > 0:
-                df[col] = (df[col] - mean) / std
+                values = (values - mean) / std
+        df[col] = values.astype(dtype, copy=False)
+    segment_id = np.empty(len(df), dtype=np.int64)
+    segment_id[order] = seg
+    df['segment_id'] = segment_id
+    return df
+
+def _smooth(df: pd.DataFrame, columns, kernel: str, window: int, workers: Optional[int] = None, **params) -> np.ndarray:
+    """Filter the given columns as one 2-D block per track segment; returns rows in frame order."""
+    block = np.empty((len(df), len(columns)), dtype=np.float64, order='F')  # column-major: filters run down columns
+    for j, col in enumerate(columns):
+        block[:, j] = df[col].to_numpy()
+    order, segments = None, None
+    if 'segment_id' in df:
+        seg = df['segment_id'].to_numpy()
+        order = np.lexsort((df['timestamp'].to_numpy(dtype=np.float64), seg)) if 'timestamp' in df else np.argsort(seg, kind='stable')
+        if np.all(order[1:] > order[:-1]):
+            order, segments = None, seg
+        else:
+            block, segments = block[order], seg[order]
+    out = apply_filter(block, kernel, window, segments=segments, workers=workers, **params)
+    if order is not None:
+        restored = np.empty_like(out)
+        restored[order] = out
+        out = restored
+    return out
+
+def filter_sensors(df: pd.DataFrame, kernel: str = 'moving_average', window: int = 5,
+                   workers: Optional[int] = None, **params) -> pd.DataFrame:
+    """Smooth sensor columns with a kernel from processor.filters, never across track segments."""
+    df = df.copy(deep=False)  # only replaced columns are written; copy-on-write protects the caller
+    cols = [col for col in SENSOR_COLS if col in df]
+    if cols and len(df):
+        out = _smooth(df, cols, kernel, window, workers, **params)
+        for j, col in enumerate(cols):
+            dtype = df[col].dtype if df[col].dtype.kind == 'f' else np.float64
+            df[col] = out[:, j].astype(dtype, copy=False)
     return df
 
 def moving_average_filter(df: pd.DataFrame, window: int = 5) -> pd.DataFrame:
     """Apply moving average filter to sensor columns."""
-    df = df.copy()
-    sensor_cols = ['accel_x', 'accel_y', 'accel_z', 'gyro_x', 'gyro_y', 'gyro_z', 'temperature']
-    for col in sensor_cols:
-        if col in df:
-            df[col] = df[col].rolling(window, min_periods=1, center=True).mean()
-    return df
+    return filter_sensors(df, 'moving_average', window)
+
+def haversine_distance(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in meters between coordinate arrays (degrees)."""
+    lat1, lon1, lat2, lon2 = (np.deg2rad(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat2) * np.cos(lat1) * np.sin((lon2 - lon1)/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    R = 6371000  # Earth radius in meters
+    return R * c
 
 def extract_features(df: pd.DataFrame) -> pd.DataFrame:
     """Extract features: speed, heading, acceleration magnitude, temperature trend."""
     df = df.copy()
     # Speed (meters/second) from GPS
     if 'latitude' in df and 'longitude' in df and 'timestamp' in df:
-        lat = np.deg2rad(df['latitude'].values)
-        lon = np.deg2rad(df['longitude'].values)
-        dlat = np.diff(lat, prepend=lat[0])
-        dlon = np.diff(lon, prepend=lon[0])
-        a = np.sin(dlat/2)**2 + np.cos(lat) * np.cos(np.roll(lat, 1)) * np.sin(dlon/2)**2
-        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
-        R = 6371000  # Earth radius in meters
-        dist = R * c
-        dt = np.diff(df['timestamp'], prepend=df['timestamp'][0])
+        lat = df['latitude'].values
+        lon = df['longitude'].values
+        dist = haversine_distance(np.roll(lat, 1), np.roll(lon, 1), lat, lon)
+        dist[:1] = 0
+        if 'segment_id' in df:
+            # No movement is inferred across a collar dropout
+            seg = df['segment_id'].to_numpy()
+            dist[1:][seg[1:] != seg[:-1]] = 0
+        ts = df['timestamp'].to_numpy(dtype=np.float64)
+        dt = np.diff(ts, prepend=ts[:1])
         dt[dt == 0] = 1e-6  # avoid division by zero
         speed = dist / dt
         df['speed'] = speed
@@ -57,17 +283,62 @@ def extract_features(df: pd.DataFrame) -> pd.DataFrame:
         df['accel_mag'] = np.sqrt(df['accel_x']**2 + df['accel_y']**2 + df['accel_z']**2)
     # Temperature trend (smoothed)
     if 'temperature' in df:
-        df['temp_trend'] = savgol_filter(df['temperature'], window_length=5 if len(df) >= 5 else len(df)//2*2+1, polyorder=2)
+        df['temp_trend'] = _smooth(df, ['temperature'], 'savgol', 5, polyorder=2)[:, 0] if len(df) else df['temperature']
     return df
 
-def preprocess(filepath: str) -> pd.DataFrame:
-    """Full preprocessing pipeline: ingest, clean, filter, feature extraction."""
-    df = ingest_data(filepath)
-    df = clean_and_normalize(df)
-    df = moving_average_filter(df)
+def fit_scaling(chunks: Iterable[pd.DataFrame]) -> Dict[str, Tuple[float, float]]:
+    """Mean and sample std of each sensor column over a stream of raw chunks, for clean_and_normalize(scaling=...)."""
+    stats = {}  # column -> (count, mean, sum of squared deviations), merged chunk by chunk
+    for chunk in chunks:
+        for col in SENSOR_COLS:
+            if col not in chunk:
+                continue
+            values = chunk[col].to_numpy(dtype=np.float64)
+            values = values[~np.isnan(values)]
+            if not len(values):
+                continue
+            n, mean, m2 = len(values), values.mean(), ((values - values.mean()) ** 2).sum()
+            if col in stats:
+                n0, mean0, m20 = stats[col]
+                delta = mean - mean0
+                n, mean, m2 = n0 + n, mean0 + delta * n / (n0 + n), m20 + m2 + delta ** 2 * n0 * n / (n0 + n)
+            stats[col] = (n, mean, m2)
+    return {col: (float(mean), float(np.sqrt(m2 / (n - 1)))) for col, (n, mean, m2) in stats.items() if n > 1}
+
+def preprocess_frame(df: pd.DataFrame, window: int = 5, max_gap: float = DEFAULT_MAX_GAP,
+                     kernel: str = 'moving_average',
+                     scaling: Optional[Dict[str, Tuple[float, float]]] = None) -> pd.DataFrame:
+    """Clean, filter and extract features from an already loaded telemetry frame."""
+    df = clean_and_normalize(df, max_gap=max_gap, scaling=scaling)
+    df = filter_sensors(df, kernel=kernel, window=window)
     df = extract_features(df)
     return df
 
+def preprocess_by_animal(df: pd.DataFrame, scaling: Optional[Dict[str, Tuple[float, float]]] = None) -> pd.DataFrame:
+    """Run preprocess_frame per animal so tracks from different collars never mix; keeps row order."""
+    key = 'animal_id' if 'animal_id' in df else 'species' if 'species' in df else None
+    if key is None or df[key].nunique() <= 1:
+        return preprocess_frame(df, scaling=scaling)
+    parts = [preprocess_frame(group, scaling=scaling) for _, group in df.groupby(key, sort=False, observed=True)]
+    return pd.concat(parts).loc[df.index]
+
+def iter_preprocessed_chunks(filepath: str, chunksize: int = 1_000_000):
+    """Yield preprocessed chunks of a large telemetry CSV without loading it whole."""
+    for chunk in read_csv_chunks(filepath, chunksize=chunksize):
+        yield preprocess_by_animal(chunk)
+
+def preprocess(filepath: str, window: int = 5, max_gap: float = DEFAULT_MAX_GAP, kernel: str = 'moving_average',
+               cache=None) -> pd.DataFrame:
+    """Full preprocessing pipeline: ingest, clean, filter, feature extraction.
+
+    Pass a processor.cache.FeatureCache to reuse features of an unchanged file.
+    """
+    if cache is not None:
+        params = {'window': window, 'max_gap': max_gap, 'kernel': kernel}
+        return cache.get_or_compute(filepath, params, lambda: preprocess(filepath, window, max_gap, kernel))
+    df = ingest_data(filepath)
+    return preprocess_frame(df, window=window, max_gap=max_gap, kernel=kernel)
+
 # Example usage
 if __name__ == "__main__":
     df = preprocess('simulated_telemetry.csv')
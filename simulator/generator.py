@@ -1,36 +1,64 @@
 import numpy as np
 import pandas as pd
 import time
-import random
-from typing import Generator, Optional
+from typing import Dict, Generator, Optional, Union
+from simulator.records import TelemetryRecord, TelemetryBatch, BurstBatch, BURST_AXES
+
+VIRTUAL_EPOCH = 1_700_000_000.0  # default start of seeded runs, so they do not depend on the day they ran
 
 class TelemetrySimulator:
+    """Synthetic collar telemetry for one animal.
+
+    All randomness comes from a numpy Generator seeded from `seed` (an int
+    or a SeedSequence, e.g. one child of SeedSequence.spawn), and it is
+    re-seeded on every run, so the same seed gives the same data. Timestamps
+    are virtual: `start_time` plus the sample index over the sampling rate,
+    never read from the clock while generating; a seeded run starts at
+    VIRTUAL_EPOCH unless given a start time, an unseeded one at the current
+    time. Without a seed, fresh entropy is drawn and can be read back from
+    `seed_info()`.
+    """
+
     def __init__(self, 
                  species: str = 'deer',
                  movement_mode: str = 'walk',
                  sampling_rate: float = 1.0,  # Hz
                  duration: int = 60,  # seconds
                  start_lat: float = 45.0,
-                 start_lon: float = -75.0):
+                 start_lon: float = -75.0,
+                 animal_id: Optional[str] = None,
+                 seed: Union[int, np.random.SeedSequence, None] = None,
+                 start_time: Optional[float] = None):
         self.species = species
+        self.animal_id = animal_id or f"{species}-1"
         self.movement_mode = movement_mode
         self.sampling_rate = sampling_rate
         self.duration = duration
         self.start_lat = start_lat
         self.start_lon = start_lon
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        if start_time is None:
+            start_time = time.time() if seed is None else VIRTUAL_EPOCH
+        self.start_time = float(start_time)
         self.reset()
 
     def reset(self):
         self.current_lat = self.start_lat
         self.current_lon = self.start_lon
         self.current_time = 0
+        self.rng = np.random.default_rng(self.seed_sequence)
+
+    def seed_info(self) -> Dict:
+        """What reproduces this run: seed entropy, spawn key and virtual start time."""
+        return {'entropy': self.seed_sequence.entropy, 'spawn_key': list(self.seed_sequence.spawn_key),
+                'start_time': self.start_time}
 
     def _simulate_gps(self):
         # Movement step size (meters) by mode
         step_dict = {'rest': 0.1, 'walk': 1.0, 'run': 5.0, 'fly': 10.0}
         step = step_dict.get(self.movement_mode, 1.0)
         # Random bearing
-        bearing = np.deg2rad(random.uniform(0, 360))
+        bearing = np.deg2rad(self.rng.uniform(0, 360))
         # Approximate conversion: 1 deg lat ~ 111km, 1 deg lon ~ 111km * cos(lat)
         dlat = (step / 111_000) * np.cos(bearing)
         dlon = (step / (111_000 * np.cos(np.deg2rad(self.current_lat)))) * np.sin(bearing)
@@ -41,28 +69,28 @@ class TelemetrySimulator:
     def _simulate_accelerometer(self):
         # Simulate 3-axis acceleration (m/s^2)
         base = {'rest': 0.01, 'walk': 0.2, 'run': 1.0, 'fly': 2.0}
-        noise = np.random.normal(0, 0.05, 3)
+        noise = self.rng.normal(0, 0.05, 3)
         mag = base.get(self.movement_mode, 0.2)
-        return (mag + noise).tolist()
+        return mag + noise
 
     def _simulate_gyroscope(self):
         # Simulate 3-axis angular velocity (deg/s)
         base = {'rest': 0.01, 'walk': 1.0, 'run': 5.0, 'fly': 10.0}
-        noise = np.random.normal(0, 0.1, 3)
+        noise = self.rng.normal(0, 0.1, 3)
         mag = base.get(self.movement_mode, 1.0)
-        return (mag + noise).tolist()
+        return mag + noise
 
     def _simulate_compass(self):
         # Simulate compass heading (degrees)
-        return random.uniform(0, 360)
+        return self.rng.uniform(0, 360)
 
     def _simulate_temperature(self):
         # Simulate temperature (Celsius) by species
         base_temp = {'deer': 38.5, 'wolf': 39.0, 'eagle': 41.0}
-        temp = base_temp.get(self.species, 38.5) + np.random.normal(0, 0.5)
+        temp = base_temp.get(self.species, 38.5) + self.rng.normal(0, 0.5)
         return temp
 
-    def generate(self) -> Generator[dict, None, None]:
+    def generate_records(self) -> Generator[TelemetryRecord, None, None]:
         self.reset()
         n_samples = int(self.duration * self.sampling_rate)
         interval = 1.0 / self.sampling_rate
@@ -72,38 +100,122 @@ class TelemetrySimulator:
             gyro = self._simulate_gyroscope()
             compass = self._simulate_compass()
             temp = self._simulate_temperature()
-            data = {
-                'timestamp': time.time(),
-                'species': self.species,
-                'movement_mode': self.movement_mode,
-                'latitude': lat,
-                'longitude': lon,
-                'accel_x': accel[0],
-                'accel_y': accel[1],
-                'accel_z': accel[2],
-                'gyro_x': gyro[0],
-                'gyro_y': gyro[1],
-                'gyro_z': gyro[2],
-                'compass': compass,
-                'temperature': temp
-            }
-            yield data
+            yield TelemetryRecord(self.start_time + i * interval, self.animal_id, self.species, self.movement_mode, lat, lon,
+                                  accel[0], accel[1], accel[2], gyro[0], gyro[1], gyro[2], compass, temp)
             time.sleep(interval)
 
+    def generate(self) -> Generator[dict, None, None]:
+        for record in self.generate_records():
+            yield record.to_dict()
+
+    def generate_batch(self) -> TelemetryBatch:
+        """Generate the whole run at once as a struct-of-arrays batch (no real-time pacing)."""
+        self.reset()
+        n = int(self.duration * self.sampling_rate)
+        interval = 1.0 / self.sampling_rate
+        batch = TelemetryBatch.empty(n, {'animal_id': [self.animal_id], 'species': [self.species],
+                                         'movement_mode': [self.movement_mode]})
+        cols = batch.columns
+        cols['timestamp'][:] = self.start_time + np.arange(n) * interval
+        # GPS random walk: same step model as _simulate_gps, accumulated with cumsum
+        step_dict = {'rest': 0.1, 'walk': 1.0, 'run': 5.0, 'fly': 10.0}
+        step = step_dict.get(self.movement_mode, 1.0)
+        bearing = np.deg2rad(self.rng.uniform(0, 360, n))
+        lat = self.start_lat + np.cumsum((step / 111_000) * np.cos(bearing))
+        prev_lat = np.concatenate(([self.start_lat], lat[:-1]))
+        lon = self.start_lon + np.cumsum((step / (111_000 * np.cos(np.deg2rad(prev_lat)))) * np.sin(bearing))
+        cols['latitude'][:] = lat
+        cols['longitude'][:] = lon
+        accel_base = {'rest': 0.01, 'walk': 0.2, 'run': 1.0, 'fly': 2.0}.get(self.movement_mode, 0.2)
+        gyro_base = {'rest': 0.01, 'walk': 1.0, 'run': 5.0, 'fly': 10.0}.get(self.movement_mode, 1.0)
+        for axis in 'xyz':
+            cols[f'accel_{axis}'][:] = accel_base + self.rng.normal(0, 0.05, n)
+            cols[f'gyro_{axis}'][:] = gyro_base + self.rng.normal(0, 0.1, n)
+        cols['compass'][:] = self.rng.uniform(0, 360, n)
+        base_temp = {'deer': 38.5, 'wolf': 39.0, 'eagle': 41.0}
+        cols['temperature'][:] = base_temp.get(self.species, 38.5) + self.rng.normal(0, 0.5, n)
+        if n:
+            self.current_lat, self.current_lon = lat[-1], lon[-1]
+        return batch
+
+    def generate_dual_rate(self, gps_interval: float = 300.0, burst_rate: float = 40.0,
+                           burst_seconds: float = 10.0, burst_interval: float = 60.0):
+        """Generate the run as separate streams like a real collar.
+
+        Returns (fixes, bursts): a DataFrame with one GPS fix (plus compass and
+        temperature) every `gps_interval` seconds, and a BurstBatch with a
+        `burst_seconds` accelerometer burst at `burst_rate` Hz every
+        `burst_interval` seconds.
+        """
+        self.reset()
+        t0 = self.start_time
+        n_fix = int(self.duration // gps_interval) + 1
+        step = {'rest': 0.1, 'walk': 1.0, 'run': 5.0, 'fly': 10.0}.get(self.movement_mode, 1.0) * gps_interval
+        bearing = np.deg2rad(self.rng.uniform(0, 360, n_fix))
+        dist = np.concatenate(([0.0], np.full(n_fix - 1, step)))
+        lat = self.start_lat + np.cumsum((dist / 111_000) * np.cos(bearing))
+        prev_lat = np.concatenate(([self.start_lat], lat[:-1]))
+        lon = self.start_lon + np.cumsum((dist / (111_000 * np.cos(np.deg2rad(prev_lat)))) * np.sin(bearing))
+        base_temp = {'deer': 38.5, 'wolf': 39.0, 'eagle': 41.0}
+        fixes = pd.DataFrame({
+            'timestamp': t0 + np.arange(n_fix) * gps_interval,
+            'animal_id': pd.Categorical([self.animal_id] * n_fix),
+            'species': pd.Categorical([self.species] * n_fix),
+            'movement_mode': pd.Categorical([self.movement_mode] * n_fix),
+            'latitude': lat,
+            'longitude': lon,
+            'compass': self.rng.uniform(0, 360, n_fix).astype(np.float32),
+            'temperature': (base_temp.get(self.species, 38.5) + self.rng.normal(0, 0.5, n_fix)).astype(np.float32),
+        })
+        n_burst = int(self.duration // burst_interval) + 1
+        length = int(round(burst_seconds * burst_rate))
+        bursts = BurstBatch.empty(n_burst, length, burst_rate,
+                                  {'animal_id': [self.animal_id], 'species': [self.species]})
+        bursts.start[:] = t0 + np.arange(n_burst) * burst_interval
+        # Gait oscillation on top of the mode's baseline, as (burst, sample, axis) in one shot
+        accel_base = {'rest': 0.01, 'walk': 0.2, 'run': 1.0, 'fly': 2.0}.get(self.movement_mode, 0.2)
+        gait_hz = {'rest': 0.0, 'walk': 1.5, 'run': 3.0, 'fly': 5.0}.get(self.movement_mode, 1.5)
+        t = np.arange(length) / burst_rate
+        phase = self.rng.uniform(0, 2 * np.pi, (n_burst, 1, len(BURST_AXES)))
+        bursts.samples[:] = (accel_base + 0.5 * accel_base * np.sin(2 * np.pi * gait_hz * t[None, :, None] + phase)
+                             + self.rng.normal(0, 0.05, bursts.samples.shape))
+        if n_fix:
+            self.current_lat, self.current_lon = lat[-1], lon[-1]
+        return fixes, bursts
+
+    def save_dual_rate(self, fixes_path: str, bursts_path: str, **kwargs):
+        fixes, bursts = self.generate_dual_rate(**kwargs)
+        fixes.to_csv(fixes_path, index=False)
+        bursts.save(bursts_path)
+
     def save_to_csv(self, filename: str):
-        records = list(self.generate())
-        df = pd.DataFrame(records)
+        df = self.generate_batch().to_frame()
         df.to_csv(filename, index=False)
 
-    def stream(self, method: str = 'mqtt', topic: str = 'wildlife/telemetry', host: str = 'localhost', port: int = 1883):
+    def save_to_archive(self, path: str = 'telemetry_archive'):
+        from storage.archive import TelemetryArchive
+        TelemetryArchive(path).append(self.generate_batch())
+
+    def encoded_packets(self, batch_seconds: float = 60.0):
+        """Yield the run as codec-encoded packets of `batch_seconds` each, as a collar would uplink them."""
+        from storage.codec import encode_batch
+        batch = self.generate_batch()
+        per_packet = max(1, int(batch_seconds * self.sampling_rate))
+        for start in range(0, len(batch), per_packet):
+            yield encode_batch(TelemetryBatch({col: v[start:start + per_packet] for col, v in batch.columns.items()},
+                                              batch.categories))
+
+    def stream(self, method: str = 'mqtt', topic: str = 'wildlife/telemetry', host: str = 'localhost', port: int = 1883,
+               batch_seconds: float = 60.0):
         # Placeholder for streaming via MQTT or WebSocket
         # In production, use paho-mqtt or websockets libraries
         print(f"[STREAM] Simulating {method.upper()} stream to {host}:{port} on topic '{topic}'...")
-        for data in self.generate():
-            print(f"[STREAM] {data}")
+        # Packets are delta/varint encoded (storage.codec), several times smaller than JSON records
+        for packet in self.encoded_packets(batch_seconds):
+            print(f"[STREAM] packet of {len(packet)} bytes")
             # Here, you would publish to MQTT/WebSocket
-            # e.g., mqtt_client.publish(topic, json.dumps(data))
-            # or websocket.send(json.dumps(data))
+            # e.g., mqtt_client.publish(topic, packet)
+            # or await websocket.send(packet)
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,259 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List, Optional
+
+# Column order and storage dtypes of a telemetry sample. GPS fixes and
+# timestamps need float64 precision, the IMU/compass/temperature channels
+# are fine as float32.
+NUMERIC_COLUMNS = {
+    'timestamp': np.float64,
+    'latitude': np.float64,
+    'longitude': np.float64,
+    'accel_x': np.float32,
+    'accel_y': np.float32,
+    'accel_z': np.float32,
+    'gyro_x': np.float32,
+    'gyro_y': np.float32,
+    'gyro_z': np.float32,
+    'compass': np.float32,
+    'temperature': np.float32,
+}
+# String columns stored as small integer codes into a per-batch category table
+CATEGORICAL_COLUMNS = ['animal_id', 'species', 'movement_mode']
+TELEMETRY_COLUMNS = ['timestamp', 'animal_id', 'species', 'movement_mode', 'latitude', 'longitude',
+                     'accel_x', 'accel_y', 'accel_z', 'gyro_x', 'gyro_y', 'gyro_z', 'compass', 'temperature']
+CODE_DTYPE = np.int16
+NULL_CODE = -1  # code of a missing value, as in pandas.Categorical; never an index into the table
+
+# Structured dtype for a single packed record (categoricals as codes)
+RECORD_DTYPE = np.dtype([(col, CODE_DTYPE) if col in CATEGORICAL_COLUMNS else (col, NUMERIC_COLUMNS[col])
+                         for col in TELEMETRY_COLUMNS])
+
+
+def remap_codes(codes: np.ndarray, categories: List[str], table: List[str]) -> np.ndarray:
+    """Re-express codes into `categories` as codes into `table`; NULL_CODE stays missing."""
+    # NULL_CODE is -1, so it picks the NULL_CODE appended at the end
+    remap = np.array([table.index(c) for c in categories] + [NULL_CODE], dtype=CODE_DTYPE)
+    return remap[codes]
+
+
+class TelemetryRecord:
+    """Single telemetry sample with fixed attributes instead of a per-sample dict."""
+    __slots__ = tuple(TELEMETRY_COLUMNS)
+
+    def __init__(self, timestamp, animal_id, species, movement_mode, latitude, longitude,
+                 accel_x, accel_y, accel_z, gyro_x, gyro_y, gyro_z, compass, temperature):
+        self.timestamp = timestamp
+        self.animal_id = animal_id
+        self.species = species
+        self.movement_mode = movement_mode
+        self.latitude = latitude
+        self.longitude = longitude
+        self.accel_x = accel_x
+        self.accel_y = accel_y
+        self.accel_z = accel_z
+        self.gyro_x = gyro_x
+        self.gyro_y = gyro_y
+        self.gyro_z = gyro_z
+        self.compass = compass
+        self.temperature = temperature
+
+    def to_dict(self) -> Dict:
+        return {col: getattr(self, col) for col in TELEMETRY_COLUMNS}
+
+    def __repr__(self):
+        return f"TelemetryRecord({self.to_dict()})"
+
+
+class TelemetryBatch:
+    """Struct-of-arrays container: one NumPy array per column, categoricals as codes."""
+
+    def __init__(self, columns: Dict[str, np.ndarray], categories: Dict[str, List[str]]):
+        self.columns = columns
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.columns['timestamp'])
+
+    def __getitem__(self, i: int) -> TelemetryRecord:
+        values = {}
+        for col in TELEMETRY_COLUMNS:
+            if col in CATEGORICAL_COLUMNS:
+                code = self.columns[col][i]
+                values[col] = None if code == NULL_CODE else self.categories[col][code]
+            else:
+                values[col] = self.columns[col][i].item()
+        return TelemetryRecord(**values)
+
+    @classmethod
+    def empty(cls, n: int, categories: Optional[Dict[str, List[str]]] = None) -> 'TelemetryBatch':
+        columns = {col: np.zeros(n, dtype=CODE_DTYPE) if col in CATEGORICAL_COLUMNS else np.zeros(n, dtype=NUMERIC_COLUMNS[col])
+                   for col in TELEMETRY_COLUMNS}
+        categories = {col: list((categories or {}).get(col, [])) for col in CATEGORICAL_COLUMNS}
+        return cls(columns, categories)
+
+    @classmethod
+    def from_records(cls, records: Iterable[TelemetryRecord]) -> 'TelemetryBatch':
+        records = list(records)
+        batch = cls.empty(len(records))
+        lookup = {col: {} for col in CATEGORICAL_COLUMNS}
+        for col in TELEMETRY_COLUMNS:
+            values = [getattr(r, col) for r in records]
+            if col in CATEGORICAL_COLUMNS:
+                codes = lookup[col]
+                for v in values:
+                    if v not in codes:
+                        codes[v] = len(codes)
+                batch.columns[col][:] = [codes[v] for v in values]
+                batch.categories[col] = list(codes)
+            else:
+                batch.columns[col][:] = values
+        return batch
+
+    @classmethod
+    def from_structured(cls, arr: np.ndarray, categories: Dict[str, List[str]]) -> 'TelemetryBatch':
+        return cls({col: arr[col] for col in TELEMETRY_COLUMNS}, {col: list(categories[col]) for col in CATEGORICAL_COLUMNS})
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'TelemetryBatch':
+        columns, categories = {}, {}
+        for col in TELEMETRY_COLUMNS:
+            if col not in df:
+                # Older files predate animal_id; fall back to one animal per species
+                values = (df['species'].astype(str) + '-1') if col == 'animal_id' and 'species' in df else None
+                if col in CATEGORICAL_COLUMNS:
+                    cat = pd.Categorical(values if values is not None else ['unknown'] * len(df))
+                    columns[col] = cat.codes.astype(CODE_DTYPE, copy=False)
+                    categories[col] = [str(c) for c in cat.categories]
+                else:
+                    columns[col] = np.full(len(df), np.nan, dtype=NUMERIC_COLUMNS[col])
+                continue
+            if col in CATEGORICAL_COLUMNS:
+                cat = pd.Categorical(df[col])  # missing values get pandas' code -1, i.e. NULL_CODE
+                columns[col] = cat.codes.astype(CODE_DTYPE, copy=False)
+                categories[col] = [str(c) for c in cat.categories]
+            else:
+                columns[col] = np.asarray(df[col], dtype=NUMERIC_COLUMNS[col])
+        return cls(columns, categories)
+
+    @classmethod
+    def concat(cls, batches: List['TelemetryBatch']) -> 'TelemetryBatch':
+        """Concatenate batches, remapping category codes onto a merged table."""
+        categories = {col: [] for col in CATEGORICAL_COLUMNS}
+        for b in batches:
+            for col in CATEGORICAL_COLUMNS:
+                for c in b.categories[col]:
+                    if c not in categories[col]:
+                        categories[col].append(c)
+        columns = {}
+        for col in TELEMETRY_COLUMNS:
+            parts = []
+            for b in batches:
+                values = b.columns[col]
+                if col in CATEGORICAL_COLUMNS:
+                    values = remap_codes(values, b.categories[col], categories[col])
+                parts.append(values)
+            columns[col] = np.concatenate(parts) if parts else cls.empty(0).columns[col]
+        return cls(columns, categories)
+
+    def to_structured(self) -> np.ndarray:
+        """Pack into a NumPy structured array of RECORD_DTYPE (one copy)."""
+        arr = np.empty(len(self), dtype=RECORD_DTYPE)
+        for col in TELEMETRY_COLUMNS:
+            arr[col] = self.columns[col]
+        return arr
+
+    def to_frame(self) -> pd.DataFrame:
+        """Build a DataFrame backed by the batch arrays without copying them."""
+        data = {}
+        for col in TELEMETRY_COLUMNS:
+            if col in CATEGORICAL_COLUMNS:
+                data[col] = pd.Categorical.from_codes(self.columns[col], categories=self.categories[col])
+            else:
+                data[col] = self.columns[col]
+        return pd.DataFrame(data, columns=TELEMETRY_COLUMNS, copy=False)
+
+
+# Per-burst metadata of the high-rate accelerometer stream; samples live in one 3-D array
+BURST_AXES = ['accel_x', 'accel_y', 'accel_z']
+BURST_CATEGORICAL_COLUMNS = ['animal_id', 'species']
+
+
+class BurstBatch:
+    """Fixed-length accelerometer bursts recorded at `rate` Hz.
+
+    `samples[b, i, k]` is sample i of burst b on axis BURST_AXES[k]; `start[b]`
+    is the burst's first timestamp. All bursts share one contiguous float32
+    array, so GPS columns are never repeated at IMU rate.
+    """
+
+    def __init__(self, start: np.ndarray, samples: np.ndarray, rate: float,
+                 codes: Dict[str, np.ndarray], categories: Dict[str, List[str]]):
+        self.start = np.asarray(start, dtype=np.float64)
+        self.samples = np.ascontiguousarray(samples, dtype=np.float32)
+        self.rate = float(rate)
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.start)
+
+    @property
+    def burst_length(self) -> int:
+        return self.samples.shape[1]
+
+    @classmethod
+    def empty(cls, n: int, burst_length: int, rate: float,
+              categories: Optional[Dict[str, List[str]]] = None) -> 'BurstBatch':
+        codes = {col: np.zeros(n, dtype=CODE_DTYPE) for col in BURST_CATEGORICAL_COLUMNS}
+        categories = {col: list((categories or {}).get(col, [])) for col in BURST_CATEGORICAL_COLUMNS}
+        return cls(np.zeros(n), np.zeros((n, burst_length, len(BURST_AXES)), dtype=np.float32), rate, codes, categories)
+
+    def labels(self, col: str) -> np.ndarray:
+        """Decoded per-burst values of a categorical column."""
+        return np.asarray(self.categories[col], dtype=object)[self.codes[col]] if len(self) else np.empty(0, dtype=object)
+
+    def timestamps(self) -> np.ndarray:
+        """(bursts, samples) timestamp of every sample."""
+        return self.start[:, None] + np.arange(self.burst_length) / self.rate
+
+    @classmethod
+    def concat(cls, batches: List['BurstBatch']) -> 'BurstBatch':
+        """Concatenate bursts of equal length and rate, remapping category codes."""
+        categories = {col: [] for col in BURST_CATEGORICAL_COLUMNS}
+        for b in batches:
+            for col in BURST_CATEGORICAL_COLUMNS:
+                for c in b.categories[col]:
+                    if c not in categories[col]:
+                        categories[col].append(c)
+        codes = {}
+        for col in BURST_CATEGORICAL_COLUMNS:
+            parts = []
+            for b in batches:
+                remap = np.array([categories[col].index(c) for c in b.categories[col]] or [0], dtype=CODE_DTYPE)
+                parts.append(remap[b.codes[col]])
+            codes[col] = np.concatenate(parts)
+        return cls(np.concatenate([b.start for b in batches]), np.concatenate([b.samples for b in batches]),
+                   batches[0].rate, codes, categories)
+
+    def to_frame(self) -> pd.DataFrame:
+        """One row per sample (long format); only for export, this is the exploded layout."""
+        n, length = len(self), self.burst_length
+        data = {'timestamp': self.timestamps().ravel(), 'burst': np.repeat(np.arange(n), length)}
+        for col in BURST_CATEGORICAL_COLUMNS:
+            data[col] = pd.Categorical.from_codes(np.repeat(self.codes[col], length), categories=self.categories[col])
+        for k, axis in enumerate(BURST_AXES):
+            data[axis] = self.samples[:, :, k].ravel()
+        return pd.DataFrame(data)
+
+    def save(self, path: str):
+        np.savez(path, start=self.start, samples=self.samples, rate=self.rate,
+                 **{f'{col}_codes': self.codes[col] for col in BURST_CATEGORICAL_COLUMNS},
+                 **{f'{col}_categories': np.asarray(self.categories[col], dtype=str) for col in BURST_CATEGORICAL_COLUMNS})
+
+    @classmethod
+    def load(cls, path: str) -> 'BurstBatch':
+        data = np.load(path, allow_pickle=False)
+        return cls(data['start'], data['samples'], float(data['rate']),
+                   {col: data[f'{col}_codes'] for col in BURST_CATEGORICAL_COLUMNS},
+                   {col: [str(c) for c in data[f'{col}_categories']] for col in BURST_CATEGORICAL_COLUMNS})
@@ -0,0 +1,307 @@
+import fcntl
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Union
+from simulator.records import (TelemetryBatch, TELEMETRY_COLUMNS, CATEGORICAL_COLUMNS,
+                               NUMERIC_COLUMNS, CODE_DTYPE, remap_codes)
+
+# Binary telemetry archive layout:
+#   <root>/meta.json                 global category tables for the code columns
+#   <root>/part-000000/<col>.bin     one fixed-width column file per telemetry column
+#   <root>/part-000000/index.bin     sparse time index: timestamp of every INDEX_STRIDE-th row
+#   <root>/part-000000/part.json     committed row count, time bounds and rolled_up flag of the partition
+# Rows inside a partition are sorted by timestamp. Writers only ever append;
+# part.json is rewritten last, so bytes past its row count are uncommitted.
+# `rolled_up` marks partitions whose rows were also folded into the rollups
+# when written; a partition never mixes rows with and without it, so
+# maintenance knows which rows to aggregate before expiring them.
+# Maintenance rewrites partitions by staging a new one whose part.json lists
+# the partitions it `replaces`; those are hidden from the moment it is renamed
+# into place and deleted afterwards.
+INDEX_STRIDE = 4096
+PARTITION_ROWS = 1 << 20
+ARCHIVE_PATH = "telemetry_archive"
+
+
+def column_dtype(col: str) -> np.dtype:
+    return np.dtype(CODE_DTYPE if col in CATEGORICAL_COLUMNS else NUMERIC_COLUMNS[col])
+
+
+def _write_json(path: str, data: dict):
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+class TelemetryArchive:
+    """Append-only, memory-mappable columnar archive of telemetry samples."""
+
+    def __init__(self, root: str = ARCHIVE_PATH, partition_rows: int = PARTITION_ROWS):
+        self.root = root
+        self.partition_rows = partition_rows
+
+    @staticmethod
+    def exists(root: str = ARCHIVE_PATH) -> bool:
+        return os.path.exists(os.path.join(root, 'meta.json'))
+
+    # --- metadata helpers ---
+    def _meta(self) -> dict:
+        path = os.path.join(self.root, 'meta.json')
+        if os.path.exists(path):
+            return _read_json(path)
+        return {'categories': {col: [] for col in CATEGORICAL_COLUMNS}}
+
+    def _partition_dirs(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root)
+                      if d.startswith('part-') and os.path.exists(os.path.join(self.root, d, 'part.json')))
+
+    def partitions(self) -> List[str]:
+        names = self._partition_dirs()
+        replaced = set()
+        for name in names:
+            try:
+                replaced.update(self.partition_info(name).get('replaces', []))
+            except FileNotFoundError:
+                pass  # dropped since it was listed
+        return [name for name in names if name not in replaced]
+
+    def partition_info(self, name: str) -> dict:
+        return _read_json(os.path.join(self.root, name, 'part.json'))
+
+    def categories(self) -> Dict[str, List[str]]:
+        return self._meta()['categories']
+
+    def __len__(self):
+        return sum(self.partition_info(p)['rows'] for p in self.partitions())
+
+    @contextmanager
+    def _lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # --- writing ---
+    def _next_partition_name(self) -> str:
+        # Numbered past every directory, including hidden ones, so a name is never reused
+        existing = [int(p.split('-')[1]) for p in self._partition_dirs()]
+        return f"part-{(max(existing) + 1) if existing else 0:06d}"
+
+    def _new_partition(self, rolled_up: bool = False) -> str:
+        name = self._next_partition_name()
+        path = os.path.join(self.root, name)
+        os.makedirs(path, exist_ok=True)
+        for col in TELEMETRY_COLUMNS + ['index']:
+            open(os.path.join(path, f"{col}.bin"), 'wb').close()
+        _write_json(os.path.join(path, 'part.json'), {'rows': 0, 'tmin': None, 'tmax': None, 'rolled_up': rolled_up})
+        return name
+
+    def _truncate_uncommitted(self, name: str, rows: int):
+        # Drop bytes left behind by a writer that crashed before committing part.json
+        path = os.path.join(self.root, name)
+        for col in TELEMETRY_COLUMNS:
+            fname = os.path.join(path, f"{col}.bin")
+            size = rows * column_dtype(col).itemsize
+            if os.path.getsize(fname) > size:
+                os.truncate(fname, size)
+        n_index = (rows + INDEX_STRIDE - 1) // INDEX_STRIDE
+        fname = os.path.join(path, 'index.bin')
+        if os.path.getsize(fname) > n_index * 8:
+            os.truncate(fname, n_index * 8)
+
+    def append(self, data: Union[TelemetryBatch, pd.DataFrame, bytes], rolled_up: bool = False):
+        """Append samples (a batch, frame or codec-encoded packet); they are sorted by time and routed to the open partition.
+
+        Pass `rolled_up=True` when the same rows were folded into the rollups.
+        """
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            from storage.codec import decode_batch
+            data = decode_batch(bytes(data))
+        batch = TelemetryBatch.from_frame(data) if isinstance(data, pd.DataFrame) else data
+        if len(batch) == 0:
+            return
+        with self._lock():
+            meta = self._meta()
+            columns = {}
+            for col in TELEMETRY_COLUMNS:
+                values = batch.columns[col]
+                if col in CATEGORICAL_COLUMNS:
+                    table = meta['categories'][col]
+                    for c in batch.categories[col]:
+                        if c not in table:
+                            table.append(c)
+                    values = remap_codes(values, batch.categories[col], table)
+                columns[col] = np.asarray(values, dtype=column_dtype(col))
+            _write_json(os.path.join(self.root, 'meta.json'), meta)
+            order = np.argsort(columns['timestamp'], kind='stable')
+            if np.any(order != np.arange(len(order))):
+                columns = {col: values[order] for col, values in columns.items()}
+            ts = columns['timestamp']
+            start = 0
+            while start < len(ts):
+                parts = self.partitions()
+                name = parts[-1] if parts else None
+                info = self.partition_info(name) if name else None
+                # Start a new partition when the open one is full, the batch goes back in time
+                # or its rows differ in being rolled up
+                if (info is None or info['rows'] >= self.partition_rows or info.get('rolled_up', False) != rolled_up
+                        or (info['tmax'] is not None and ts[start] < info['tmax'])):
+                    name = self._new_partition(rolled_up)
+                    info = self.partition_info(name)
+                self._truncate_uncommitted(name, info['rows'])
+                stop = min(len(ts), start + self.partition_rows - info['rows'])
+                self._append_partition(name, info, {col: v[start:stop] for col, v in columns.items()})
+                start = stop
+
+    def _append_partition(self, name: str, info: dict, columns: Dict[str, np.ndarray]):
+        path = os.path.join(self.root, name)
+        rows = info['rows']
+        n = len(columns['timestamp'])
+        for col in TELEMETRY_COLUMNS:
+            with open(os.path.join(path, f"{col}.bin"), 'ab') as f:
+                f.write(columns[col].tobytes())
+        # Sparse index entries for every row number that is a multiple of INDEX_STRIDE
+        first = -(-rows // INDEX_STRIDE) * INDEX_STRIDE
+        picks = np.arange(first, rows + n, INDEX_STRIDE) - rows
+        with open(os.path.join(path, 'index.bin'), 'ab') as f:
+            f.write(columns['timestamp'][picks].astype(np.float64).tobytes())
+        ts = columns['timestamp']
+        tmin = float(ts[0]) if info['tmin'] is None else info['tmin']
+        _write_json(os.path.join(path, 'part.json'), {**info, 'rows': rows + n, 'tmin': tmin, 'tmax': float(ts[-1])})
+
+    # --- rewriting (maintenance; callers hold the lock) ---
+    def read_partition(self, name: str, columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """All committed rows of one partition as read-only memmap views (codes for categoricals)."""
+        rows = self.partition_info(name)['rows']
+        return {col: self._map(name, col, 0, rows) for col in (columns or TELEMETRY_COLUMNS)}
+
+    def replace_partitions(self, old: List[str], columns: Optional[Dict[str, np.ndarray]] = None,
+                           rolled_up: bool = False) -> Optional[str]:
+        """Swap the `old` partitions for one new partition holding `columns`; returns its name.
+
+        `columns` holds every telemetry column with categoricals as archive
+        codes; rows are sorted here. Readers see either the old partitions or
+        the new one, never both. With no rows the old partitions are just dropped.
+        """
+        name = None
+        if columns is not None and len(columns['timestamp']):
+            order = np.argsort(columns['timestamp'], kind='stable')
+            columns = {col: np.asarray(columns[col], dtype=column_dtype(col))[order] for col in TELEMETRY_COLUMNS}
+            name = self._next_partition_name()
+            staging = os.path.join(self.root, f".staging-{name}")
+            shutil.rmtree(staging, ignore_errors=True)
+            os.makedirs(staging)
+            for col in TELEMETRY_COLUMNS:
+                columns[col].tofile(os.path.join(staging, f"{col}.bin"))
+            ts = columns['timestamp']
+            ts[::INDEX_STRIDE].astype(np.float64).tofile(os.path.join(staging, 'index.bin'))
+            _write_json(os.path.join(staging, 'part.json'),
+                        {'rows': len(ts), 'tmin': float(ts[0]), 'tmax': float(ts[-1]), 'rolled_up': rolled_up,
+                         'replaces': list(old)})
+            os.rename(staging, os.path.join(self.root, name))
+        for part in old:
+            self._drop(part)
+        return name
+
+    def _drop(self, name: str):
+        # Renaming first makes the partition disappear at once; readers that mapped it keep their pages
+        trash = os.path.join(self.root, f".trash-{name}-{os.getpid()}")
+        try:
+            os.rename(os.path.join(self.root, name), trash)
+        except FileNotFoundError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def collect_garbage(self) -> int:
+        """Delete hidden partitions and leftovers of interrupted rewrites; returns directories removed."""
+        visible = set(self.partitions())
+        hidden = set(self._partition_dirs()) - visible
+        removed = 0
+        for d in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            if d.startswith(('.staging-', '.trash-')):
+                shutil.rmtree(os.path.join(self.root, d), ignore_errors=True)
+                removed += 1
+            elif d in hidden:
+                self._drop(d)
+                removed += 1
+        return removed
+
+    # --- reading ---
+    def _map(self, name: str, col: str, lo: int, hi: int) -> np.ndarray:
+        dtype = column_dtype(col)
+        if hi <= lo:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.root, name, f"{col}.bin"), dtype=dtype, mode='r',
+                         offset=lo * dtype.itemsize, shape=(hi - lo,))
+
+    def _row_range(self, name: str, rows: int, start: Optional[float], end: Optional[float]):
+        index = np.fromfile(os.path.join(self.root, name, 'index.bin'), dtype=np.float64)
+        index = index[:(rows + INDEX_STRIDE - 1) // INDEX_STRIDE]
+        # Use the sparse index to narrow down to a window of blocks, then search inside it
+        lo_block = max(int(np.searchsorted(index, start, side='left')) - 1, 0) if start is not None else 0
+        hi_block = int(np.searchsorted(index, end, side='right')) if end is not None else len(index)
+        lo, hi = lo_block * INDEX_STRIDE, min(hi_block * INDEX_STRIDE, rows)
+        ts = self._map(name, 'timestamp', lo, hi)
+        first = lo + (int(np.searchsorted(ts, start, side='left')) if start is not None else 0)
+        last = lo + (int(np.searchsorted(ts, end, side='right')) if end is not None else len(ts))
+        return first, last
+
+    def query_columns(self, start: Optional[float] = None, end: Optional[float] = None,
+                      columns: Optional[List[str]] = None) -> List[Dict[str, np.ndarray]]:
+        """Return per-partition dicts of read-only memmap views covering [start, end]."""
+        columns = columns or TELEMETRY_COLUMNS
+        result = []
+        for name in self.partitions():
+            info = self.partition_info(name)
+            if info['rows'] == 0:
+                continue
+            if (start is not None and info['tmax'] < start) or (end is not None and info['tmin'] > end):
+                continue
+            lo, hi = self._row_range(name, info['rows'], start, end)
+            if hi > lo:
+                result.append({col: self._map(name, col, lo, hi) for col in columns})
+        return result
+
+    def export(self, start: Optional[float] = None, end: Optional[float] = None) -> bytes:
+        """Time-range export in the compact codec format (see storage.codec), encoded straight from the column files."""
+        from storage.codec import encode_columns
+        parts = self.query_columns(start, end)
+        columns = {col: np.concatenate([p[col] for p in parts]) if parts else np.empty(0, dtype=column_dtype(col))
+                   for col in TELEMETRY_COLUMNS}
+        if len(parts) > 1:
+            order = np.argsort(columns['timestamp'], kind='stable')
+            columns = {col: values[order] for col, values in columns.items()}
+        categories = self.categories()
+        return encode_columns(columns, {col: categories[col] for col in CATEGORICAL_COLUMNS})
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Time-range query as a DataFrame; a single-partition hit is built without copying."""
+        columns = columns or TELEMETRY_COLUMNS
+        parts = self.query_columns(start, end, columns)
+        categories = self.categories()
+        data = {}
+        for col in columns:
+            values = parts[0][col] if len(parts) == 1 else np.concatenate([p[col] for p in parts]) if parts else np.empty(0, dtype=column_dtype(col))
+            if col in CATEGORICAL_COLUMNS:
+                values = pd.Categorical.from_codes(np.asarray(values), categories=categories[col])
+            data[col] = values
+        df = pd.DataFrame(data, columns=columns, copy=False)
+        if len(parts) > 1:
+            df = df.sort_values('timestamp', kind='stable', ignore_index=True)
+        return df
@@ -0,0 +1,191 @@
+import json
+import struct
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+from simulator.records import TelemetryBatch, CATEGORICAL_COLUMNS
+
+# Compact telemetry encoding for transport and exports.
+#
+# Each column is quantized to fixed point (value * scale, rounded), delta
+# encoded `order` times, zigzag mapped to unsigned and written as LEB128
+# varints, so slowly changing values cost one or two bytes per sample.
+# Timestamps use second-order deltas: a fixed sampling interval encodes as
+# zeros. Categorical columns are sent as codes plus their category list.
+# Float columns without a scale here are stored raw.
+#
+# Blob layout: b'WMPC' | u32 header length | JSON header | column payloads.
+MAGIC = b'WMPC'
+MEDIA_TYPE = "application/vnd.wmp.telemetry"
+# (scale, delta order); the resolution of a column is 1 / scale
+COLUMN_CODECS = {
+    'timestamp': (1e3, 2),    # 1 ms
+    'latitude': (1e7, 1),     # ~1 cm
+    'longitude': (1e7, 1),
+    'accel_x': (1e4, 1), 'accel_y': (1e4, 1), 'accel_z': (1e4, 1),
+    'gyro_x': (1e3, 1), 'gyro_y': (1e3, 1), 'gyro_z': (1e3, 1),
+    'compass': (1e2, 1),      # 0.01 degree
+    'temperature': (1e2, 1),  # 0.01 degree C
+}
+_MAX_VARINT = 10
+
+
+# --- integer primitives ---
+def zigzag(values: np.ndarray) -> np.ndarray:
+    v = values.astype(np.int64)
+    return ((v << 1) ^ (v >> 63)).view(np.uint64)
+
+
+def unzigzag(values: np.ndarray) -> np.ndarray:
+    u = values.astype(np.uint64)
+    return ((u >> np.uint64(1)).view(np.int64)) ^ -(u & np.uint64(1)).view(np.int64)
+
+
+def varint_encode(values: np.ndarray) -> bytes:
+    """LEB128 of unsigned 64-bit values; one vectorized pass per output byte position."""
+    u = np.asarray(values, dtype=np.uint64)
+    if len(u) == 0:
+        return b''
+    nbytes = np.ones(len(u), dtype=np.int64)
+    for j in range(1, _MAX_VARINT):
+        nbytes += u >= np.uint64(1) << np.uint64(7 * j)
+    offsets = np.cumsum(nbytes) - nbytes
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    for j in range(int(nbytes.max())):
+        rows = np.flatnonzero(nbytes > j)
+        byte = (u[rows] >> np.uint64(7 * j)) & np.uint64(0x7F)
+        byte |= np.where(nbytes[rows] - 1 > j, np.uint64(0x80), np.uint64(0))
+        out[offsets[rows] + j] = byte
+    return out.tobytes()
+
+
+def varint_decode(data: bytes, count: int) -> np.ndarray:
+    b = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(b < 0x80)
+    if len(ends) != count:
+        raise ValueError(f"Expected {count} varints, found {len(ends)}")
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+    out = np.zeros(count, dtype=np.uint64)
+    for j in range(int(lengths.max()) if count else 0):
+        rows = np.flatnonzero(lengths > j)
+        out[rows] |= (b[starts[rows] + j].astype(np.uint64) & np.uint64(0x7F)) << np.uint64(7 * j)
+    return out
+
+
+def delta_encode(q: np.ndarray, order: int) -> np.ndarray:
+    for _ in range(order):
+        q = np.diff(q, prepend=np.int64(0))
+    return q
+
+
+def delta_decode(d: np.ndarray, order: int) -> np.ndarray:
+    for _ in range(order):
+        d = np.cumsum(d, dtype=np.int64)
+    return d
+
+
+# --- columns ---
+def _encode_column(name: str, values: np.ndarray, categories: Optional[List] = None) -> Tuple[Dict, List[bytes]]:
+    values = np.asarray(values)
+    meta = {'name': name, 'dtype': values.dtype.str}
+    if categories is not None:
+        meta.update(kind='codes', categories=list(categories))
+        payloads = [varint_encode(zigzag(delta_encode(values.astype(np.int64), 1)))]
+    elif values.dtype.kind in 'iub':
+        meta.update(kind='int')
+        payloads = [varint_encode(zigzag(delta_encode(values.astype(np.int64), 1)))]
+    elif values.dtype.kind == 'f' and name in COLUMN_CODECS:
+        scale, order = COLUMN_CODECS[name]
+        missing = np.isnan(values)
+        if missing.any():
+            # Missing samples repeat the previous value (a zero delta) and are restored from a bitmap
+            idx = np.where(missing, 0, np.arange(len(values)))
+            np.maximum.accumulate(idx, out=idx)
+            values = np.where(missing[idx], 0.0, values[idx])
+        q = np.rint(values.astype(np.float64) * scale).astype(np.int64)
+        meta.update(kind='fixed', scale=scale, order=order, missing=bool(missing.any()))
+        payloads = [varint_encode(zigzag(delta_encode(q, order)))]
+        if missing.any():
+            payloads.append(np.packbits(missing).tobytes())
+    else:
+        meta.update(kind='raw')
+        payloads = [np.ascontiguousarray(values).tobytes()]
+    meta['sizes'] = [len(p) for p in payloads]
+    return meta, payloads
+
+
+def _decode_column(meta: Dict, payloads: List[bytes], rows: int):
+    dtype = np.dtype(meta['dtype'])
+    if meta['kind'] == 'raw':
+        return np.frombuffer(payloads[0], dtype=dtype).copy()
+    q = delta_decode(unzigzag(varint_decode(payloads[0], rows)), meta.get('order', 1))
+    if meta['kind'] in ('codes', 'int'):
+        return q.astype(dtype)
+    values = (q / meta['scale']).astype(dtype)
+    if meta['missing']:
+        values[np.unpackbits(np.frombuffer(payloads[1], dtype=np.uint8), count=rows).astype(bool)] = np.nan
+    return values
+
+
+def encode_columns(columns: Dict[str, np.ndarray], categories: Optional[Dict[str, List]] = None) -> bytes:
+    """Encode equal-length columns; columns listed in `categories` hold integer codes into them."""
+    categories = categories or {}
+    rows = len(next(iter(columns.values()))) if columns else 0
+    metas, payloads = [], []
+    for name, values in columns.items():
+        meta, parts = _encode_column(name, values, categories.get(name))
+        metas.append(meta)
+        payloads.extend(parts)
+    header = json.dumps({'rows': rows, 'columns': metas}).encode()
+    return MAGIC + struct.pack('<I', len(header)) + header + b''.join(payloads)
+
+
+def decode_columns(blob: bytes) -> Tuple[Dict[str, np.ndarray], Dict[str, List], int]:
+    """(columns, categories, rows) from an encoded blob."""
+    if blob[:4] != MAGIC:
+        raise ValueError("Not an encoded telemetry blob")
+    (size,) = struct.unpack_from('<I', blob, 4)
+    header = json.loads(blob[8:8 + size])
+    pos = 8 + size
+    columns, categories = {}, {}
+    for meta in header['columns']:
+        parts = []
+        for n in meta['sizes']:
+            parts.append(blob[pos:pos + n])
+            pos += n
+        columns[meta['name']] = _decode_column(meta, parts, header['rows'])
+        if meta['kind'] == 'codes':
+            categories[meta['name']] = meta['categories']
+    return columns, categories, header['rows']
+
+
+# --- frames and batches ---
+def encode_frame(df: pd.DataFrame) -> bytes:
+    columns, categories = {}, {}
+    for col in df.columns:
+        values = df[col]
+        if not isinstance(values.dtype, pd.CategoricalDtype) and values.dtype.kind not in 'biuf':
+            values = values.astype('category')
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            columns[col] = values.cat.codes.to_numpy()
+            categories[col] = values.cat.categories.tolist()
+        else:
+            columns[col] = values.to_numpy()
+    return encode_columns(columns, categories)
+
+
+def decode_frame(blob: bytes) -> pd.DataFrame:
+    columns, categories, _ = decode_columns(blob)
+    data = {col: pd.Categorical.from_codes(values, categories=categories[col]) if col in categories else values
+            for col, values in columns.items()}
+    return pd.DataFrame(data, columns=list(columns), copy=False)
+
+
+def encode_batch(batch: TelemetryBatch) -> bytes:
+    return encode_columns(batch.columns, {col: batch.categories[col] for col in CATEGORICAL_COLUMNS})
+
+
+def decode_batch(blob: bytes) -> TelemetryBatch:
+    columns, categories, _ = decode_columns(blob)
+    return TelemetryBatch(columns, categories)
@@ -0,0 +1,212 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, Optional
+from simulator.records import CATEGORICAL_COLUMNS, TELEMETRY_COLUMNS
+from storage.archive import TelemetryArchive, ARCHIVE_PATH, _read_json, _write_json
+from storage.rollups import RollupStore, ROLLUP_PATH
+
+# Storage tiers:
+#   raw archive  full-rate samples, kept for RAW_DAYS (per species) and then
+#                dropped; rows not yet in the rollups are folded in first
+#   rollups      per-animal buckets, kept for the species' retention period
+# Maintenance works in small locked steps (one partition group at a time) and
+# sleeps in proportion to the rows it rewrote, so ingest is never blocked for
+# long and the disk is not saturated.
+DAY = 86400.0
+MAX_ROWS_PER_SECOND = 2_000_000
+MAINTENANCE_INTERVAL = 3600.0
+
+
+def parse_policy(text: Optional[str]) -> Dict[str, float]:
+    """'deer=365,wolf=1825,*=3650' -> {species: days}; '*' is the default for other species."""
+    policy = {}
+    for item in (text or '').split(','):
+        if item.strip():
+            species, days = item.split('=')
+            policy[species.strip()] = float(days)
+    return policy
+
+
+class StorageMaintenance:
+    """Compaction, raw-data expiry and per-species retention for the archive and rollups.
+
+    `raw_days` and `retention_days` map species (or '*') to a number of
+    days; species without an entry are kept forever. Raw rows past their
+    raw period are removed from the archive, and everything past the
+    retention period is removed from both tiers. Expired rows still inside
+    the retention period are aggregated into the rollups before deletion,
+    unless their partition is marked as rolled up at ingest.
+    `fold_into_rollups` overrides that: True folds every partition (e.g.
+    after the rollups were rebuilt from scratch), False none.
+    """
+
+    def __init__(self, archive_path: str = ARCHIVE_PATH, rollup_path: Optional[str] = ROLLUP_PATH,
+                 raw_days: Optional[Dict[str, float]] = None, retention_days: Optional[Dict[str, float]] = None,
+                 min_rows: Optional[int] = None, fold_into_rollups: Optional[bool] = None,
+                 max_rows_per_second: float = MAX_ROWS_PER_SECOND, now: Callable[[], float] = time.time):
+        self.archive = TelemetryArchive(archive_path)
+        self.rollup_path = rollup_path
+        self.raw_days = raw_days or {}
+        self.retention_days = retention_days or {}
+        # Partitions below this many rows are merged with their neighbours in time
+        self.min_rows = min_rows or self.archive.partition_rows // 4
+        self.fold_into_rollups = fold_into_rollups
+        self.max_rows_per_second = max_rows_per_second
+        self.now = now
+        self._checked = set()  # partitions found to hold no expired rows during the current pass
+
+    def _cutoff(self, policy: Dict[str, float], species: str) -> float:
+        days = policy.get(species, policy.get('*'))
+        return -np.inf if days is None else self.now() - days * DAY
+
+    def _throttle(self, rows: int):
+        if rows and self.max_rows_per_second:
+            time.sleep(rows / self.max_rows_per_second)
+
+    # --- raw tier ---
+    def expire_step(self) -> int:
+        """Rewrite the oldest partition holding expired rows; returns rows removed (0 when done)."""
+        species = self.archive.categories()['species']
+        raw_cut = np.array([max(self._cutoff(self.raw_days, s), self._cutoff(self.retention_days, s)) for s in species] or [-np.inf])
+        keep_cut = np.array([self._cutoff(self.retention_days, s) for s in species] or [-np.inf])
+        if not np.isfinite(raw_cut).any():
+            return 0
+        with self.archive._lock():
+            parts = sorted(((self.archive.partition_info(p), p) for p in self.archive.partitions()),
+                           key=lambda item: item[0]['tmin'] if item[0]['tmin'] is not None else np.inf)
+            for info, name in parts:
+                if info['rows'] == 0 or info['tmin'] >= raw_cut.max() or name in self._checked:
+                    continue
+                columns = self.archive.read_partition(name)
+                ts = columns['timestamp']
+                keep = ts >= raw_cut[columns['species']]
+                if keep.all():
+                    self._checked.add(name)  # names are never reused, so this stays true
+                    continue
+                fold_rows = not info.get('rolled_up', False) if self.fold_into_rollups is None else self.fold_into_rollups
+                if fold_rows and self.rollup_path:
+                    # Rows leaving only the raw tier still count towards the rollups
+                    fold = ~keep & (ts >= keep_cut[columns['species']])
+                    if fold.any():
+                        self._fold({col: v[fold] for col, v in columns.items()})
+                self.archive.replace_partitions([name], {col: v[keep] for col, v in columns.items()} if keep.any() else None,
+                                                rolled_up=info.get('rolled_up', False))
+                removed = int((~keep).sum())
+                break
+            else:
+                return 0
+        self._throttle(info['rows'])
+        return removed
+
+    def _fold(self, columns: Dict[str, np.ndarray]):
+        categories = self.archive.categories()
+        df = pd.DataFrame({col: pd.Categorical.from_codes(np.asarray(columns[col]), categories=categories[col])
+                           if col in CATEGORICAL_COLUMNS else np.asarray(columns[col]) for col in TELEMETRY_COLUMNS})
+        RollupStore(self.rollup_path).update(df)
+
+    def compact_step(self) -> int:
+        """Merge one run of time-adjacent small partitions; returns partitions merged (0 when done)."""
+        with self.archive._lock():
+            small = [(self.archive.partition_info(p), p) for p in self.archive.partitions()]
+            # Rolled-up and not rolled-up partitions are merged separately so the flag stays exact
+            small = sorted((item for item in small if 0 < item[0]['rows'] < self.min_rows),
+                           key=lambda item: (item[0].get('rolled_up', False), item[0]['tmin']))
+            group: List[str] = []
+            rows = 0
+            flag = None
+            for info, name in small:
+                if rows + info['rows'] > self.archive.partition_rows or info.get('rolled_up', False) != flag:
+                    if len(group) > 1:
+                        break
+                    group, rows, flag = [], 0, info.get('rolled_up', False)
+                group.append(name)
+                rows += info['rows']
+            if len(group) < 2:
+                return 0
+            parts = [self.archive.read_partition(name) for name in group]
+            self.archive.replace_partitions(group, {col: np.concatenate([p[col] for p in parts]) for col in TELEMETRY_COLUMNS},
+                                            rolled_up=flag)
+        self._throttle(rows)
+        return len(group)
+
+    # --- rollup tier ---
+    def _animal_species(self) -> Dict[str, str]:
+        # Remembered next to the rollups, which outlive the raw rows the pairs are read from
+        path = os.path.join(self.rollup_path, 'species.json')
+        known = _read_json(path) if os.path.exists(path) else {}
+        categories = self.archive.categories()
+        pairs = set()
+        with self.archive._lock():
+            for name in self.archive.partitions():
+                cols = self.archive.read_partition(name, ['animal_id', 'species'])
+                if len(cols['animal_id']) == 0:
+                    continue
+                pairs.update(zip(*np.unique(np.column_stack([cols['animal_id'], cols['species']]), axis=0).T.tolist()))
+        known.update({categories['animal_id'][a]: categories['species'][s] for a, s in pairs if a >= 0 and s >= 0})
+        _write_json(path, known)
+        return known
+
+    def expire_rollups(self) -> int:
+        """Drop rollup buckets that ended before their animal's retention cutoff; returns rows removed."""
+        if not self.retention_days or not self.rollup_path or not RollupStore.exists(self.rollup_path):
+            return 0
+        species = self._animal_species()
+        store = RollupStore(self.rollup_path)
+        removed = 0
+        for res, table in store.tables.items():
+            if table.empty:
+                continue
+            animals = table.index.get_level_values('animal_id')
+            cutoff = {a: self._cutoff(self.retention_days, species.get(a, '*')) for a in animals.unique()}
+            expired = table.index.get_level_values('bucket').to_numpy() + res <= animals.map(cutoff).to_numpy(dtype=np.float64)
+            if expired.any():
+                store.tables[res] = table[~expired]
+                removed += int(expired.sum())
+        if removed:
+            store.save()
+        return removed
+
+    # --- driver ---
+    def run_once(self) -> Dict[str, int]:
+        """One full pass: clean up, expire raw rows, compact, then apply rollup retention."""
+        stats = {'garbage_dirs': 0, 'expired_rows': 0, 'compacted_partitions': 0, 'rollup_rows_removed': 0}
+        if not TelemetryArchive.exists(self.archive.root):
+            return stats
+        with self.archive._lock():
+            stats['garbage_dirs'] = self.archive.collect_garbage()
+        self._checked.clear()
+        while True:
+            removed = self.expire_step()
+            if not removed:
+                break
+            stats['expired_rows'] += removed
+        while True:
+            merged = self.compact_step()
+            if not merged:
+                break
+            stats['compacted_partitions'] += merged
+        stats['rollup_rows_removed'] = self.expire_rollups()
+        return stats
+
+    def run(self, interval: float = MAINTENANCE_INTERVAL, stop=None):
+        while stop is None or not stop.is_set():
+            self.run_once()
+            if stop is not None:
+                stop.wait(interval)
+            else:
+                time.sleep(interval)
+
+
+if __name__ == "__main__":
+    maintenance = StorageMaintenance(
+        archive_path=os.environ.get("WMP_ARCHIVE_PATH", ARCHIVE_PATH),
+        rollup_path=os.environ.get("WMP_ROLLUP_PATH", ROLLUP_PATH),
+        raw_days=parse_policy(os.environ.get("WMP_RAW_DAYS", "*=90")),
+        retention_days=parse_policy(os.environ.get("WMP_RETENTION_DAYS")),
+        max_rows_per_second=float(os.environ.get("WMP_MAINTENANCE_ROWS_PER_SECOND", MAX_ROWS_PER_SECOND)),
+        # auto (default): fold partitions not rolled up at ingest; always / never override that
+        fold_into_rollups={"always": True, "never": False}.get(os.environ.get("WMP_FOLD_INTO_ROLLUPS", "auto")),
+    )
+    maintenance.run(interval=float(os.environ.get("WMP_MAINTENANCE_INTERVAL", MAINTENANCE_INTERVAL)))
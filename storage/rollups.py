@@ -0,0 +1,163 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from processor.preprocessing import haversine_distance
+
+# Bucket widths in seconds, finest first
+RESOLUTIONS = [60, 3600, 86400]
+ROLLUP_PATH = "telemetry_rollups"
+METRICS = ['speed', 'accel_mag', 'temperature']
+# Query results aim for at least this many buckets when no granularity is given
+TARGET_BUCKETS = 200
+
+
+def animal_ids(df: pd.DataFrame) -> pd.Series:
+    """Per-row animal key; files without animal_id fall back to one animal per species."""
+    if 'animal_id' in df:
+        return df['animal_id'].astype(str)
+    if 'species' in df:
+        return df['species'].astype(str) + '-1'
+    return pd.Series('unknown', index=df.index)
+
+
+def choose_resolution(start: Optional[float], end: Optional[float], granularity: Optional[float] = None,
+                      resolutions: List[int] = RESOLUTIONS) -> int:
+    """Coarsest bucket width that is no wider than `granularity` and still resolves the range."""
+    candidates = sorted(resolutions, reverse=True)
+    if granularity is not None:
+        fitting = [r for r in candidates if r <= granularity]
+        return fitting[0] if fitting else min(resolutions)
+    if start is None or end is None:
+        return min(resolutions)
+    for r in candidates:
+        if (end - start) / r >= TARGET_BUCKETS:
+            return r
+    return min(resolutions)
+
+
+class RollupStore:
+    """Incrementally maintained per-animal aggregates over several bucket widths."""
+
+    def __init__(self, root: Optional[str] = ROLLUP_PATH, resolutions: List[int] = RESOLUTIONS):
+        self.root = root
+        self.resolutions = resolutions
+        self.tables: Dict[int, pd.DataFrame] = {}
+        # Last fix per animal so distance and time budgets carry across updates
+        self.last_fix: Dict[str, list] = {}
+        if root and os.path.exists(os.path.join(root, 'last_fix.json')):
+            self.load()
+
+    @staticmethod
+    def exists(root: str = ROLLUP_PATH) -> bool:
+        return os.path.exists(os.path.join(root, 'last_fix.json'))
+
+    def _row_deltas(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Per-row elapsed time and distance since the previous fix of the same animal."""
+        rows = pd.DataFrame({'animal_id': animal_ids(df).values,
+                             'timestamp': df['timestamp'].to_numpy(np.float64)})
+        for col in ('latitude', 'longitude'):
+            rows[col] = df[col].to_numpy(np.float64) if col in df else np.nan
+        for col in METRICS:
+            if col in df:
+                rows[col] = df[col].to_numpy(np.float64)
+        if 'accel_mag' not in rows and all(c in df for c in ['accel_x', 'accel_y', 'accel_z']):
+            rows['accel_mag'] = np.sqrt(df['accel_x'].to_numpy(np.float64)**2 + df['accel_y'].to_numpy(np.float64)**2
+                                        + df['accel_z'].to_numpy(np.float64)**2)
+        if 'behavior' in df:
+            rows['behavior'] = df['behavior'].astype(str).values
+        rows = rows.sort_values(['animal_id', 'timestamp'], kind='stable', ignore_index=True)
+        first = rows['animal_id'].ne(rows['animal_id'].shift())
+        prev_t = rows['timestamp'].shift()
+        prev_lat = rows['latitude'].shift()
+        prev_lon = rows['longitude'].shift()
+        # The first row of each animal continues from the fix seen in an earlier update
+        carried = rows.loc[first, 'animal_id'].map(lambda a: self.last_fix.get(a, [np.nan] * 3))
+        prev_t[first] = [c[0] for c in carried]
+        prev_lat[first] = [c[1] for c in carried]
+        prev_lon[first] = [c[2] for c in carried]
+        dt = (rows['timestamp'] - prev_t).to_numpy()
+        dist = haversine_distance(prev_lat, prev_lon, rows['latitude'], rows['longitude'])
+        rows['dt'] = np.nan_to_num(np.clip(dt, 0, None))
+        rows['distance'] = np.nan_to_num(dist)
+        if 'speed' not in rows:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rows['speed'] = np.where(rows['dt'] > 0, rows['distance'] / rows['dt'], 0.0)
+        last = rows.groupby('animal_id', sort=False).tail(1)
+        for a, t, la, lo in zip(last['animal_id'], last['timestamp'], last['latitude'], last['longitude']):
+            self.last_fix[a] = [float(t), float(la), float(lo)]
+        return rows
+
+    def update(self, df: pd.DataFrame):
+        """Fold a batch of (raw or featured) telemetry rows into every resolution."""
+        if df.empty:
+            return
+        rows = self._row_deltas(df)
+        aggs = {'count': ('timestamp', 'size'), 'duration': ('dt', 'sum'), 'distance': ('distance', 'sum')}
+        for col in METRICS:
+            if col in rows:
+                aggs.update({f'{col}_min': (col, 'min'), f'{col}_max': (col, 'max'), f'{col}_sum': (col, 'sum')})
+        if 'behavior' in rows:
+            # Time budget: the interval leading up to a sample is credited to its behavior
+            for label in rows['behavior'].unique():
+                rows[f'budget_{label}'] = np.where(rows['behavior'] == label, rows['dt'], 0.0)
+                aggs[f'budget_{label}'] = (f'budget_{label}', 'sum')
+        for res in self.resolutions:
+            rows['bucket'] = np.floor(rows['timestamp'] / res) * res
+            new = rows.groupby(['animal_id', 'bucket'], sort=False).agg(**aggs)
+            self.tables[res] = self._merge(self.tables.get(res), new)
+        if self.root:
+            self.save()
+
+    @staticmethod
+    def _merge(old: Optional[pd.DataFrame], new: pd.DataFrame) -> pd.DataFrame:
+        if old is None or old.empty:
+            return new.sort_index()
+        both = pd.concat([old, new])
+        how = {col: ('min' if col.endswith('_min') else 'max' if col.endswith('_max') else 'sum') for col in both}
+        both = both.fillna({col: 0.0 for col in both if col.startswith('budget_')})
+        return both.groupby(level=['animal_id', 'bucket']).agg(how).sort_index()
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None, animal_id: Optional[str] = None,
+              granularity: Optional[float] = None, resolution: Optional[int] = None) -> pd.DataFrame:
+        """Aggregates for [start, end] from the coarsest resolution that fits the request."""
+        res = resolution or choose_resolution(start, end, granularity, self.resolutions)
+        table = self.tables.get(res)
+        if table is None or table.empty:
+            return pd.DataFrame()
+        out = table.reset_index()
+        if animal_id is not None:
+            out = out[out['animal_id'] == animal_id]
+        if start is not None:
+            out = out[out['bucket'] + res > start]
+        if end is not None:
+            out = out[out['bucket'] <= end]
+        out = out.copy()
+        for col in METRICS:
+            if f'{col}_sum' in out:
+                out[f'{col}_mean'] = out[f'{col}_sum'] / out['count']
+        out['resolution'] = res
+        return out.reset_index(drop=True)
+
+    # --- persistence ---
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        for res, table in self.tables.items():
+            path = os.path.join(self.root, f'rollup_{res}.parquet')
+            tmp = f'{path}.tmp.{os.getpid()}'
+            table.reset_index().to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+        path = os.path.join(self.root, 'last_fix.json')
+        tmp = f'{path}.tmp.{os.getpid()}'
+        with open(tmp, 'w') as f:
+            json.dump(self.last_fix, f)
+        os.replace(tmp, path)
+
+    def load(self):
+        for res in self.resolutions:
+            path = os.path.join(self.root, f'rollup_{res}.parquet')
+            if os.path.exists(path):
+                self.tables[res] = pd.read_parquet(path).set_index(['animal_id', 'bucket'])
+        with open(os.path.join(self.root, 'last_fix.json')) as f:
+            self.last_fix = json.load(f)
@@ -0,0 +1,140 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Optional
+from storage.archive import _write_json, _read_json
+
+# Shared dataset layout (on tmpfs, so the column files live in RAM only once):
+#   <root>/<name>/manifest.json        current version, source identity and column descriptions
+#   <root>/<name>/v000001/<col>.bin    raw column buffer of one published version
+# A publisher writes a complete version directory and then replaces the
+# manifest atomically; readers map the columns of whatever version the
+# manifest names. Every process maps the same page-cache pages read-only, so
+# memory stays flat as workers are added. The previous version is kept so a
+# reader that has just read the manifest can still open its files.
+SHM_PATH = os.environ.get("WMP_SHM_PATH") or (
+    "/dev/shm/wmp" if os.path.isdir("/dev/shm") else os.path.join(tempfile.gettempdir(), "wmp-shm"))
+KEEP_VERSIONS = 2
+# Set WMP_SHARED_DATA=0 to have every worker load its own private copy instead
+SHARED_DATA = os.environ.get("WMP_SHARED_DATA", "1") == "1"
+
+
+def _source_identity(path: str) -> Dict:
+    st = os.stat(path)
+    return {'path': os.path.abspath(path), 'inode': st.st_ino, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+class SharedDataset:
+    """Versioned, memory-mapped column buffers shared by all worker processes on a host."""
+
+    def __init__(self, root: str = SHM_PATH):
+        self.root = root
+        self._attached = {}  # name -> (manifest mtime_ns, manifest, DataFrame)
+
+    @staticmethod
+    def name_for(path: str) -> str:
+        """Dataset name of a source file: its base name, made unique per absolute path."""
+        digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+        return f"{os.path.splitext(os.path.basename(path))[0]}-{digest}"
+
+    def _dir(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def manifest(self, name: str) -> Optional[Dict]:
+        path = os.path.join(self._dir(name), 'manifest.json')
+        return _read_json(path) if os.path.exists(path) else None
+
+    # --- publishing ---
+    def publish(self, name: str, df: pd.DataFrame, source: Optional[Dict] = None) -> int:
+        """Write `df` as a new version and make it current; returns the version number.
+
+        Numeric columns are stored as raw buffers, categoricals as codes with
+        their categories in the manifest; other columns are stored as
+        categoricals.
+        """
+        base = self._dir(name)
+        os.makedirs(base, exist_ok=True)
+        current = self.manifest(name)
+        version = (current['version'] if current else 0) + 1
+        vdir = os.path.join(base, f"v{version:06d}")
+        tmp = f"{vdir}.tmp.{os.getpid()}"
+        os.makedirs(tmp)
+        columns = []
+        for i, col in enumerate(df.columns):
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                data, categories = values.cat.codes.to_numpy(), values.cat.categories.tolist()
+            elif values.dtype.kind in 'biuf':
+                data, categories = values.to_numpy(), None
+            else:
+                cat = pd.Categorical(values)
+                data, categories = cat.codes, cat.categories.tolist()
+            data = np.ascontiguousarray(data)
+            data.tofile(os.path.join(tmp, f"{i}.bin"))
+            columns.append({'name': str(col), 'dtype': data.dtype.str, 'categories': categories})
+        os.replace(tmp, vdir)
+        _write_json(os.path.join(base, 'manifest.json'),
+                    {'version': version, 'rows': len(df), 'source': source, 'columns': columns})
+        # Drop versions no reader can still be about to open; mapped files stay valid after unlink
+        versions = sorted(d for d in os.listdir(base) if d.startswith('v') and '.tmp.' not in d)
+        for old in versions[:-KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(base, old), ignore_errors=True)
+        return version
+
+    # --- attaching ---
+    def attach(self, name: str) -> Optional[pd.DataFrame]:
+        """Current version as a DataFrame of read-only memmap views, or None if nothing is published."""
+        path = os.path.join(self._dir(name), 'manifest.json')
+        for _ in range(3):
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                return None
+            cached = self._attached.get(name)
+            if cached is not None and cached[0] == mtime:
+                return cached[2]
+            manifest = _read_json(path)
+            try:
+                df = self._map(name, manifest)
+            except FileNotFoundError:
+                continue  # a newer version replaced this one while we read the manifest
+            self._attached[name] = (mtime, manifest, df)
+            return df
+        return None
+
+    def _map(self, name: str, manifest: Dict) -> pd.DataFrame:
+        vdir = os.path.join(self._dir(name), f"v{manifest['version']:06d}")
+        data = {}
+        for i, col in enumerate(manifest['columns']):
+            dtype = np.dtype(col['dtype'])
+            if manifest['rows'] == 0:
+                values = np.empty(0, dtype=dtype)
+            else:
+                values = np.memmap(os.path.join(vdir, f"{i}.bin"), dtype=dtype, mode='r', shape=(manifest['rows'],))
+            if col['categories'] is not None:
+                values = pd.Categorical.from_codes(values, categories=col['categories'])
+            data[col['name']] = values
+        return pd.DataFrame(data, columns=[c['name'] for c in manifest['columns']], copy=False)
+
+    def load(self, path: str, loader: Callable[[str], pd.DataFrame]) -> pd.DataFrame:
+        """Shared view of the file at `path`, publishing it first if it is new or changed.
+
+        Only one process per host runs `loader`; the others wait on the lock
+        and then attach to what it published.
+        """
+        name = self.name_for(path)
+        source = _source_identity(path)
+        df = self.attach(name)
+        if df is not None and self._attached[name][1]['source'] == source:
+            return df
+        os.makedirs(self._dir(name), exist_ok=True)
+        with open(os.path.join(self._dir(name), '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self.manifest(name)
+            if manifest is None or manifest['source'] != source:
+                self.publish(name, loader(path), source)
+        return self.attach(name)
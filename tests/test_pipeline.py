@@ -1,3 +1,4 @@
+import json
 import pytest
 import pandas as pd
 from fastapi.testclient import TestClient
@@ -16,6 +17,49 @@ def test_simulator_output_shape():
         assert 'latitude' in row and 'longitude' in row
         assert 'accel_x' in row and 'gyro_x' in row and 'temperature' in row
 
+def test_simulator_batch_to_frame_is_zero_copy():
+    import numpy as np
+    sim = TelemetrySimulator(species='wolf', movement_mode='run', sampling_rate=10, duration=60)
+    batch = sim.generate_batch()
+    assert len(batch) == 600
+    assert batch.categories['species'] == ['wolf']
+    df = batch.to_frame()
+    assert list(df['species'].unique()) == ['wolf']
+    assert np.shares_memory(df['latitude'].to_numpy(), batch.columns['latitude'])
+    assert df['accel_x'].dtype == np.float32
+    record = batch[5]
+    assert record.latitude == df['latitude'].iloc[5] and record.movement_mode == 'run'
+    packed = batch.to_structured()
+    assert packed['timestamp'][5] == record.timestamp
+
+def test_seeded_simulator_is_reproducible_without_a_start_time():
+    from simulator.fleet import frame_digest
+    from simulator.generator import VIRTUAL_EPOCH
+    a = TelemetrySimulator(species='deer', duration=30, seed=7).generate_batch().to_frame()
+    b = TelemetrySimulator(species='deer', duration=30, seed=7).generate_batch().to_frame()
+    pd.testing.assert_frame_equal(a, b)
+    assert frame_digest(a) == frame_digest(b) and a['timestamp'].iloc[0] == VIRTUAL_EPOCH
+
+def test_seeded_fleet_is_reproducible_for_any_worker_count(tmp_path):
+    import numpy as np
+    from simulator.fleet import fleet_specs, generate_fleet, replay, save_fleet
+    a = TelemetrySimulator(species='deer', duration=30, seed=7, start_time=1000.0).generate_batch()
+    b = TelemetrySimulator(species='deer', duration=30, seed=7, start_time=1000.0).generate_batch()
+    c = TelemetrySimulator(species='deer', duration=30, seed=8, start_time=1000.0).generate_batch()
+    assert all(np.array_equal(a.columns[col], b.columns[col]) for col in a.columns)
+    assert not np.array_equal(a.columns['latitude'], c.columns['latitude'])
+    assert a.columns['timestamp'][0] == 1000.0 and a.columns['timestamp'][-1] == 1029.0
+    specs = fleet_specs(4, duration=60)
+    serial, manifest = generate_fleet(specs, seed=3)
+    parallel, again = generate_fleet(specs, seed=3, workers=2)
+    pd.testing.assert_frame_equal(serial, parallel)
+    assert manifest == again and manifest['rows'] == 240
+    assert [animal['spawn_key'] for animal in manifest['animals']] == [[0], [1], [2], [3]]
+    saved = save_fleet(str(tmp_path / 'fleet.csv'), specs, seed=3)
+    written = json.loads((tmp_path / 'fleet.manifest.json').read_text())
+    assert saved['digest'] == written['digest'] == manifest['digest']
+    pd.testing.assert_frame_equal(replay(written), serial)
+
 # --- Preprocessing and Feature Extraction ---
 def test_preprocessing_and_features():
     # Create mock data
@@ -91,4 +135,566 @@ def test_api_login_and_protected_endpoints(test_app):
     # Viewer should not be able to train model (if role checks added)
     resp = client.post("/api/model/train", headers=headers)
     # Acceptable: 403 if role checks, 200/other if not implemented
-    assert resp.status_code in (200, 403, 404, 422) 
\ No newline at end of file
+    assert resp.status_code in (200, 403, 404, 422) 
+    # Nor overwrite the served dataset with a new simulation
+    assert client.post("/api/simulate/run", headers=headers).status_code == 403
+
+def test_history_endpoint_serves_codec_blob(test_app, tmp_path, monkeypatch):
+    from api import routes
+    from storage import codec
+    from storage.shared import SharedDataset
+    monkeypatch.setattr(routes, '_shared_data', SharedDataset(str(tmp_path / 'shm')))
+    monkeypatch.chdir(tmp_path)
+    TelemetrySimulator(species='deer', sampling_rate=1, duration=300).save_to_csv('simulated_telemetry.csv')
+    client = TestClient(test_app)
+    token = client.post("/api/token", data={"username": "admin", "password": "password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    rows = client.get("/api/telemetry/history", headers=headers).json()
+    resp = client.get("/api/telemetry/history", headers={**headers, "Accept": codec.MEDIA_TYPE})
+    assert resp.headers["content-type"] == codec.MEDIA_TYPE
+    df = codec.decode_frame(resp.content)
+    assert len(df) == len(rows) == 300 and len(resp.content) * 5 < len(json.dumps(rows))
+    classified = client.post("/api/behavior/classify", headers={**headers, "Content-Type": codec.MEDIA_TYPE}, content=resp.content)
+    assert classified.status_code == 200
+
+# --- Bounded Executors ---
+def test_heavy_executor_does_not_stall_live_lane():
+    import asyncio, time
+    from fastapi import HTTPException
+    from api.executor import BoundedExecutor
+    heavy = BoundedExecutor("heavy-test", max_workers=1, max_pending=2)
+    live = BoundedExecutor("live-test", max_workers=1, max_pending=4)
+
+    async def scenario():
+        slow = [asyncio.ensure_future(heavy.run(time.sleep, 0.3)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as exc:
+            await heavy.run(time.sleep, 0)
+        assert exc.value.status_code == 503
+        started = time.perf_counter()
+        assert await live.run(sum, [1, 2, 3]) == 6
+        live_latency = time.perf_counter() - started
+        await asyncio.gather(*slow)
+        return live_latency
+
+    assert asyncio.run(scenario()) < 0.1
+    stats = heavy.snapshot()
+    assert stats["completed"] == 2 and stats["rejected"] == 1 and stats["queue_depth"] == 0
+    assert stats["run_seconds_total"] >= 0.6
+
+def test_dashboard_websocket_survives_saturated_live_lane(monkeypatch):
+    from fastapi import HTTPException
+    from dashboard import app as dashboard
+    calls = []
+    async def flaky(func, *args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise HTTPException(status_code=503, detail="live executor is saturated, retry later")
+        return [{"timestamp": 1.0}]
+    monkeypatch.setattr(dashboard.live_executor, 'run', flaky)
+    monkeypatch.setattr(dashboard, 'WS_INTERVAL', 0.01)
+    with TestClient(dashboard.app).websocket_connect("/ws/data") as ws:
+        assert ws.receive_json() == [{"timestamp": 1.0}]
+    assert len(calls) >= 2
+
+def test_batch_classify_endpoint_columnar_json_and_arrow(test_app):
+    import pyarrow as pa
+    client = TestClient(test_app)
+    token = client.post("/api/token", data={"username": "admin", "password": "password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    frames = [TelemetrySimulator(species=s, sampling_rate=1, duration=20).generate_batch().to_frame() for s in ('deer', 'wolf')]
+    df = pd.concat(frames, ignore_index=True)
+    columns = {col: df[col].astype(str).tolist() if col in ('animal_id', 'species', 'movement_mode') else df[col].tolist() for col in df}
+    resp = client.post("/api/behavior/classify", json={"columns": columns}, headers=headers)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert len(body["behavior"]) == len(df)
+    assert body["animal_id"][:20] == ['deer-1'] * 20 and body["animal_id"][20:] == ['wolf-1'] * 20
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(df)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    resp = client.post("/api/behavior/classify", content=sink.getvalue().to_pybytes(),
+                       headers={**headers, "Content-Type": "application/vnd.apache.arrow.stream"})
+    assert resp.status_code == 200 and resp.json()["behavior"] == body["behavior"]
+    resp = client.post("/api/behavior/classify", json={"columns": {"speed": [1.0]}}, headers=headers)
+    assert resp.status_code == 422
+    for bad in ([1, 2], "text", None):
+        assert client.post("/api/behavior/classify", json=bad, headers=headers).status_code == 422
+    no_temperature = {col: values for col, values in columns.items() if col != "temperature"}
+    for bad in ({"columns": {"timestamp": [1, 2, 3], "speed": [1, 2, 3]}}, {"columns": {"timestamp": []}},
+                {"columns": no_temperature}):
+        resp = client.post("/api/behavior/classify", json=bad, headers=headers)
+        assert resp.status_code == 422, resp.text
+
+def test_micro_batcher_coalesces_concurrent_requests():
+    import asyncio
+    from classifier.batching import MicroBatcher
+    calls = []
+
+    def predict(df):
+        calls.append(len(df))
+        return df['speed'].to_numpy() * 2
+
+    batcher = MicroBatcher(predict, max_delay=0.01)
+
+    async def scenario():
+        frames = [pd.DataFrame({'speed': [float(i)] * (i + 1)}) for i in range(5)]
+        return await asyncio.gather(*(batcher.submit(f) for f in frames))
+
+    results = asyncio.run(scenario())
+    assert calls == [15]
+    assert [list(r) for r in results] == [[2.0 * i] * (i + 1) for i in range(5)]
+
+def test_micro_batcher_fails_only_the_bad_request():
+    import asyncio
+    from classifier.batching import MicroBatcher
+    def predict(df):
+        if df['speed'].isna().any():
+            raise ValueError("speed has gaps")
+        return df['speed'].to_numpy() * 2
+
+    batcher = MicroBatcher(predict, max_delay=0.01)
+
+    async def scenario():
+        frames = [pd.DataFrame({'speed': [1.0, 2.0]}), pd.DataFrame({'heading': [3.0]}), pd.DataFrame({'speed': [4.0]})]
+        return await asyncio.gather(*(batcher.submit(f) for f in frames), return_exceptions=True)
+
+    good, bad, other = asyncio.run(scenario())
+    assert list(good) == [2.0, 4.0] and list(other) == [8.0]
+    assert isinstance(bad, KeyError)  # the frame alone has no speed column at all
+
+def test_ml_classifier_train_chunked_with_reservoir(tmp_path):
+    import numpy as np
+    rng = np.random.default_rng(3)
+
+    def chunks():
+        for _ in range(6):
+            speed = rng.gamma(2.0, 0.5, 2000)
+            yield pd.DataFrame({'speed': speed, 'accel_mag': speed * 0.5 + rng.normal(0, 0.1, 2000),
+                                'behavior': np.where(speed < 0.6, 'resting', np.where(speed < 1.5, 'walking', 'running'))})
+
+    clf = behavior_model.MLBehaviorClassifier()
+    report = clf.train_chunked(chunks(), label_col='behavior', sample_per_class=500,
+                               eval_dir=str(tmp_path / 'eval'), save_path=str(tmp_path / 'model.joblib'))
+    # Reservoir bounds the training set per class
+    assert clf.model.estimators_[0].tree_.weighted_n_node_samples[0] == 3 * 500
+    assert report['accuracy'] > 0.9
+    assert sum(v['support'] for k, v in report.items() if k != 'accuracy') == sum(
+        len(pd.read_parquet(p)) for p in (tmp_path / 'eval').glob('eval-*.parquet'))
+    # Integer labels keep their type through the reservoir, the holdout and the report
+    codes = {'resting': 0, 'walking': 1, 'running': 2}
+    numeric = (chunk.assign(behavior=chunk['behavior'].map(codes)) for chunk in chunks())
+    report = clf.train_chunked(numeric, label_col='behavior', sample_per_class=500, eval_dir=str(tmp_path / 'eval-int'))
+    assert report['accuracy'] > 0.9 and sorted(k for k in report if k != 'accuracy') == [0, 1, 2]
+
+def test_stratified_reservoir_is_bounded_and_uniform():
+    import numpy as np
+    reservoir = behavior_model.StratifiedReservoir(capacity=1000, n_features=1, random_state=0)
+    for start in range(0, 100_000, 10_000):
+        values = np.arange(start, start + 10_000, dtype=np.float64)[:, None]
+        reservoir.add(values, np.where(values[:, 0] % 10 == 0, 'rare', 'common'))
+    X, y = reservoir.arrays()
+    assert (y == 'common').sum() == 1000 and (y == 'rare').sum() == 1000
+    common = X[y == 'common', 0]
+    # Uniform over the whole stream, not biased to early chunks
+    assert 40_000 < common.mean() < 60_000
+
+def test_feature_cache_skips_preprocessing_for_unchanged_input(tmp_path, monkeypatch):
+    import os
+    from processor.cache import FeatureCache
+    csv = tmp_path / 'telemetry.csv'
+    TelemetrySimulator(sampling_rate=1, duration=30).save_to_csv(str(csv))
+    cache = FeatureCache(str(tmp_path / 'cache'))
+    first = preprocessing.preprocess(str(csv), cache=cache)
+    calls = []
+    monkeypatch.setattr(preprocessing, 'ingest_data', lambda path: calls.append(path))
+    second = preprocessing.preprocess(str(csv), cache=cache)
+    assert calls == []
+    pd.testing.assert_frame_equal(first, second, check_dtype=False)
+    # Different parameters or a modified file miss the cache
+    assert cache.key(str(csv), {'window': 5}) != cache.key(str(csv), {'window': 9})
+    old_key = cache.key(str(csv), {'window': 5})
+    os.utime(csv, ns=(1, 1))
+    assert cache.key(str(csv), {'window': 5}) != old_key
+    # So does a change to the declared ingest dtypes
+    from processor import cache as cache_module
+    old_key = cache.key(str(csv), {'window': 5})
+    monkeypatch.setitem(cache_module._SCHEMA, 'accel_x', 'float64')
+    assert cache.key(str(csv), {'window': 5}) != old_key
+
+def test_feature_cache_lru_eviction(tmp_path):
+    import os, time
+    from processor.cache import FeatureCache
+    cache = FeatureCache(str(tmp_path / 'cache'), max_bytes=10**9)
+    frame = pd.DataFrame({'x': range(1000)})
+    for key in ('a', 'b', 'c'):
+        cache.put(key, frame)
+    for i, key in enumerate(('a', 'b', 'c')):
+        os.utime(cache._path(key), (time.time() - 100 + i, time.time() - 100 + i))
+    cache.get('a')  # touching 'a' makes 'b' the least recently used entry
+    cache.max_bytes = 2 * os.path.getsize(cache._path('a'))
+    cache.evict()
+    assert cache.get('b') is None and cache.get('a') is not None and cache.get('c') is not None
+
+def test_ingest_declares_dtypes_and_skips_malformed_rows(tmp_path):
+    import numpy as np
+    csv = tmp_path / 'telemetry.csv'
+    TelemetrySimulator(sampling_rate=1, duration=10).save_to_csv(str(csv))
+    df = preprocessing.ingest_data(str(csv))
+    assert len(df) == 10
+    assert df['accel_x'].dtype == np.float32 and df['latitude'].dtype == np.float64
+    assert isinstance(df['species'].dtype, pd.CategoricalDtype)
+    lines = csv.read_text().splitlines()
+    good = lines[1]
+    short = ','.join(good.split(',')[:5])
+    garbled = good.replace(good.split(',')[6], 'not-a-number', 1)
+    csv.write_text('\n'.join(lines + [short, garbled, good]) + '\n')
+    df = preprocessing.ingest_data(str(csv))
+    assert len(df) == 11
+    assert df['accel_x'].dtype == np.float32 and not df['accel_x'].isna().any()
+    # The chunked readers use the same schema and row checks
+    chunks = list(preprocessing.read_csv_chunks(str(csv), chunksize=4))
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True).astype({'species': str, 'animal_id': str, 'movement_mode': str}),
+                                  df.astype({'species': str, 'animal_id': str, 'movement_mode': str}))
+    assert all((chunk.dtypes == df.dtypes).all() for chunk in chunks)
+
+def test_gap_aware_cleaning_splits_segments():
+    import numpy as np
+    nan = np.nan
+    df = pd.DataFrame({
+        'timestamp': [0, 10, 20, 30, 3630, 3640, 3650, 3660],
+        'latitude': [45.0, nan, 45.0002, 45.0003, 46.0, nan, nan, 46.0003],
+        'longitude': [-75.0, -75.0001, -75.0002, nan, -76.0, -76.0001, -76.0002, -76.0003],
+        'accel_x': [0.1, 0.2, nan, 0.2, 0.1, 0.2, 0.1, 0.2],
+        'temperature': [38, 38.1, 38.2, 38.3, 38.4, 38.5, 38.6, 38.7],
+    })
+    clean = preprocessing.clean_and_normalize(df, max_gap=600)
+    assert list(clean['segment_id']) == [0, 0, 0, 0, 1, 1, 1, 1]
+    assert not clean.isnull().any().any()
+    # Interpolated inside a segment, never across the one-hour dropout
+    assert clean['latitude'][1] == pytest.approx(45.0001)
+    assert clean['longitude'][3] == pytest.approx(-75.0002)
+    assert clean['latitude'][5] == pytest.approx(46.0001)
+    feats = preprocessing.extract_features(clean)
+    assert feats['speed'][4] == 0
+    # Holes longer than max_gap hold the nearest fix instead of inventing a path
+    held = preprocessing.clean_and_normalize(df, max_gap=15)
+    assert held['latitude'][1] in (45.0, 45.0002)
+
+def test_filter_kernels_match_reference_and_respect_segments(monkeypatch):
+    import numpy as np
+    from processor import filters
+    x = np.random.default_rng(0).normal(size=(300, 3))
+    for window in (4, 5):
+        ref = pd.DataFrame(x).rolling(window, min_periods=1, center=True).mean().to_numpy()
+        assert np.allclose(filters.apply_filter(x, 'moving_average', window), ref)
+    # Each segment is filtered on its own, and chunked parallel runs give the same result
+    segments = np.repeat([0, 1, 2], [120, 30, 150])
+    monkeypatch.setattr(filters, 'PARALLEL_MIN_ROWS', 10)
+    for kernel in filters.KERNEL_NAMES:
+        out = filters.apply_filter(x, kernel, 5, segments=segments, workers=1)
+        assert np.allclose(out[120:150], filters.apply_filter(x[120:150], kernel, 5))
+        assert np.allclose(out, filters.apply_filter(x, kernel, 5, segments=segments, workers=4))
+    with pytest.raises(ValueError):
+        filters.apply_filter(x, 'fir')
+
+def test_burst_mode_features_join_nearest_fix(tmp_path):
+    import numpy as np
+    from simulator.records import BurstBatch
+    from processor.bursts import burst_features, preprocess_dual_rate
+    sim = TelemetrySimulator(species='wolf', movement_mode='run', duration=3600)
+    fixes, bursts = sim.generate_dual_rate(gps_interval=300, burst_rate=40, burst_seconds=5, burst_interval=60)
+    assert len(fixes) == 13 and bursts.samples.shape == (61, 200, 3)
+    assert bursts.samples.flags['C_CONTIGUOUS']
+    bursts.save(tmp_path / 'bursts.npz')
+    loaded = BurstBatch.load(tmp_path / 'bursts.npz')
+    assert np.array_equal(loaded.samples, bursts.samples) and loaded.categories == bursts.categories
+    feats = burst_features(bursts)
+    assert len(feats) == len(bursts)
+    assert feats['dominant_freq'].median() == pytest.approx(3.0, abs=0.3)
+    joined = preprocess_dual_rate(fixes, bursts)
+    assert len(joined) == len(bursts)
+    # Every burst carries the closest fix in time
+    nearest = fixes['timestamp'].to_numpy()[np.abs(feats['timestamp'].to_numpy()[:, None] - fixes['timestamp'].to_numpy()).argmin(axis=1)]
+    assert np.allclose(joined['fix_timestamp'], nearest)
+    assert {'speed', 'accel_mag', 'odba', 'temp_trend'} <= set(joined.columns)
+
+# --- Movement Analytics ---
+def test_home_range_matches_bivariate_normal():
+    import numpy as np
+    from analytics.home_range import home_ranges
+    rng = np.random.default_rng(0)
+    n = 20_000
+    lat = 45 + rng.normal(0, 1000, n) / 111_195
+    lon = -75 + rng.normal(0, 1000, n) / (111_195 * np.cos(np.deg2rad(45)))
+    df = pd.DataFrame({'animal_id': np.repeat(['a', 'b'], n // 2), 'latitude': lat, 'longitude': lon})
+    table = home_ranges(df, workers=2)
+    assert list(table['animal_id']) == ['a', 'b'] and list(table['n_fixes']) == [n // 2] * 2
+    # Isopleth areas of an isotropic normal with sigma = 1 km: -2 ln(1 - p) * pi km^2
+    assert table['kde95_km2'].to_numpy() == pytest.approx(-2 * np.log(0.05) * np.pi, rel=0.15)
+    assert table['kde50_km2'].to_numpy() == pytest.approx(-2 * np.log(0.5) * np.pi, rel=0.15)
+    assert table['mcp95_km2'].to_numpy() == pytest.approx(-2 * np.log(0.05) * np.pi, rel=0.15)
+    assert table['mcp_wkt'][0].startswith('POLYGON')
+
+def test_home_range_endpoint_is_cached(test_app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    TelemetrySimulator(species='deer', sampling_rate=1, duration=300).save_to_csv('simulated_telemetry.csv')
+    client = TestClient(test_app)
+    token = client.post("/api/token", data={"username": "admin", "password": "password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    first = client.get("/api/analytics/home-range", headers=headers)
+    assert first.status_code == 200 and first.json()[0]["animal_id"] == "deer-1"
+    assert client.get("/api/analytics/home-range", headers=headers).json() == first.json()
+    assert client.get("/api/analytics/home-range?mcp_percent=0", headers=headers).status_code == 422
+    # Data without usable fixes gives an empty list, not a 500
+    from api import routes
+    monkeypatch.setattr(routes, 'home_ranges', lambda *args, **kwargs: pd.DataFrame())
+    empty = client.get("/api/analytics/home-range", params={'animal_id': 'deer-1', 'grid_size': 64}, headers=headers)
+    assert empty.status_code == 200 and empty.json() == []
+
+def test_behavior_segmentation_smooths_flicker():
+    import numpy as np
+    from analytics import segmentation
+    rng = np.random.default_rng(1)
+    true = np.repeat([0, 2, 1, 0], 300)
+    speed = np.exp(np.log(np.array([0.05, 0.5, 3.0])[true]) + rng.normal(0, 0.8, len(true)))
+    log_emit = segmentation.speed_log_probs(speed)
+    log_trans = segmentation.transition_log_probs(3)
+    exact = segmentation.viterbi_batch(log_emit[None], log_trans)[0]
+    assert (segmentation.decode(log_emit, log_trans, chunk=200, overlap=50) == exact).all()
+    df = pd.DataFrame({'timestamp': np.arange(len(true), dtype=float), 'speed': speed,
+                       'animal_id': 'deer-1', 'segment_id': np.repeat([0, 1], 600)})
+    table = segmentation.segment_behaviors(df)
+    assert list(table['behavior']) == ['resting', 'running', 'walking', 'walking', 'resting']
+    assert table['n_samples'].sum() == len(df) and table['start'][3] == 600
+    assert list(table['moving']) == [False, True, True, True, False]
+
+def test_encounters_match_brute_force_and_filter_species():
+    import numpy as np
+    from analytics.encounters import align_fixes, encounter_events, find_encounters
+    rng = np.random.default_rng(2)
+    n_animals, n_buckets = 200, 10
+    df = pd.DataFrame({
+        'timestamp': np.repeat(np.arange(n_buckets) * 60.0, n_animals) + rng.uniform(0, 59, n_animals * n_buckets),
+        'animal_id': np.tile([f'a{i}' for i in range(n_animals)], n_buckets),
+        'species': np.tile(np.where(np.arange(n_animals) % 2, 'deer', 'wolf'), n_buckets),
+        'latitude': 45 + rng.uniform(0, 0.01, n_animals * n_buckets),
+        'longitude': -75 + rng.uniform(0, 0.01, n_animals * n_buckets),
+    })
+    pairs = find_encounters(df, distance=50, window=60)
+    expected = 0
+    for _, g in align_fixes(df, 60).groupby('bucket'):
+        d = preprocessing.haversine_distance(g['latitude'].to_numpy()[:, None], g['longitude'].to_numpy()[:, None],
+                                             g['latitude'].to_numpy()[None], g['longitude'].to_numpy()[None])
+        expected += np.triu(d <= 50, 1).sum()
+    assert len(pairs) == expected > 0
+    mixed = find_encounters(df, distance=50, window=60, species=('wolf', 'deer'))
+    assert (mixed['species_a'] != mixed['species_b']).all()
+    assert len(mixed) == (pairs['species_a'] != pairs['species_b']).sum()
+    events = encounter_events(pairs)
+    assert events['n_buckets'].sum() == len(pairs)
+
+# --- Processor Daemon ---
+def test_processor_daemon_processes_each_segment_once(tmp_path):
+    from processor.daemon import ProcessorDaemon, read_processed
+    source = tmp_path / 'telemetry.csv'
+    TelemetrySimulator(species='deer', sampling_rate=1, duration=300).save_to_csv(str(source))
+    store = str(tmp_path / 'store')
+    workers = [ProcessorDaemon(store, tail=[str(source)], segment_bytes=4096) for _ in range(2)]
+    # A worker that dies after claiming: its lease expires and the segment is retried
+    crashed = ProcessorDaemon(store, tail=[str(source)], segment_bytes=4096, lease=-1)
+    lost = crashed.claim()
+    while any([w.run_once() for w in workers]):
+        pass
+    first = read_processed(store)
+    assert len(first) == 300 and first['timestamp'].is_unique and 'behavior' in first
+    # Appended lines (the last one still incomplete) are picked up without reprocessing old data
+    lines = source.read_text().splitlines(keepends=True)
+    with open(source, 'a') as f:
+        f.write(lines[1].replace(lines[1].split(',')[0], '9999999999.0', 1))
+        f.write(lines[2][:10])
+    while workers[0].run_once():
+        pass
+    assert len(read_processed(store)) == 301
+    with workers[0]._state() as state:
+        (src,) = state['sources'].values()
+    assert src['committed'] == source.stat().st_size - 10 and not src['claims'] and not src['done']
+    assert lost is not None and lost['start'] == len(lines[0])
+
+def test_processor_daemon_skips_bad_rows_and_quarantines_failed_segments(tmp_path, monkeypatch):
+    from processor.daemon import ProcessorDaemon, read_processed
+    from processor.preprocessing import preprocess
+    source = tmp_path / 'telemetry.csv'
+    TelemetrySimulator(species='deer', sampling_rate=1, duration=300).save_to_csv(str(source))
+    expected = behavior_model.classify_behaviors(preprocess(str(source)), method='rule')['behavior']
+    # Labels match the batch path whatever the segment size
+    for segment_bytes in (4096, 1 << 20):
+        store = str(tmp_path / f'store-{segment_bytes}')
+        daemon = ProcessorDaemon(store, tail=[str(source)], segment_bytes=segment_bytes)
+        while daemon.run_once():
+            pass
+        assert read_processed(store)['behavior'].tolist() == expected.tolist()
+    lines = source.read_text().splitlines(keepends=True)
+    fields = lines[5].split(',')
+    fields[lines[0].split(',').index('latitude')] = 'oops'
+    lines[5] = ','.join(fields)
+    source.write_text(''.join(lines))
+    store = str(tmp_path / 'store-bad')
+    daemon = ProcessorDaemon(store, tail=[str(source)], segment_bytes=4096)
+    calls = []
+    predict = daemon.classifier.predict
+    def flaky(df):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("classifier blew up")
+        return predict(df)
+    monkeypatch.setattr(daemon.classifier, 'predict', flaky)
+    while daemon.run_once():
+        pass
+    with daemon._state() as state:
+        (src,) = state['sources'].values()
+    assert src['committed'] == source.stat().st_size and len(src['quarantined']) == 1
+    assert 'classifier blew up' in src['quarantined'][0]['error']
+    (held,) = (tmp_path / 'store-bad' / 'quarantine').iterdir()
+    # One malformed row dropped, one segment set aside, everything else processed
+    assert len(read_processed(store)) + len(pd.read_csv(held)) == 299
+
+# --- Startup ---
+@pytest.mark.parametrize("module", ["api.main", "dashboard.app"])
+def test_import_defers_heavy_modules(module):
+    import json
+    import os
+    import subprocess
+    import sys
+    code = ("import json, sys, time; t = time.perf_counter(); import " + module + "; "
+            "print(json.dumps({'seconds': time.perf_counter() - t, "
+            "'heavy': [m for m in ('sklearn', 'scipy', 'joblib', 'plotly') if m in sys.modules]}))")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {k: v for k, v in os.environ.items() if k != "WMP_PRELOAD"}
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    assert result["heavy"] == []
+    # Generous budget: pandas/FastAPI only; sklearn alone used to add over a second
+    assert result["seconds"] < 3.0
+
+# --- Dashboard Figures ---
+def test_plot_endpoints_return_cached_figure_json_with_etag(tmp_path, monkeypatch):
+    from dashboard import app as dashboard
+    from storage.shared import SharedDataset
+    monkeypatch.setattr(dashboard, '_shared', SharedDataset(str(tmp_path / 'shm')))
+    monkeypatch.chdir(tmp_path)
+    TelemetrySimulator(species='deer', sampling_rate=1, duration=300).save_to_csv('simulated_telemetry.csv')
+    client = TestClient(dashboard.app)
+    first = client.get("/api/plot/sensors")
+    assert first.status_code == 200 and first.headers["content-type"] == "application/json"
+    trace = first.json()["data"][0]
+    assert trace["name"] == "temperature" and trace["y"]["dtype"] == "f4" and "bdata" in trace["y"]
+    etag = first.headers["etag"]
+    assert client.get("/api/plot/sensors", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/plot/sensors?granularity=60", headers={"If-None-Match": etag}).status_code == 200
+    # New data changes the version, so the old tag no longer matches
+    TelemetrySimulator(species='wolf', sampling_rate=1, duration=100).save_to_csv('simulated_telemetry.csv')
+    second = client.get("/api/plot/sensors", headers={"If-None-Match": etag})
+    assert second.status_code == 200 and second.headers["etag"] != etag
+
+# --- Rate Limiting ---
+def test_rate_limits_per_role_and_single_flight_coalescing(test_app, monkeypatch):
+    import asyncio
+    import threading
+    from api import limits
+    from api.executor import BoundedExecutor
+    now = [0.0]
+    limiter = limits.RateLimiter(limits.parse_limits("Viewer=1:2"), clock=lambda: now[0])
+    assert limiter.acquire('bob', 'Viewer') == 0 and limiter.acquire('bob', 'Viewer') == 0
+    assert limiter.acquire('bob', 'Viewer') == pytest.approx(1.0)
+    assert limiter.acquire('alice', 'Researcher') == 0  # separate bucket, larger quota
+    now[0] = 1.0
+    assert limiter.acquire('bob', 'Viewer') == 0
+    assert limits.parse_limits("off") is None
+    # Over quota the API answers 429 with Retry-After
+    monkeypatch.setattr(limits, 'rate_limiter', limits.RateLimiter(limits.parse_limits("Viewer=0.01:1")))
+    client = TestClient(test_app)
+    token = client.post("/api/token", data={"username": "bob", "password": "viewerpass"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/telemetry/live", headers=headers).status_code == 200
+    resp = client.get("/api/telemetry/live", headers=headers)
+    assert resp.status_code == 429 and int(resp.headers["retry-after"]) >= 1
+    # Concurrent identical calls run once; a different argument runs separately
+    calls = []
+    release = threading.Event()
+    def slow(x):
+        calls.append(x)
+        release.wait(5)
+        return [x]
+    async def burst():
+        flights = limits.SingleFlight()
+        executor = BoundedExecutor("test", 2, 16)
+        tasks = [asyncio.ensure_future(flights.run(executor, slow, x)) for x in (1, 1, 1, 1, 2)]
+        await asyncio.sleep(0.1)
+        release.set()
+        return await asyncio.gather(*tasks), flights.snapshot()
+    results, stats = asyncio.run(burst())
+    assert results == [[1], [1], [1], [1], [2]] and sorted(calls) == [1, 2]
+    assert stats == {'in_flight': 0, 'started': 2, 'coalesced': 3}
+
+# --- Load Testing ---
+def test_load_harness_reports_latency_percentiles(test_app, tmp_path, monkeypatch):
+    import asyncio
+    import httpx
+    from api import routes
+    from loadtest.harness import format_report, parse_mix, prepare_workdir, run_load
+    from storage.shared import SharedDataset
+    monkeypatch.setattr(routes, '_shared_data', SharedDataset(str(tmp_path / 'shm')))
+    monkeypatch.chdir(tmp_path)
+    time_range = prepare_workdir(str(tmp_path), animals=2, duration=120)
+    report = asyncio.run(run_load('http://test', viewers=4, collars=1, duration=0.5, ramp=0, think=0.01,
+                                  mix=parse_mix('live=50,history=50'), collar_interval=0.1, time_range=time_range,
+                                  transport=httpx.ASGITransport(app=test_app)))
+    endpoints = report['endpoints']
+    assert set(endpoints) == {'token', 'live', 'history', 'classify'}
+    assert endpoints['token']['requests'] == 5 and endpoints['token']['errors'] == 0
+    live = endpoints['live']
+    assert live['errors'] == 0 and live['p50_ms'] <= live['p95_ms'] <= live['p99_ms'] <= live['max_ms']
+    assert sum(live['histogram_ms'].values()) == live['requests']
+    assert 'p99 ms' in format_report(report)
+    with pytest.raises(ValueError):
+        parse_mix('live=1,bogus=2')
+
+def test_heatmap_tiles_update_incrementally_and_bound_views(tmp_path, monkeypatch):
+    import numpy as np
+    from dashboard import app as dashboard
+    from dashboard.tiles import TileStore, mercator_cells
+    from storage.shared import SharedDataset
+    rng = np.random.default_rng(0)
+    n = 20_000
+    df = pd.DataFrame({'latitude': 45 + rng.normal(0, 0.02, n), 'longitude': -75 + rng.normal(0, 0.02, n),
+                       'behavior': rng.choice(['resting', 'walking', 'running'], n)})
+    incremental = TileStore(str(tmp_path / 'a'), max_zoom=12)
+    incremental.sync(df.iloc[:15_000], {'path': 'x'})
+    assert incremental.sync(df, {'path': 'x'}) == 5_000
+    full = TileStore(str(tmp_path / 'b'), max_zoom=12)
+    full.sync(df, {'path': 'x'})
+    cx, cy = mercator_cells(df['latitude'], df['longitude'], 8)
+    tx, ty = int(np.bincount(cx >> 7).argmax()), int(np.bincount(cy >> 7).argmax())
+    mine = (cx >> 7 == tx) & (cy >> 7 == ty)
+    expected = np.histogram2d(cy[mine] & 127, cx[mine] & 127, bins=128, range=[[0, 128], [0, 128]])[0]
+    assert (incremental.read(8, tx, ty)['counts'] == expected).all()
+    assert (incremental.read(8, tx, ty)['behavior'] == full.read(8, tx, ty)['behavior']).all()
+    # New data piled on one far tile raises the zoom's peak; untouched tiles re-render on the new scale
+    before = incremental.render(8, tx, ty)
+    hotspot = pd.DataFrame({'latitude': [10.0] * 50_000, 'longitude': [10.0] * 50_000, 'behavior': 'resting'})
+    incremental.sync(pd.concat([df, hotspot], ignore_index=True), {'path': 'x'})
+    after = incremental.render(8, tx, ty)
+    assert after != before and after == incremental.render(8, tx, ty)
+    # The endpoint drops the zoom until the viewport fits in MAX_TILES_PER_VIEW tiles
+    monkeypatch.setattr(dashboard, '_shared', SharedDataset(str(tmp_path / 'shm')))
+    monkeypatch.setattr(dashboard, '_tiles', TileStore(str(tmp_path / 'tiles')))
+    monkeypatch.chdir(tmp_path)
+    TelemetrySimulator(species='deer', sampling_rate=1, duration=600).save_to_csv('simulated_telemetry.csv')
+    client = TestClient(dashboard.app)
+    view = client.get("/api/tiles/view", params={'west': -76, 'south': 44, 'east': -74, 'north': 46, 'zoom': 14}).json()
+    assert 0 < len(view['tiles']) <= view['max_tiles'] and view['zoom'] < 14
+    tile = client.get(view['tiles'][0]['url'])
+    assert tile.status_code == 200 and tile.content.startswith(b'\x89PNG')
+    assert client.get(view['tiles'][0]['url'], headers={'If-None-Match': tile.headers['etag']}).status_code == 304
@@ -0,0 +1,172 @@
+import os
+import numpy as np
+import pandas as pd
+from simulator.generator import TelemetrySimulator
+from storage import archive as archive_mod
+from storage.archive import TelemetryArchive
+
+# --- Binary Telemetry Archive ---
+def test_archive_append_and_time_range_query(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_mod, 'INDEX_STRIDE', 16)
+    archive = TelemetryArchive(str(tmp_path / 'archive'), partition_rows=250)
+    deer = TelemetrySimulator(species='deer', sampling_rate=1, duration=400).generate_batch()
+    wolf = TelemetrySimulator(species='wolf', sampling_rate=1, duration=100).generate_batch()
+    archive.append(deer)
+    archive.append(wolf.to_frame())
+    assert len(archive) == 500
+    assert len(archive.partitions()) >= 2
+    ts = deer.columns['timestamp']
+    start, end = ts[100], ts[300]
+    df = archive.query(start, end)
+    assert len(df) == 201 + np.count_nonzero((wolf.columns['timestamp'] >= start) & (wolf.columns['timestamp'] <= end))
+    assert df['timestamp'].is_monotonic_increasing
+    assert set(df['species']) <= {'deer', 'wolf'}
+    # Single-partition hits come back as memory-mapped views
+    parts = archive.query_columns(ts[200], ts[210])
+    assert len(parts) == 1 and isinstance(parts[0]['latitude'], np.memmap)
+    np.testing.assert_array_equal(np.asarray(parts[0]['latitude']), deer.columns['latitude'][200:211])
+
+def test_archive_keeps_missing_categoricals_missing(tmp_path):
+    archive = TelemetryArchive(str(tmp_path / 'archive'))
+    df = TelemetrySimulator(species='deer', sampling_rate=1, duration=10).generate_batch().to_frame()
+    df['animal_id'] = df['animal_id'].astype(object)
+    df.loc[3, 'animal_id'] = None
+    archive.append(TelemetrySimulator(species='wolf', sampling_rate=1, duration=5).generate_batch())
+    archive.append(df)
+    back = archive.query()
+    deer = back[back['species'] == 'deer'].reset_index(drop=True)
+    assert deer['animal_id'].isna().tolist() == [i == 3 for i in range(10)]
+    assert set(back['animal_id'].dropna()) == {'deer-1', 'wolf-1'}
+
+# --- Time-Bucket Rollups ---
+def test_rollups_incremental_updates_match_single_pass(tmp_path):
+    from storage.rollups import RollupStore, choose_resolution
+    df = TelemetrySimulator(species='deer', sampling_rate=1, duration=7200).generate_batch().to_frame()
+    df['behavior'] = np.where(np.arange(len(df)) % 3 == 0, 'resting', 'walking')
+    whole = RollupStore(None)
+    whole.update(df)
+    incremental = RollupStore(str(tmp_path / 'rollups'))
+    for chunk in np.array_split(np.arange(len(df)), 5):
+        incremental.update(df.iloc[chunk])
+    reloaded = RollupStore(str(tmp_path / 'rollups'))
+    for res in (60, 3600):
+        a, b = whole.tables[res], reloaded.tables[res]
+        pd.testing.assert_frame_equal(a[sorted(a.columns)], b[sorted(b.columns)], check_dtype=False)
+    hourly = reloaded.query(resolution=3600)
+    assert hourly['count'].sum() == len(df)
+    assert np.isclose(hourly['duration'].sum(), df['timestamp'].iloc[-1] - df['timestamp'].iloc[0])
+    assert np.isclose(hourly[['budget_resting', 'budget_walking']].sum().sum(), hourly['duration'].sum())
+    assert (hourly['speed_min'] <= hourly['speed_mean']).all() and (hourly['speed_mean'] <= hourly['speed_max']).all()
+    # A month-long view resolves to hourly buckets, an explicit 5 minute granularity to minutes
+    assert choose_resolution(0, 30 * 86400) == 3600
+    assert choose_resolution(0, 30 * 86400, granularity=300) == 60
+
+# --- Shared-Memory Dataset ---
+def test_shared_dataset_publishes_once_and_attaches_zero_copy(tmp_path):
+    import os
+    import subprocess
+    import sys
+    import time
+    from processor.preprocessing import ingest_data
+    from storage.shared import SharedDataset
+    csv = tmp_path / 'telemetry.csv'
+    TelemetrySimulator(species='deer', sampling_rate=1, duration=300).save_to_csv(str(csv))
+    root = str(tmp_path / 'shm')
+    calls = []
+    df = SharedDataset(root).load(str(csv), lambda path: calls.append(path) or ingest_data(path))
+    pd.testing.assert_frame_equal(df, ingest_data(str(csv)))
+    assert not df['latitude'].to_numpy().flags.writeable
+    # Another worker process maps the published buffers without loading the CSV
+    code = ("import sys; from storage.shared import SharedDataset\n"
+            "df = SharedDataset(sys.argv[1]).load(sys.argv[2], lambda path: sys.exit('reloaded'))\n"
+            "print(len(df), df['animal_id'].iloc[0])")
+    out = subprocess.run([sys.executable, '-c', code, root, str(csv)], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.split() == ['300', str(df['animal_id'].iloc[0])]
+    # A changed file is published as a new version; the old views stay readable
+    old = df
+    time.sleep(0.01)
+    TelemetrySimulator(species='wolf', sampling_rate=1, duration=50).save_to_csv(str(csv))
+    new = SharedDataset(root).load(str(csv), lambda path: calls.append(path) or ingest_data(path))
+    assert len(calls) == 2 and len(new) == 50 and len(old) == 300
+    assert old['timestamp'].notna().all()
+
+# --- Storage Maintenance ---
+def test_maintenance_compacts_and_applies_species_retention(tmp_path):
+    from storage.maintenance import DAY, StorageMaintenance, parse_policy
+    from storage.rollups import RollupStore
+    archive = TelemetryArchive(str(tmp_path / 'archive'), partition_rows=1000)
+    rollups = RollupStore(str(tmp_path / 'rollups'), resolutions=[60])
+    # Animals appended one after another overlap in time, so each batch opens a small partition
+    for i, species in enumerate(['deer', 'wolf', 'deer', 'wolf']):
+        df = TelemetrySimulator(species=species, sampling_rate=1, duration=200, animal_id=f'{species}-{i}').generate_batch().to_frame()
+        df['timestamp'] = 1000.0 + np.arange(200) * 60.0
+        rollups.update(df)
+        archive.append(df, rolled_up=True)
+    assert len(archive.partitions()) == 4
+    before = archive.query().sort_values(['timestamp', 'animal_id'], ignore_index=True)
+    now = 1000.0 + 100 * 60.0 + 2 * DAY
+    maintenance = StorageMaintenance(str(tmp_path / 'archive'), str(tmp_path / 'rollups'), min_rows=500,
+                                     max_rows_per_second=0, now=lambda: now)
+    stats = maintenance.run_once()
+    assert stats['compacted_partitions'] == 4 and len(archive.partitions()) == 1
+    after = archive.query().sort_values(['timestamp', 'animal_id'], ignore_index=True)
+    pd.testing.assert_frame_equal(after, before)
+    # Deer raw data older than 2 days goes (rollups keep it); deer rollups past 2.5 days go too
+    maintenance.raw_days = parse_policy('deer=2')
+    maintenance.retention_days = parse_policy('deer=2.0005,*=3650')
+    stats = maintenance.run_once()
+    df = archive.query()
+    deer = df[df['species'] == 'deer']
+    assert stats['expired_rows'] == 200 and deer['timestamp'].min() == 1000.0 + 100 * 60.0
+    assert (df['species'] == 'wolf').sum() == 400
+    table = RollupStore(str(tmp_path / 'rollups'), resolutions=[60]).tables[60].reset_index()
+    old_deer = table[table['animal_id'].str.startswith('deer') & (table['bucket'] + 60 <= now - 2.0005 * DAY)]
+    assert old_deer.empty and stats['rollup_rows_removed'] > 0
+    assert list(table[table['animal_id'].str.startswith('wolf')].groupby('animal_id').size()) == [200, 200]
+    assert not [d for d in os.listdir(tmp_path / 'archive') if d.startswith(('.staging-', '.trash-'))]
+
+def test_maintenance_folds_rows_written_without_rollups_before_expiry(tmp_path):
+    from storage.maintenance import DAY, StorageMaintenance, parse_policy
+    from storage.rollups import RollupStore
+    archive = TelemetryArchive(str(tmp_path / 'archive'))
+    rollups = RollupStore(str(tmp_path / 'rollups'), resolutions=[60])
+    ingested = TelemetrySimulator(species='deer', duration=100, animal_id='deer-1', start_time=1000.0).generate_batch().to_frame()
+    rollups.update(ingested)
+    archive.append(ingested, rolled_up=True)
+    # Written straight to the archive, like TelemetrySimulator.save_to_archive
+    archive.append(TelemetrySimulator(species='deer', duration=100, animal_id='deer-2', start_time=1000.0).generate_batch())
+    assert len(archive.partitions()) == 2
+    now = 1000.0 + 2 * DAY
+    maintenance = StorageMaintenance(str(tmp_path / 'archive'), str(tmp_path / 'rollups'), raw_days=parse_policy('*=1'),
+                                     max_rows_per_second=0, now=lambda: now)
+    stats = maintenance.run_once()
+    assert stats['expired_rows'] == 200 and len(archive) == 0
+    table = RollupStore(str(tmp_path / 'rollups'), resolutions=[60]).tables[60]
+    # Each animal is counted once: deer-2 folded at expiry, deer-1 not folded a second time
+    assert table.groupby(level='animal_id')['count'].sum().to_dict() == {'deer-1': 100, 'deer-2': 100}
+
+# --- Telemetry Codec ---
+def test_codec_round_trip_within_quantization(tmp_path):
+    from storage import codec
+    values = np.array([0, 1, -1, 63, -64, 2**40, -2**63, 2**63 - 1], dtype=np.int64)
+    packed = codec.varint_encode(codec.zigzag(values))
+    assert (codec.unzigzag(codec.varint_decode(packed, len(values))) == values).all()
+    df = TelemetrySimulator(species='wolf', sampling_rate=1, duration=2000).generate_batch().to_frame()
+    df.loc[[0, 7], 'temperature'] = np.nan
+    blob = codec.encode_frame(df)
+    assert len(df.to_csv(index=False)) > 5 * len(blob)
+    back = codec.decode_frame(blob)
+    assert list(back.columns) == list(df.columns) and (back['animal_id'] == df['animal_id']).all()
+    for col, (scale, _) in codec.COLUMN_CODECS.items():
+        err = np.abs(back[col].to_numpy(np.float64) - df[col].to_numpy(np.float64))
+        assert np.nanmax(err) <= 0.5 / scale + 1e-6 * np.abs(df[col]).max()
+    assert back['temperature'].isna().sum() == 2
+    # Collar packets append straight to the archive, and exports decode to the same rows
+    archive = TelemetryArchive(str(tmp_path / 'archive'))
+    for packet in TelemetrySimulator(species='deer', sampling_rate=1, duration=300).encoded_packets(batch_seconds=120):
+        archive.append(packet)
+    assert len(archive) == 300
+    exported = codec.decode_frame(archive.export())
+    pd.testing.assert_frame_equal(exported, codec.decode_frame(codec.encode_frame(archive.query())))